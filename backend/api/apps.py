@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from django.core import checks
+        from . import report_cache, signals  # noqa: F401
+        checks.register(report_cache.check_shared_backend, checks.Tags.caches, deploy=True)
@@ -0,0 +1,128 @@
+"""Archive of historical time entries.
+
+``manage.py archive_entries`` moves finished entries that start before the
+archive horizon (``ARCHIVE['HORIZON_DAYS']`` ago by default) from TimeEntry
+to ArchivedTimeEntry. Ids, tags and timestamps are kept, so the hot table
+and its indexes only hold recent history. The archive has a single
+``(user, start_time)`` index.
+
+The rollups of archived entries are frozen: the move leaves DailyRollup,
+tag usage counts, the search index and sync tombstones as they are, so
+reports read from the rollup see no change. ``rollups.rebuild`` and
+``tag_usage.reconcile`` count both tables.
+
+Each user's ``Settings.archived_before`` records how far their archive
+reaches. It is part of the cached Settings payload, so a view can tell
+without a query whether a range reaches into the archive. Only then do
+``entry_models`` include ArchivedTimeEntry.
+
+The entry list and single-entry endpoints include archived entries. To
+update or delete one, the endpoint first moves it back to the hot table
+with ``restore``. Sync snapshots include the archive (see ``api.sync``).
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import profile_cache, signals
+from .models import ArchivedTimeEntry, Settings, TimeEntry
+
+DEFAULTS = {
+    'HORIZON_DAYS': 730,
+    'BATCH_SIZE': 2000,
+}
+FIELDS = ('id', 'user_id', 'description', 'project_id', 'client_id', 'start_time', 'end_time', 'duration',
+          'created_at', 'updated_at')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ARCHIVE', {})}
+
+
+def horizon(now=None, days=None):
+    """The default cutoff: entries starting before it are archived."""
+    if days is None:
+        days = get_config()['HORIZON_DAYS']
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def _parse(payload):
+    value = payload.get('archived_before')
+    return parse_datetime(value) if isinstance(value, str) else value
+
+
+def archived_before(user_id, request=None):
+    return _parse(profile_cache.get_settings(user_id, request))
+
+
+async def aarchived_before(user_id, request=None):
+    return _parse(await profile_cache.aget_settings(user_id, request))
+
+
+def reaches(boundary, start=None):
+    """Whether a range starting at ``start`` (None: unbounded) reaches the archive."""
+    return boundary is not None and (start is None or start < boundary)
+
+
+def entry_models(boundary, start=None):
+    """The entry models to read for a range starting at ``start``."""
+    return (TimeEntry, ArchivedTimeEntry) if reaches(boundary, start) else (TimeEntry,)
+
+
+def archive(before=None, users=None, batch_size=None):
+    """Move finished entries starting before ``before`` to the archive. Returns how many moved.
+
+    Each batch moves in its own transaction, so a large first run can be
+    stopped and resumed. Running timers stay where they are.
+    """
+    before = before or horizon()
+    batch_size = batch_size or get_config()['BATCH_SIZE']
+    entries = TimeEntry.objects.filter(start_time__lt=before, end_time__isnull=False)
+    if users is not None:
+        entries = entries.filter(user__in=users)
+    through = TimeEntry.tags.through
+    archived_through = ArchivedTimeEntry.tags.through
+    moved, archived_users = 0, set()
+    while True:
+        with transaction.atomic(), signals.suspended():
+            batch = list(entries.order_by('id').select_for_update().values(*FIELDS)[:batch_size])
+            if not batch:
+                break
+            ids = [row['id'] for row in batch]
+            ArchivedTimeEntry.objects.bulk_create([ArchivedTimeEntry(**row) for row in batch])
+            archived_through.objects.bulk_create([
+                archived_through(archivedtimeentry_id=entry_id, tag_id=tag_id)
+                for entry_id, tag_id in through.objects.filter(timeentry_id__in=ids).values_list('timeentry_id', 'tag_id')
+            ])
+            TimeEntry.objects.filter(pk__in=ids).delete()
+        moved += len(batch)
+        archived_users.update(row['user_id'] for row in batch)
+    if archived_users:
+        Settings.objects.filter(user__in=archived_users).filter(
+            Q(archived_before__isnull=True) | Q(archived_before__lt=before)
+        ).update(archived_before=before)
+        for user_id in archived_users:
+            profile_cache.forget_settings(user_id)
+    return moved
+
+
+def restore(user, pk):
+    """Move an archived entry back to TimeEntry, so it can be edited. Returns it, or None if there is none.
+
+    The derived data already counts the entry, so nothing else changes.
+    """
+    through = TimeEntry.tags.through
+    archived_through = ArchivedTimeEntry.tags.through
+    with transaction.atomic(), signals.suspended():
+        row = ArchivedTimeEntry.objects.select_for_update().filter(user=user, pk=pk).values(*FIELDS).first()
+        if row is None:
+            return None
+        tag_ids = list(archived_through.objects.filter(archivedtimeentry_id=pk).values_list('tag_id', flat=True))
+        TimeEntry.objects.bulk_create([TimeEntry(**row)])
+        # bulk_create stamps auto_now fields
+        TimeEntry.objects.filter(pk=pk).update(created_at=row['created_at'], updated_at=row['updated_at'])
+        through.objects.bulk_create([through(timeentry_id=pk, tag_id=tag_id) for tag_id in tag_ids])
+        ArchivedTimeEntry.objects.filter(pk=pk).delete()
+    return TimeEntry.objects.get(pk=pk)
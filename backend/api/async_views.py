@@ -0,0 +1,101 @@
+"""Async request handling for the read-heavy endpoints.
+
+DRF 3.14 only dispatches synchronously. ``AsyncAPIView`` runs DRF's request
+setup (authentication, permissions, throttling) in a worker thread and
+awaits ``async def`` handlers, which query with Django's async ORM. Under
+ASGI a request waiting on the database then holds no worker thread while
+it waits. Under WSGI the same views still work: Django runs each one to
+completion in its own event loop.
+
+``AsyncListMixin`` gives a ViewSet an async ``list`` action. Every other
+action of the ViewSet runs as an ordinary sync view, in a thread. With a
+``values_serializer_class`` (see ``api.fast_serializers``) the list is
+read with ``.values_list()`` and serialized without DRF's field machinery.
+"""
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+async def alist(queryset):
+    """Evaluate ``queryset`` (prefetches included) without blocking the event loop."""
+    return [row async for row in queryset]
+
+
+async def adispatch(view, request, handler, args, kwargs):
+    # APIView.dispatch, with the handler awaited and the sync setup in a thread
+    view.args = args
+    view.kwargs = kwargs
+    request = view.initialize_request(request, *args, **kwargs)
+    view.request = request
+    view.headers = view.default_response_headers
+    try:
+        await sync_to_async(view.initial)(request, *args, **kwargs)
+        method = request.method.lower()
+        if method in view.http_method_names:
+            handler = handler or getattr(view, method, view.http_method_not_allowed)
+        else:
+            handler = view.http_method_not_allowed
+        response = handler(request, *args, **kwargs)
+        if hasattr(response, '__await__'):
+            response = await response
+    except Exception as exc:
+        response = view.handle_exception(exc)
+    view.response = view.finalize_response(request, response, *args, **kwargs)
+    return view.response
+
+
+class AsyncAPIView(APIView):
+    """An APIView whose handlers are ``async def``."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # csrf_exempt hides the coroutine marker Django put on the view
+        return markcoroutinefunction(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        return await adispatch(self, request, None, args, kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+
+class AsyncListMixin:
+    """Serve a ViewSet's ``list`` action with ``alist``; other actions stay sync."""
+    values_serializer_class = None
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        return markcoroutinefunction(super().as_view(actions, **initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        # self.action is only set once DRF initializes the request
+        if self.action_map.get(request.method.lower()) != 'list':
+            return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+        return await adispatch(self, request, self.alist, args, kwargs)
+
+    def get_values_serializer(self):
+        if self.values_serializer_class is None:
+            return None
+        return self.values_serializer_class(context=self.get_serializer_context())
+
+    async def aserialize(self, rows, values_serializer):
+        if values_serializer is None:
+            return self.get_serializer(rows, many=True).data
+        return await values_serializer.aserialize(rows)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        values_serializer = self.get_values_serializer()
+        if values_serializer is not None:
+            queryset = values_serializer.queryset(queryset)
+        paginator = self.paginator
+        if paginator is None:
+            page = None
+        elif hasattr(paginator, 'apaginate_queryset'):
+            page = await paginator.apaginate_queryset(queryset, request, view=self)
+        else:
+            page = await sync_to_async(paginator.paginate_queryset)(queryset, request, view=self)
+        if page is not None:
+            return self.get_paginated_response(await self.aserialize(page, values_serializer))
+        return Response(await self.aserialize(await alist(queryset), values_serializer))
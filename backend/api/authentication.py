@@ -1,9 +1,13 @@
+import logging
 import os
 import firebase_admin
-from firebase_admin import auth, credentials
+from firebase_admin import credentials
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import authentication, exceptions
+from . import events, firebase_tokens
+
+logger = logging.getLogger(__name__)
 
 # Use absolute path for the service account key
 service_account_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../firebase-adminsdk.json'))
@@ -12,43 +16,59 @@ try:
         cred = credentials.Certificate(service_account_path)
         firebase_admin.initialize_app(cred)
 except Exception as e:
-    # Always print initialization errors
-    print("[Firebase Admin SDK Initialization Error]", e)
+    logger.error("Firebase Admin SDK initialization failed: %s", e)
 
-DEBUG = getattr(settings, 'DEBUG', False)
 User = get_user_model()
 
 class FirebaseAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.headers.get('Authorization')
-        if DEBUG:
-            print("Authorization header:", auth_header)
         if not auth_header:
-            if DEBUG:
-                print("No auth header")
             return None
         parts = auth_header.split()
         if len(parts) != 2 or parts[0].lower() != 'bearer':
-            if DEBUG:
-                print("Malformed auth header")
+            logger.debug("Malformed Authorization header")
             return None
         id_token = parts[1]
         try:
-            decoded_token = auth.verify_id_token(id_token)
-            if DEBUG:
-                print("Decoded token:", decoded_token)
-        except Exception as e:
-            print("Token verification failed:", e)
+            decoded_token = firebase_tokens.verify_id_token(id_token)
+        except firebase_tokens.TokenError as e:
+            logger.info("Firebase token verification failed: %s", e)
             raise exceptions.AuthenticationFailed('Invalid Firebase ID token')
-        uid = decoded_token['uid']
-        email = decoded_token.get('email', '')
+        user = sync_firebase_user(decoded_token['uid'], decoded_token.get('email', ''))
+        return (user, None)
+
+
+class EventStreamTokenAuthentication(authentication.BaseAuthentication):
+    """``?token=`` from ``POST /api/events/token/``, for EventSource; see api.events."""
+    def authenticate(self, request):
+        token = request.query_params.get('token')
+        if not token:
+            return None
+        try:
+            user_id = events.token_user_id(token)
+        except events.InvalidToken as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        user = User.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed('User not found.')
+        return (user, None)
+
+
+def sync_firebase_user(uid, email):
+    """Return the local user for a Firebase uid, writing only when something changed."""
+    user = User.objects.filter(username=uid).first()
+    if user is None:
         user, created = User.objects.get_or_create(username=uid, defaults={'email': email})
-        if DEBUG:
-            print("User:", user, "Created:", created)
-        if email and user.email != email:
-            user.email = email
-            user.save()
-        if not user.is_active:
-            user.is_active = True
-            user.save()
-        return (user, None) 
\ No newline at end of file
+        if created:
+            logger.info("Created user %s for a new Firebase uid", user)
+    changed = []
+    if email and user.email != email:
+        user.email = email
+        changed.append('email')
+    if not user.is_active:
+        user.is_active = True
+        changed.append('is_active')
+    if changed:
+        user.save(update_fields=changed)
+    return user
@@ -0,0 +1,331 @@
+"""Endpoint benchmarks driven through the Django test client.
+
+Each scenario is requested ``repeat`` times as one user. For every scenario
+we record p50/p95 latency, the median number of SQL queries and the peak
+Python memory allocated while serving a request (tracemalloc). Results are
+plain dicts so they can be written to, and compared against, a JSON
+baseline file.
+
+Scenarios marked ``cold`` clear the report cache before every request, so
+they time the query path rather than a cache hit.
+
+``throughput`` instead measures requests/second under concurrency, through
+either the WSGI or the ASGI handler, so the two deployments can be compared
+at the same worker count. ``connection_latency`` times the per-request
+connection cost with and without the connection pool. ``payload_sizes``
+compares the response formats of ``api.renderers``, raw and compressed.
+``serializer_throughput`` compares DRF's list serializers with
+``api.fast_serializers`` in rows/second.
+"""
+import asyncio
+import math
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import connection, connections
+from django.db.utils import load_backend
+from django.db.models import Max
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from . import compression, db_pool, fast_serializers, report_cache, search
+from .renderers import ColumnarJSONRenderer, MessagePackRenderer
+from .models import Client, Project, Tag, TimeEntry
+from .serializers import optimize_entry_queryset
+
+# Relative slack allowed before a metric counts as a regression
+DEFAULT_TOLERANCE = {'p50_ms': 0.25, 'p95_ms': 0.5, 'queries': 0.0, 'peak_kb': 0.25}
+# Absolute change below which a metric is treated as noise
+NOISE_FLOOR = {'p50_ms': 2.0, 'p95_ms': 5.0, 'queries': 0, 'peak_kb': 64.0}
+
+
+def percentile(samples, pct):
+    # Nearest-rank percentile; no interpolation
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def scenarios(user):
+    """The (name, path, params, cold) tuples to run for ``user``.
+
+    Date-based parameters and the search word follow the user's most recent
+    entry, so they hit real data whatever the dataset's age.
+    """
+    latest = TimeEntry.objects.filter(user=user).aggregate(latest=Max('start_time'))['latest']
+    if latest is None:
+        latest = user.date_joined
+    description = TimeEntry.objects.filter(user=user, start_time=latest).values_list('description', flat=True).first()
+    word = max(search.WORD.findall(description or ''), key=len, default='work')
+    month = latest.strftime('%Y-%m')
+    year_start = (latest - timedelta(days=365)).date().isoformat()
+    return [
+        ('time_entries.list', '/api/time-entries/', {}, True),
+        ('time_entries.page', '/api/time-entries/', {'page_size': 100}, True),
+        ('time_entries.page_expand', '/api/time-entries/', {'page_size': 100, 'expand': 'project,client,tags'}, True),
+        ('projects.list', '/api/projects/', {}, True),
+        ('tags.list', '/api/tags/', {}, True),
+        ('clients.list', '/api/clients/', {}, True),
+        ('reports.all', '/api/reports/', {}, True),
+        ('reports.year', '/api/reports/', {'start': year_start}, True),
+        ('reports.breakdowns', '/api/reports/', {'breakdowns': 'tag,week,hour'}, True),
+        ('reports.cached', '/api/reports/', {}, False),
+        ('calendar.month', '/api/calendar/', {'month': month}, True),
+        ('calendar.cached', '/api/calendar/', {'month': month}, False),
+        ('calendar.year_compact', '/api/calendar/', {'start': year_start, 'end': latest.date().isoformat(), 'compact': 1}, True),
+        ('sync.snapshot', '/api/sync/', {}, True),
+        ('search.word', '/api/search/', {'q': word}, True),
+        ('search.prefix', '/api/search/', {'q': word[:3], 'type': 'time_entries'}, True),
+    ]
+
+
+RENDERERS = {'json': JSONRenderer, 'columnar': ColumnarJSONRenderer, 'msgpack': MessagePackRenderer}
+PAYLOAD_SCENARIOS = ('time_entries.page', 'time_entries.page_expand', 'calendar.month', 'calendar.year_compact', 'sync.snapshot')
+
+
+def _timed(repeat, function, *args):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, round(statistics.median(samples), 3)
+
+
+def payload_sizes(user, repeat=20, only=None):
+    """Size and median render time of the larger payloads in every available format,
+    then each body's compressed size and compression time per encoding.
+
+    Returns ``{scenario: {format: {'bytes', 'render_ms', '<encoding>_bytes', '<encoding>_ms'}}}``.
+    """
+    api = APIClient()
+    api.force_authenticate(user)
+    config = compression.get_config()
+    results = {}
+    for name, path, params, _cold in scenarios(user):
+        if name not in PAYLOAD_SCENARIOS or (only and not any(name.startswith(prefix) for prefix in only)):
+            continue
+        payload = api.get(path, params).data
+        results[name] = {}
+        for renderer_name, renderer_class in RENDERERS.items():
+            if not getattr(renderer_class, 'available', True):
+                continue
+            body, render_ms = _timed(repeat, renderer_class().render, payload)
+            row = {'bytes': len(body), 'render_ms': render_ms}
+            for encoding, stream_class in compression.codecs():
+                compressed, compress_ms = _timed(repeat, compression.compress, stream_class, body, config)
+                row[f'{encoding}_bytes'] = len(compressed)
+                row[f'{encoding}_ms'] = compress_ms
+            results[name][renderer_name] = row
+    return results
+
+
+# name: (model, values serializer class, serializer context)
+SERIALIZER_SCENARIOS = {
+    'time_entries': (TimeEntry, fast_serializers.TimeEntryValuesSerializer, {}),
+    'time_entries.expand': (TimeEntry, fast_serializers.TimeEntryValuesSerializer, {'expand': ('project', 'client', 'tags')}),
+    'projects': (Project, fast_serializers.ProjectValuesSerializer, {}),
+    'clients': (Client, fast_serializers.ClientValuesSerializer, {}),
+    'tags': (Tag, fast_serializers.TagValuesSerializer, {}),
+}
+
+
+def serializer_throughput(user, repeat=5, limit=None, only=None):
+    """Rows/second listing each model with its DRF serializer and with its values serializer,
+    query included. Returns ``{scenario: {'rows', 'drf', 'values'}}``.
+    """
+    results = {}
+    for name, (model, values_class, context) in SERIALIZER_SCENARIOS.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        queryset = model.objects.filter(user=user).order_by('id')
+        if model is TimeEntry:
+            queryset = optimize_entry_queryset(queryset, context.get('expand', ()))
+        if limit:
+            queryset = queryset[:limit]
+        serializer_class = values_class.serializer_class
+
+        def drf():
+            return serializer_class(list(queryset), many=True, context=context).data
+
+        def values():
+            values_serializer = values_class(context)
+            return values_serializer.serialize(list(values_serializer.queryset(queryset)))
+
+        rows, drf_ms = _timed(repeat, drf)
+        _rows, values_ms = _timed(repeat, values)
+        results[name] = {
+            'rows': len(rows),
+            'drf': round(len(rows) / drf_ms * 1000) if drf_ms else 0,
+            'values': round(len(rows) / values_ms * 1000) if values_ms else 0,
+        }
+    return results
+
+
+def _get(api, path, params, cache, cold):
+    if cold:
+        cache.clear()
+    response = api.get(path, params)
+    if response.streaming:
+        for _chunk in response.streaming_content:
+            pass
+    if response.status_code >= 400:
+        raise RuntimeError(f'GET {path} {params} returned {response.status_code}')
+
+
+def measure(api, path, params, repeat, cold):
+    latencies, queries = [], []
+    cache = report_cache.get_cache()
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            _get(api, path, params, cache, cold)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+    # tracemalloc slows allocation-heavy code a lot, so memory gets its own request
+    tracemalloc.start()
+    try:
+        _get(api, path, params, cache, cold)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'queries': int(statistics.median(queries)),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(user, repeat=20, only=None):
+    """Benchmark every scenario as ``user``. Returns ``{name: metrics}``."""
+    api = APIClient()
+    api.force_authenticate(user)
+    results = {}
+    cache = report_cache.get_cache()
+    for name, path, params, cold in scenarios(user):
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        # One warm-up request keeps import and connection costs out of the samples
+        _get(api, path, params, cache, cold)
+        results[name] = measure(api, path, params, repeat, cold)
+    return results
+
+
+def compare(baseline, current, tolerance=None):
+    """Return human-readable regressions of ``current`` against ``baseline``.
+
+    A metric regresses when it exceeds the baseline by more than its relative
+    tolerance and by more than its noise floor. Scenarios missing from either side are ignored.
+    """
+    tolerance = {**DEFAULT_TOLERANCE, **(tolerance or {})}
+    regressions = []
+    for name, metrics in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric, slack in tolerance.items():
+            if metric not in metrics or metric not in before:
+                continue
+            grew = metrics[metric] - before[metric]
+            if grew > before[metric] * slack and grew > NOISE_FLOOR.get(metric, 0):
+                regressions.append(f'{name} {metric}: {before[metric]} -> {metrics[metric]}')
+    return regressions
+
+
+def throughput(mode, path, params, headers, concurrency=8, requests=200, cold=False):
+    """Requests/second for ``requests`` GETs of ``path`` with ``concurrency`` in flight.
+
+    ``mode='wsgi'`` runs ``concurrency`` threads, each with its own client and
+    database connection, like a threaded WSGI worker. ``mode='asgi'`` runs
+    the same number of concurrent requests on one event loop. Requests must
+    authenticate through ``headers``, and the data must be committed, since
+    each thread uses its own connection.
+    """
+    cache = report_cache.get_cache()
+
+    def check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f'GET {path} {params} returned {response.status_code}')
+
+    def wsgi_worker(count):
+        client = Client()
+        try:
+            for _ in range(count):
+                if cold:
+                    cache.clear()
+                check(client.get(path, params, headers=headers))
+        finally:
+            connections.close_all()
+
+    async def asgi_run():
+        client = AsyncClient()
+        remaining = iter(range(requests))
+
+        async def worker():
+            for _ in remaining:
+                if cold:
+                    cache.clear()
+                check(await client.get(path, params, headers=headers))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    shares = [requests // concurrency + (n < requests % concurrency) for n in range(concurrency)]
+    started = time.perf_counter()
+    if mode == 'wsgi':
+        with ThreadPoolExecutor(concurrency) as pool:
+            for future in [pool.submit(wsgi_worker, share) for share in shares]:
+                future.result()
+    elif mode == 'asgi':
+        asyncio.run(asgi_run())
+    else:
+        raise ValueError(f'Unknown mode {mode!r}')
+    return requests / (time.perf_counter() - started)
+
+
+POOLED_ENGINES = {'postgresql': 'api.db_backends.postgresql', 'sqlite': 'api.db_backends.sqlite3'}
+DIRECT_ENGINES = {'postgresql': 'django.db.backends.postgresql', 'sqlite': 'django.db.backends.sqlite3'}
+
+
+def connection_latency(settings_dict, pooled, requests=200, concurrency=4, query='SELECT 1'):
+    """Latency of a request that connects, runs ``query`` and closes, as with ``CONN_MAX_AGE = 0``.
+
+    ``pooled`` swaps the database's engine for its ``api.db_backends``
+    counterpart, so "connect" and "close" go through the pool. Each of the
+    ``concurrency`` threads has its own connection wrapper, like a worker
+    thread. Returns p50/p95 in milliseconds and requests/second.
+    """
+    vendor = load_backend(settings_dict['ENGINE']).DatabaseWrapper.vendor
+    engine = (POOLED_ENGINES if pooled else DIRECT_ENGINES)[vendor]
+    settings_dict = {**settings_dict, 'ENGINE': engine, 'CONN_MAX_AGE': 0}
+    wrapper_class = load_backend(engine).DatabaseWrapper
+    alias = f'bench-{"pooled" if pooled else "direct"}'
+
+    def worker(count):
+        wrapper = wrapper_class(settings_dict, alias)
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            with wrapper.cursor() as cursor:
+                cursor.execute(query)
+                cursor.fetchall()
+            wrapper.close()
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
+
+    shares = [requests // concurrency + (n < requests % concurrency) for n in range(concurrency)]
+    latencies = []
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(concurrency) as pool:
+            for future in [pool.submit(worker, share) for share in shares]:
+                latencies.extend(future.result())
+    finally:
+        db_pool.close_pool(alias)
+    return {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'per_second': round(requests / (time.perf_counter() - started), 1),
+    }
@@ -0,0 +1,160 @@
+"""Local-time buckets for reports and calendars.
+
+Days, weeks (starting Monday) and months are the user's, in their
+``Settings.timezone``. ``split`` divides an entry's duration over the
+local days it touches in proportion to the time spent in each, with
+arithmetic done in UTC so DST days are 23 or 25 hours long. ``daily``,
+``weekly`` and ``monthly`` turn per-day totals into gap-free series of
+at most ``MAX_DAYS`` days.
+"""
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.utils.dateparse import parse_date, parse_datetime
+from . import profile_cache
+
+UTC = ZoneInfo('UTC')
+# The longest series filled in with zero days, and the longest bounded report
+MAX_DAYS = 3660
+
+
+class InvalidBound(Exception):
+    pass
+
+
+def get_timezone(name):
+    try:
+        return ZoneInfo(name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        return UTC
+
+
+# Settings are cached next to the report cache stamps, so a cached report
+# or a 304 still needs no query
+def user_timezone(user_id, request=None):
+    return get_timezone(profile_cache.get_settings(user_id, request)['timezone'])
+
+
+async def auser_timezone(user_id, request=None):
+    return get_timezone((await profile_cache.aget_settings(user_id, request))['timezone'])
+
+
+def local_midnight(day, tz):
+    return datetime.combine(day, time.min, tz)
+
+
+def local_date(moment, tz):
+    return moment.astimezone(tz).date()
+
+
+def parse_bound(value, tz):
+    """Parse a report bound. Dates mean local midnight; naive datetimes are local."""
+    try:
+        bound = _parse_bound(value, tz)
+        if bound is not None:
+            # Reports step a day past their bounds and compare them in UTC
+            (bound - timedelta(days=1)).astimezone(dt_timezone.utc)
+            (bound + timedelta(days=1)).astimezone(dt_timezone.utc)
+    except ValueError:
+        raise InvalidBound(f'Invalid date or datetime: {value}')
+    except OverflowError:
+        raise InvalidBound(f'Date out of range: {value}')
+    return bound
+
+
+def check_range(start, end):
+    """Raise InvalidBound if parsed bounds ``start`` and ``end`` are more than ``MAX_DAYS`` apart."""
+    if start is not None and end is not None and end - start > timedelta(days=MAX_DAYS):
+        raise InvalidBound(f'At most {MAX_DAYS} days per report')
+
+
+def _parse_bound(value, tz):
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        return local_midnight(value, tz)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            try:
+                day = parse_date(value)
+            except ValueError:
+                day = None
+            if day is None:
+                raise InvalidBound(f'Invalid date or datetime: {value}')
+            return local_midnight(day, tz)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=tz)
+    return parsed
+
+
+def split(start, end, duration, tz):
+    """Divide ``duration`` seconds over the local days of ``[start, end)``.
+
+    Returns ``[(date, seconds)]`` with integer seconds that sum to
+    ``duration``; days that get no time are left out.
+    """
+    start, end = start.astimezone(dt_timezone.utc), end.astimezone(dt_timezone.utc)
+    day = local_date(start, tz)
+    length = (end - start).total_seconds()
+    if length <= 0:
+        return [(day, duration)] if duration else []
+    portions, cursor, allocated = [], start, 0
+    while cursor < end:
+        boundary = min(local_midnight(day + timedelta(days=1), tz).astimezone(dt_timezone.utc), end)
+        # Rounding the running total keeps the sum exact
+        share = round(duration * (boundary - start).total_seconds() / length) - allocated
+        if share:
+            portions.append((day, share))
+        allocated += share
+        cursor, day = boundary, day + timedelta(days=1)
+    return portions
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def daily(totals, first=None, last=None):
+    """``[{'date', 'total'}]`` for every day from ``first`` to ``last`` (default: the data's span).
+
+    A span longer than ``MAX_DAYS`` lists only the days with time.
+    """
+    if first is None or last is None:
+        if not totals:
+            return []
+        first = min(totals) if first is None else first
+        last = max(totals) if last is None else last
+    if (last - first).days >= MAX_DAYS:
+        return [{'date': day, 'total': totals[day]} for day in sorted(totals) if first <= day <= last]
+    days = []
+    day = first
+    while day <= last:
+        days.append({'date': day, 'total': totals.get(day, 0)})
+        day += timedelta(days=1)
+    return days
+
+
+def _group(days, field, start_of):
+    groups = []
+    for row in days:
+        start = start_of(row['date'])
+        if groups and groups[-1][field] == start:
+            groups[-1]['total'] += row['total']
+        else:
+            groups.append({field: start, 'total': row['total']})
+    return groups
+
+
+def weekly(days):
+    """Fold a gap-free ``daily`` series into weeks starting Monday."""
+    return _group(days, 'week', week_start)
+
+
+def monthly(days):
+    return _group(days, 'month', month_start)
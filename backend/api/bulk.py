@@ -0,0 +1,184 @@
+import copy
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from . import events, report_cache, search, signals, sync
+
+
+class BulkModelMixin:
+    """Adds ``/bulk/`` to a user-scoped ModelViewSet.
+
+    POST takes a list of objects to create, PATCH a list of partial updates
+    that each carry an ``id``, and DELETE ``{"ids": [...]}``. Each request runs
+    in one transaction with ``bulk_create``/``bulk_update``, including the
+    many-to-many through rows. If any item fails validation nothing is
+    written, and ``errors`` lists one entry per item in request order.
+    """
+    bulk_max_items = 1000
+    bulk_batch_size = 500
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        if request.method == 'POST':
+            return self.bulk_create(request)
+        if request.method == 'PATCH':
+            return self.bulk_update(request)
+        return self.bulk_destroy(request)
+
+    def bulk_items(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return None, Response({'detail': 'Expected a list of items.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return None, Response(
+                {'detail': f'At most {self.bulk_max_items} items per request.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return items, None
+
+    def m2m_fields(self, model):
+        return list(model._meta.many_to_many)
+
+    def bulk_create(self, request):
+        items, error = self.bulk_items(request)
+        if error:
+            return error
+        serializer = self.get_serializer(data=items, many=True)
+        if not serializer.is_valid():
+            return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        model = self.get_queryset().model
+        m2m_fields = self.m2m_fields(model)
+        instances, relations = [], []
+        for data in serializer.validated_data:
+            data = dict(data, user=request.user)
+            relations.append({field.name: data.pop(field.name) for field in m2m_fields if field.name in data})
+            instances.append(model(**data))
+        self.bulk_check(request, instances)
+        with transaction.atomic(), signals.suspended():
+            model.objects.bulk_create(instances, batch_size=self.bulk_batch_size)
+            self.bulk_set_relations(instances, relations, m2m_fields)
+            self.bulk_changed(request, before=[], after=list(zip(instances, relations)))
+            search.index(instances)
+            events.instances_changed(instances, 'upsert')
+        return Response(self.bulk_representation(instances), status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request):
+        items, error = self.bulk_items(request)
+        if error:
+            return error
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        existing = self.get_queryset().in_bulk([pk for pk in ids if isinstance(pk, int)])
+        model = self.get_queryset().model
+        m2m_fields = self.m2m_fields(model)
+        prefetch_related_objects(list(existing.values()), *[field.name for field in m2m_fields])
+        serializers, errors, seen = [], [], set()
+        for item in items:
+            instance = existing.get(item.get('id')) if isinstance(item, dict) else None
+            if instance is None or instance.pk in seen:
+                serializers.append(None)
+                errors.append({'id': ['Not found.' if instance is None else 'Duplicate id.']})
+                continue
+            seen.add(instance.pk)
+            serializer = self.get_serializer(instance, data=item, partial=True)
+            serializer.is_valid()
+            serializers.append(serializer)
+            errors.append(serializer.errors)
+        if any(errors):
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        before, after, instances, relations, fields = [], [], [], [], set()
+        for serializer in serializers:
+            instance = serializer.instance
+            old_relations = {field.name: list(getattr(instance, field.name).all()) for field in m2m_fields}
+            before.append((copy.copy(instance), old_relations))
+            data = dict(serializer.validated_data)
+            data.pop('user', None)
+            changed = {field.name: data.pop(field.name) for field in m2m_fields if field.name in data}
+            for name, value in data.items():
+                setattr(instance, name, value)
+                fields.add(name)
+            instances.append(instance)
+            relations.append(changed)
+            after.append((instance, dict(old_relations, **changed)))
+        if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+            # bulk_update skips auto_now
+            now = timezone.now()
+            for instance in instances:
+                instance.updated_at = now
+            fields.add('updated_at')
+        self.bulk_check(request, instances)
+        with transaction.atomic(), signals.suspended():
+            if fields:
+                model.objects.bulk_update(instances, sorted(fields), batch_size=self.bulk_batch_size)
+            self.bulk_set_relations(instances, relations, m2m_fields, replace=True)
+            self.bulk_changed(request, before=before, after=after)
+            search.index(instances)
+            events.instances_changed(instances, 'upsert')
+        return Response(self.bulk_representation(instances))
+
+    def bulk_destroy(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list):
+            return Response({'detail': 'Expected {"ids": [...]}.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.bulk_max_items:
+            return Response(
+                {'detail': f'At most {self.bulk_max_items} items per request.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = self.get_queryset().filter(pk__in=[pk for pk in ids if isinstance(pk, int)])
+        model = queryset.model
+        m2m_fields = self.m2m_fields(model)
+        instances = list(queryset.prefetch_related(*[field.name for field in m2m_fields]))
+        found = {instance.pk for instance in instances}
+        before = [
+            (instance, {field.name: list(getattr(instance, field.name).all()) for field in m2m_fields})
+            for instance in instances
+        ]
+        with transaction.atomic(), signals.suspended():
+            self.bulk_changed(request, before=before, after=[])
+            sync.touch_dependents(model, found)
+            model.objects.filter(pk__in=found).delete()
+            sync.record_deletions(instances)
+            search.remove(instances)
+            events.instances_changed(instances, 'delete')
+        return Response({
+            'deleted': sorted(found),
+            'not_found': [pk for pk in ids if pk not in found],
+        })
+
+    def bulk_set_relations(self, instances, relations, m2m_fields, replace=False):
+        for field in m2m_fields:
+            through = field.remote_field.through
+            source = field.m2m_field_name() + '_id'
+            target = field.m2m_reverse_field_name() + '_id'
+            touched = [instance.pk for instance, rel in zip(instances, relations) if field.name in rel]
+            if not touched:
+                continue
+            if replace:
+                through.objects.filter(**{source + '__in': touched}).delete()
+            through.objects.bulk_create(
+                [
+                    through(**{source: instance.pk, target: related.pk})
+                    for instance, rel in zip(instances, relations)
+                    for related in rel.get(field.name, ())
+                ],
+                batch_size=self.bulk_batch_size,
+                ignore_conflicts=True,
+            )
+
+    def bulk_check(self, request, instances):
+        """Hook to reject a valid batch before anything is written: raise to abort the request."""
+
+    def bulk_changed(self, request, before, after):
+        """Hook for derived data. ``before``/``after`` are ``(instance, relations)`` pairs."""
+        report_cache.invalidate(request.user.pk, ['meta'])
+
+    def bulk_representation(self, instances):
+        for instance in instances:
+            # Relations were rewritten through the through table
+            instance.__dict__.pop('_prefetched_objects_cache', None)
+        if instances:
+            prefetch_related_objects(instances, *[field.name for field in self.m2m_fields(type(instances[0]))])
+        return self.get_serializer(instances, many=True).data
@@ -0,0 +1,92 @@
+"""Calendar payloads for a range of days in the user's timezone.
+
+A range is given as ``month=YYYY-MM`` or ``start``/``end`` dates (both
+inclusive). Days are the user's local days (``Settings.timezone``), turned
+into a half-open ``start_time`` range so the ``(user, start_time)`` index
+applies. The full payload lists every entry; the compact one has a bucket
+per day with entries instead (total seconds, entry count and the top
+projects), which keeps month and year views small.
+"""
+from datetime import date, timedelta, timezone as dt_timezone
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_date
+from .buckets import local_midnight
+from .models import Project, TimeEntry
+from .reports import STORED_DURATION
+
+MAX_DAYS = 366
+TOP_PROJECTS = 3
+
+
+class CalendarError(Exception):
+    pass
+
+
+def parse_range(params):
+    """Return the first and last day asked for by ``month`` or ``start``/``end``."""
+    month = params.get('month')
+    try:
+        if month:
+            year, month_num = map(int, month.split('-'))
+            first = date(year, month_num, 1)
+            last = (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        else:
+            first, last = parse_date(params.get('start') or ''), parse_date(params.get('end') or '')
+    except (OverflowError, ValueError):
+        first = last = None
+    if first is None or last is None:
+        raise CalendarError('month=YYYY-MM or start and end (YYYY-MM-DD) required')
+    if last < first:
+        raise CalendarError('end is before start')
+    if (last - first).days >= MAX_DAYS:
+        raise CalendarError(f'At most {MAX_DAYS} days per request')
+    return first, last
+
+
+def bounds(first, last, tz):
+    """The half-open UTC-comparable ``start_time`` range covering the local days."""
+    try:
+        lower, upper = local_midnight(first, tz), local_midnight(last + timedelta(days=1), tz)
+        # Near year 1 or 9999 the range may not convert to UTC
+        lower.astimezone(dt_timezone.utc), upper.astimezone(dt_timezone.utc)
+    except (OverflowError, ValueError):
+        raise CalendarError('Dates out of range')
+    return lower, upper
+
+
+def entries(user, first, last, tz, model=TimeEntry):
+    lower, upper = bounds(first, last, tz)
+    return model.objects.filter(user=user, start_time__gte=lower, start_time__lt=upper)
+
+
+def due_projects(user, first, last):
+    return Project.objects.filter(user=user, due_date__gte=first, due_date__lte=last)
+
+
+def day_rows(entries, tz):
+    return (
+        entries
+        .annotate(day=TruncDate('start_time', tzinfo=tz))
+        .values('day', 'project_id', 'project__name')
+        .annotate(seconds=Sum(STORED_DURATION), count=Count('id'))
+        .order_by()
+    )
+
+
+def buckets(rows):
+    """Fold ``day_rows`` into one bucket per day, in date order.
+
+    Rows from the hot and archive tables may share a day and project.
+    """
+    days = {}
+    for row in rows:
+        bucket = days.setdefault(row['day'], {'date': row['day'].isoformat(), 'seconds': 0, 'entries': 0, 'projects': {}})
+        bucket['seconds'] += row['seconds'] or 0
+        bucket['entries'] += row['count']
+        project = bucket['projects'].setdefault(row['project_id'], {'id': row['project_id'], 'name': row['project__name'], 'seconds': 0})
+        project['seconds'] += row['seconds'] or 0
+    for bucket in days.values():
+        bucket['projects'] = sorted(bucket['projects'].values(), key=lambda project: (-project['seconds'], project['name'] or ''))
+        del bucket['projects'][TOP_PROJECTS:]
+    return [days[day] for day in sorted(days)]
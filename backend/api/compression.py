@@ -0,0 +1,160 @@
+"""Response compression negotiated by ``Accept-Encoding``.
+
+``CompressionMiddleware`` replaces Django's ``GZipMiddleware``. It offers
+brotli when the optional ``brotli`` package is installed, then gzip, and
+honours the client's q-values (``br;q=0.5, gzip`` picks gzip). Bodies
+smaller than ``MIN_SIZE`` are sent as they are. Streamed bodies (exports)
+are compressed chunk by chunk and flushed after each one, so they still
+stream. Server-sent events are never compressed.
+
+As with ``GZipMiddleware``, a strong ETag becomes weak, because the bytes
+differ per encoding. A conditional GET still matches it.
+"""
+import zlib
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 512,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+SKIP_TYPES = ('text/event-stream', 'image/', 'application/zip', 'application/gzip', 'application/vnd.apache.parquet')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'COMPRESSION', {})}
+
+
+class GzipStream:
+    def __init__(self, config):
+        self._compressor = zlib.compressobj(config['GZIP_LEVEL'], zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self, config):
+        self._compressor = brotli.Compressor(quality=config['BROTLI_QUALITY'])
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def codecs():
+    """Available encodings, most preferred first."""
+    return ([('br', BrotliStream)] if brotli is not None else []) + [('gzip', GzipStream)]
+
+
+def parse_accept_encoding(header):
+    """``{coding: q}`` from an ``Accept-Encoding`` header."""
+    weights = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+    return weights
+
+
+def choose(header):
+    """The name and stream class to encode with, or None."""
+    weights = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for name, stream in codecs():
+        q = weights.get(name, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = (name, stream), q
+    return best
+
+
+def compress(stream_class, data, config):
+    stream = stream_class(config)
+    return stream.compress(data) + stream.finish()
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
+        config = get_config()
+        if not config['ENABLED'] or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '')
+        if any(content_type.startswith(skip) for skip in SKIP_TYPES):
+            return response
+        if not response.streaming and len(response.content) < config['MIN_SIZE']:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        chosen = choose(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if chosen is None:
+            return response
+        name, stream_class = chosen
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.astream(response.streaming_content, stream_class(config))
+            else:
+                response.streaming_content = self.stream(response.streaming_content, stream_class(config))
+            del response['Content-Length']
+        else:
+            compressed = compress(stream_class, response.content, config)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = name
+        return response
+
+    @staticmethod
+    def stream(content, stream):
+        for chunk in content:
+            if chunk:
+                yield stream.compress(chunk)
+        yield stream.finish()
+
+    @staticmethod
+    async def astream(content, stream):
+        async for chunk in content:
+            if chunk:
+                yield stream.compress(chunk)
+        yield stream.finish()
@@ -0,0 +1,6 @@
+from django.db.backends.postgresql import base
+from api.db_pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """PostgreSQL with connections from the per-process pool (see api.db_pool)."""
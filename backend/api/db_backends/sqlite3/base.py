@@ -0,0 +1,13 @@
+from django.db.backends.sqlite3 import base
+from api.db_pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """SQLite with connections from the per-process pool (see api.db_pool).
+
+    In-memory databases live and die with their connection, so they are
+    never pooled.
+    """
+
+    def pooled(self):
+        return not self.is_in_memory_db()
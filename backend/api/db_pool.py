@@ -0,0 +1,286 @@
+"""A per-process pool of database connections.
+
+Django keeps one connection per thread. With ``CONN_MAX_AGE`` a WSGI
+worker thread reuses its connection across requests, but an ASGI worker
+runs every request's ORM calls in a fresh thread, so persistent
+connections are never reused there (and pile up until they expire).
+
+The engines in ``api.db_backends`` fix that by taking raw connections
+from a ``ConnectionPool`` shared by the process. Django "closes" a
+connection at the end of every request (``CONN_MAX_AGE = 0``), which
+hands it back to the pool. The next request, whatever its thread, gets
+it without a new handshake. A connection that sat idle longer than
+``CHECK_AFTER_IDLE_SECONDS`` is pinged before it is handed out, and
+connections are retired after ``MAX_IDLE_SECONDS`` unused or
+``MAX_LIFETIME_SECONDS`` in total.
+
+``stats`` and ``render`` report every pool's counters and gauges, which
+``/api/metrics/`` serves next to the request metrics.
+"""
+import threading
+import time
+from functools import partial
+from django.conf import settings
+
+DEFAULTS = {
+    'MAX_SIZE': 10,
+    # Seconds to wait for a free connection before giving up
+    'TIMEOUT': 10.0,
+    'MAX_IDLE_SECONDS': 300.0,
+    'MAX_LIFETIME_SECONDS': 3600.0,
+    'CHECK_AFTER_IDLE_SECONDS': 30.0,
+}
+COUNTERS = ('created', 'closed', 'acquired', 'waited', 'timeouts', 'failed_checks')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_POOL', {})}
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections made by ``connect()``.
+
+    Idle connections are reused last-in first-out, so a quiet period lets
+    the least recently used ones reach ``max_idle`` and close.
+    """
+
+    def __init__(self, connect, max_size=10, timeout=10.0, max_idle=300.0, max_lifetime=3600.0,
+                 check_after=30.0, check=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.check = check or self.ping
+        self._condition = threading.Condition()
+        self._idle = []
+        self._created_at = {}
+        self.size = 0
+        self.waiting = 0
+        self.wait_seconds = 0.0
+        self.counts = dict.fromkeys(COUNTERS, 0)
+
+    @staticmethod
+    def ping(connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def acquire(self):
+        """A connection for the caller's exclusive use until ``release``."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, released_at, expired = self._take(deadline)
+            for old in expired:
+                _close_quietly(old)
+            if connection is None:
+                return self._create()
+            if time.monotonic() - released_at < self.check_after:
+                return connection
+            try:
+                self.check(connection)
+            except Exception:
+                with self._condition:
+                    self.counts['failed_checks'] += 1
+                    self._drop(connection)
+                _close_quietly(connection)
+                continue
+            return connection
+
+    def _take(self, deadline):
+        # Returns (idle connection, released at, expired) or (None, None, expired)
+        # once a slot for a new connection is reserved
+        expired = []
+        with self._condition:
+            waited = False
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    connection, released_at = self._idle.pop()
+                    if self._expired(connection, released_at, now):
+                        expired.append(self._drop(connection))
+                        continue
+                    self.counts['acquired'] += 1
+                    return connection, released_at, expired
+                if self.size < self.max_size:
+                    self.size += 1
+                    self.counts['acquired'] += 1
+                    return None, None, expired
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.counts['timeouts'] += 1
+                    for connection in expired:
+                        _close_quietly(connection)
+                    raise PoolTimeout(f'No database connection free after {self.timeout}s ({self.max_size} in use).')
+                if not waited:
+                    waited = True
+                    self.counts['waited'] += 1
+                self.waiting += 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    self.wait_seconds += time.monotonic() - now
+
+    def _create(self):
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._condition:
+                self.size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._created_at[id(connection)] = time.monotonic()
+            self.counts['created'] += 1
+        return connection
+
+    def _expired(self, connection, released_at, now):
+        created_at = self._created_at.get(id(connection), now)
+        return now - released_at >= self.max_idle or now - created_at >= self.max_lifetime
+
+    def _drop(self, connection):
+        # Call with the lock held; the caller closes the connection
+        self._created_at.pop(id(connection), None)
+        self.size -= 1
+        self.counts['closed'] += 1
+        self._condition.notify()
+        return connection
+
+    def release(self, connection, discard=False):
+        """Give ``connection`` back; ``discard`` closes it instead."""
+        now = time.monotonic()
+        expired = []
+        with self._condition:
+            if discard or now - self._created_at.get(id(connection), now) >= self.max_lifetime:
+                expired.append(self._drop(connection))
+            else:
+                self._idle.append((connection, now))
+                self._condition.notify()
+            # The oldest idle connections are at the bottom of the stack
+            while self._idle and now - self._idle[0][1] >= self.max_idle:
+                expired.append(self._drop(self._idle.pop(0)[0]))
+        for old in expired:
+            _close_quietly(old)
+
+    def close_idle(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            for connection, _released_at in idle:
+                self._drop(connection)
+        for connection, _released_at in idle:
+            _close_quietly(connection)
+
+    def stats(self):
+        with self._condition:
+            idle = len(self._idle)
+            return {
+                'max_size': self.max_size,
+                'size': self.size,
+                'idle': idle,
+                'in_use': self.size - idle,
+                'waiting': self.waiting,
+                'wait_seconds': self.wait_seconds,
+                **self.counts,
+            }
+
+
+class PooledDatabaseWrapperMixin:
+    """Mixed into a backend's ``DatabaseWrapper`` to open and close through the pool."""
+
+    def pooled(self):
+        return True
+
+    def get_new_connection(self, conn_params):
+        if not self.pooled():
+            return super().get_new_connection(conn_params)
+        return get_pool(self.alias, partial(super().get_new_connection, conn_params)).acquire()
+
+    def _close(self):
+        pool = _pools.get(self.alias)
+        if self.connection is None or pool is None or not self.pooled():
+            return super()._close()
+        connection = self.connection
+        discard = self.errors_occurred and not self.is_usable()
+        if not discard:
+            try:
+                # Closed mid-transaction: the next user must not inherit it
+                connection.rollback()
+            except Exception:
+                discard = True
+        self.errors_occurred = False
+        pool.release(connection, discard)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, connect, check=None):
+    """The pool for database ``alias``, created with ``connect`` on first use."""
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                config = get_config()
+                pool = _pools[alias] = ConnectionPool(
+                    connect, config['MAX_SIZE'], config['TIMEOUT'], config['MAX_IDLE_SECONDS'],
+                    config['MAX_LIFETIME_SECONDS'], config['CHECK_AFTER_IDLE_SECONDS'], check,
+                )
+    return pool
+
+
+def close_pool(alias):
+    """Close ``alias``'s idle connections and forget the pool."""
+    with _pools_lock:
+        pool = _pools.pop(alias, None)
+    if pool is not None:
+        pool.close_idle()
+
+
+def stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in sorted(pools.items())}
+
+
+def render():
+    """Pool gauges and counters in the Prometheus text exposition format."""
+    pools = stats()
+    if not pools:
+        return ''
+    lines = []
+    for name, help_text, kind, key in (
+        ('connections', 'Open pooled connections.', 'gauge', 'size'),
+        ('idle_connections', 'Pooled connections waiting to be used.', 'gauge', 'idle'),
+        ('in_use_connections', 'Pooled connections held by requests.', 'gauge', 'in_use'),
+        ('max_connections', 'Connections the pool may open.', 'gauge', 'max_size'),
+        ('waiting_threads', 'Threads waiting for a free connection.', 'gauge', 'waiting'),
+        ('acquired_total', 'Connections handed out.', 'counter', 'acquired'),
+        ('created_total', 'Connections opened.', 'counter', 'created'),
+        ('closed_total', 'Connections closed (expired, failed or discarded).', 'counter', 'closed'),
+        ('waited_total', 'Acquisitions that had to wait for a free connection.', 'counter', 'waited'),
+        ('wait_seconds_total', 'Time spent waiting for a free connection.', 'counter', 'wait_seconds'),
+        ('timeouts_total', 'Acquisitions that gave up waiting.', 'counter', 'timeouts'),
+        ('failed_checks_total', 'Idle connections that failed their health check.', 'counter', 'failed_checks'),
+    ):
+        lines.append(f'# HELP api_db_pool_{name} {help_text}')
+        lines.append(f'# TYPE api_db_pool_{name} {kind}')
+        for alias, values in pools.items():
+            lines.append(f'api_db_pool_{name}{{database="{alias}"}} {values[key]!r}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,220 @@
+"""Live change events, pushed to clients over server-sent events.
+
+Whenever a user's clients, projects, tags, time entries or settings change,
+a compact event naming the resource, the operation and the ids is published
+once the transaction commits::
+
+    {"resource": "time_entries", "op": "upsert", "ids": [12], "token": "..."}
+
+``token`` is a ``/api/sync/`` token taken before the change, so a client
+fetches the rows themselves with ``/api/sync/?since=<token>``. A client
+whose queue overflowed gets a ``reset`` event instead, and should call
+``/api/sync/`` with its last token.
+
+A subscriber is an ``asyncio.Queue`` on the event loop serving its
+connection, so an open stream costs no thread and no database connection.
+The default in-process broker only reaches connections held by the same
+process; deployments with several ASGI workers plug in a shared broker
+through ``LIVE_EVENTS['BACKEND']`` (a dotted path to a class with
+``subscribe``/``unsubscribe``/``publish``).
+
+Browsers' ``EventSource`` can't send an ``Authorization`` header, so the
+stream also accepts ``?token=`` from ``POST /api/events/token/``: a signed
+user id that expires after ``TOKEN_MAX_AGE_SECONDS`` and is good for
+nothing but this stream. ``frontend/lib/events-utils.ts`` fetches one for
+every connection.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import sync
+from .models import Settings
+
+DEFAULTS = {
+    'BACKEND': 'inprocess',
+    'QUEUE_SIZE': 256,
+    'HEARTBEAT_SECONDS': 15,
+    'MAX_CONNECTIONS_PER_USER': 20,
+    # Django 4.2 doesn't notice a client going away mid-stream, so streams
+    # end after this long and EventSource reconnects
+    'MAX_AGE_SECONDS': 300,
+    # Stream tokens only need to last until EventSource connects
+    'TOKEN_MAX_AGE_SECONDS': 60,
+}
+RESOURCE_NAMES = {**sync.RESOURCE_NAMES, Settings: 'settings'}
+
+
+TOKEN_SALT = 'api.events.stream'
+
+
+class TooManyConnections(Exception):
+    pass
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LIVE_EVENTS', {})}
+
+
+def make_token(user_id):
+    return signing.dumps(user_id, salt=TOKEN_SALT)
+
+
+def token_user_id(token):
+    """The user id signed into a stream token, if it hasn't expired."""
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=get_config()['TOKEN_MAX_AGE_SECONDS'])
+    except signing.BadSignature:
+        raise InvalidToken('Invalid or expired stream token.')
+
+
+class Subscription:
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def put(self, event):
+        # Runs on the subscriber's loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'reset': True})
+
+    async def get(self, timeout):
+        """The next event, or None after ``timeout`` seconds without one."""
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event.get('reset'):
+            self.overflowed = False
+        return event
+
+
+class InProcessBroker:
+    """Fans events out to the subscribers held by this process."""
+
+    def __init__(self, queue_size=256, max_per_user=20):
+        self.queue_size = queue_size
+        self.max_per_user = max_per_user
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id):
+        """Register a subscription for ``user_id``. Call from the event loop that reads it."""
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            subscribers = self._subscribers.setdefault(user_id, set())
+            if self.max_per_user and len(subscribers) >= self.max_per_user:
+                raise TooManyConnections(f'At most {self.max_per_user} live connections per user.')
+            subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event):
+        """Queue ``event`` for every subscriber of ``user_id``. Safe from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+            event = dict(event, id=next(self._ids))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # The connection's loop has closed; it unsubscribes on its way out
+                pass
+
+    def connections(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = get_config()
+                backend = config['BACKEND']
+                broker_class = InProcessBroker if backend == 'inprocess' else import_string(backend)
+                _broker = broker_class(config['QUEUE_SIZE'], config['MAX_CONNECTIONS_PER_USER'])
+    return _broker
+
+
+def changed(user_id, resource, op, ids):
+    """Publish a change to ``user_id``'s subscribers once the transaction commits."""
+    ids = sorted(set(ids))
+    if not ids:
+        return
+    event = {'resource': resource, 'op': op, 'ids': ids, 'token': sync.encode_token(timezone.now())}
+    transaction.on_commit(lambda: get_broker().publish(user_id, event))
+
+
+def instances_changed(instances, op):
+    """``changed`` for model instances, grouped by user and resource."""
+    groups = {}
+    for instance in instances:
+        key = (instance.user_id, RESOURCE_NAMES[type(instance)])
+        groups.setdefault(key, []).append(instance.pk)
+    for (user_id, resource), ids in groups.items():
+        changed(user_id, resource, op, ids)
+
+
+def format_event(event):
+    if event.get('reset'):
+        return 'event: reset\ndata: {}\n\n'
+    data = {key: value for key, value in event.items() if key != 'id'}
+    return f'id: {event["id"]}\nevent: change\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+async def stream(user_id, heartbeat=15, max_age=300):
+    """The server-sent-events body of a connection for ``user_id``.
+
+    The subscription is made when the body starts and dropped when it ends,
+    so a response that is never sent leaves nothing behind. Events from
+    before the first ``retry`` line are not delivered; clients sync then.
+    """
+    broker = get_broker()
+    try:
+        subscription = broker.subscribe(user_id)
+    except TooManyConnections:
+        return
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_age
+    try:
+        yield 'retry: 3000\n\n'
+        while (remaining := deadline - loop.time()) > 0:
+            event = await subscription.get(min(heartbeat, remaining))
+            # Comments keep proxies from timing the connection out
+            yield ': ping\n\n' if event is None else format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
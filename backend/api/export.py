@@ -0,0 +1,157 @@
+"""Streaming exports of time entries.
+
+Rows are read with chunked ``.iterator()`` queries and encoded one chunk at
+a time, so memory use does not grow with the number of exported rows.
+Archived entries are merged in by start time when the range reaches the
+user's archive (see ``api.archive``).
+"""
+import csv
+import heapq
+import io
+import json
+from . import archive
+from .report_cache import parse_moment
+
+COLUMNS = [
+    'id', 'description', 'project', 'project_name', 'client', 'client_name',
+    'tags', 'start_time', 'end_time', 'duration', 'created_at',
+]
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def _bound(name, value):
+    moment = parse_moment(value)
+    if moment is None:
+        raise ExportError(f'Invalid {name}: {value}')
+    return moment
+
+
+def export_querysets(user, start=None, end=None, boundary=None):
+    """One queryset per entry table the range needs; ``boundary`` is the user's ``archived_before``."""
+    start = _bound('start', start) if start else None
+    end = _bound('end', end) if end else None
+    querysets = []
+    for model in archive.entry_models(boundary, start):
+        entries = model.objects.filter(user=user)
+        if start:
+            entries = entries.filter(start_time__gte=start)
+        if end:
+            entries = entries.filter(start_time__lt=end)
+        querysets.append(entries.select_related('project', 'client').prefetch_related('tags').order_by('start_time', 'id'))
+    return querysets
+
+
+def iter_rows(querysets, chunk_size=2000):
+    entries = heapq.merge(
+        *(queryset.iterator(chunk_size=chunk_size) for queryset in querysets),
+        key=lambda entry: (entry.start_time, entry.id),
+    )
+    for entry in entries:
+        yield {
+            'id': entry.id,
+            'description': entry.description,
+            'project': entry.project_id,
+            'project_name': entry.project.name if entry.project_id else None,
+            'client': entry.client_id,
+            'client_name': entry.client.name if entry.client_id else None,
+            'tags': [tag.name for tag in entry.tags.all()],
+            'start_time': entry.start_time.isoformat(),
+            'end_time': entry.end_time.isoformat() if entry.end_time else None,
+            'duration': entry.duration,
+            'created_at': entry.created_at.isoformat(),
+        }
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_stream(rows, chunk_size=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for chunk in _chunks(rows, chunk_size):
+        for row in chunk:
+            writer.writerow([';'.join(row[c]) if c == 'tags' else row[c] for c in COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def jsonl_stream(rows, chunk_size=500):
+    for chunk in _chunks(rows, chunk_size):
+        yield ''.join(json.dumps(row) + '\n' for row in chunk)
+
+
+class _Drain(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_stream(rows, chunk_size=50000):
+    """Columnar export, one Parquet row group per chunk. Needs pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError('Parquet export requires the optional pyarrow package.')
+    schema = pa.schema([
+        ('id', pa.int64()), ('description', pa.string()),
+        ('project', pa.int64()), ('project_name', pa.string()),
+        ('client', pa.int64()), ('client_name', pa.string()),
+        ('tags', pa.list_(pa.string())),
+        ('start_time', pa.string()), ('end_time', pa.string()),
+        ('duration', pa.int64()), ('created_at', pa.string()),
+    ])
+
+    def generate():
+        sink = _Drain()
+        writer = pq.ParquetWriter(sink, schema)
+        for chunk in _chunks(rows, chunk_size):
+            columns = {name: [row[name] for row in chunk] for name in COLUMNS}
+            writer.write_table(pa.table(columns, schema=schema))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+    return generate()
+
+
+STREAMS = {'csv': csv_stream, 'jsonl': jsonl_stream, 'parquet': parquet_stream}
+
+
+def stream(fmt, rows):
+    if fmt not in STREAMS:
+        raise ExportError(f'Unknown export format: {fmt}')
+    return STREAMS[fmt](rows)
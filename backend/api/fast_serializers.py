@@ -0,0 +1,221 @@
+"""List serialization straight from ``.values_list()`` rows.
+
+A DRF serializer builds each row of a list by calling ``get_attribute``
+and ``to_representation`` on every field, one model instance at a time.
+On the list endpoints that costs more than the query. ``ValuesSerializer``
+reads the serializer's fields with ``.values_list()`` instead, and picks a
+converter per field once: none for ints, strings, booleans and foreign
+keys, a direct ISO formatter for dates and datetimes, and the field's own
+``to_representation`` for anything else. Many-to-many ids come from one
+query on the through table, ordered by id as ``optimize_entry_queryset``
+prefetches them.
+
+The output is what ``serializer_class(rows, many=True).data`` returns,
+key order included; the tests compare the two. ``model`` reads another
+model with the same fields, e.g. ArchivedTimeEntry for the entry list.
+"""
+import functools
+from collections import defaultdict
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from . import metrics
+from .serializers import ClientSerializer, ProjectSerializer, TagSerializer, TimeEntrySerializer
+
+# Fields whose representation of a database value is the value itself
+UNCONVERTED = (
+    serializers.BooleanField, serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+)
+
+
+def _datetime(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or tz is None:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or timezone.is_naive(value):
+            return field.to_representation(value)
+        text = value.astimezone(tz).isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return convert
+
+
+def _date(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    return lambda value: value if isinstance(value, str) else value.isoformat()
+
+
+def converter(field):
+    """The function turning a database value into ``field``'s representation, or None for no change."""
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime(field)
+    if isinstance(field, serializers.DateField):
+        return _date(field)
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None
+    if isinstance(field, UNCONVERTED):
+        return None
+    return field.to_representation
+
+
+class ValuesSerializer:
+    """Serializes ``queryset(...)`` rows as ``serializer_class`` serializes instances."""
+    serializer_class = None
+
+    def __init__(self, context=None, model=None):
+        self.context = context or {}
+        self.model = model or self.serializer_class.Meta.model
+        self.names, self.keys, self.columns, fields, self.many = self.layout(self.serializer_class)
+        # Converters are picked per instance: a datetime's depends on the active timezone
+        self.converters = [
+            (name, convert) for name, convert in ((name, converter(field)) for name, field in fields)
+            if convert is not None
+        ]
+        self.id_index = self.columns.index('id')
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def layout(serializer_class):
+        """The readable fields of ``serializer_class``: output names, column names and sources."""
+        names, keys, columns, fields, many = [], [], [], [], []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            names.append(name)
+            if isinstance(field, serializers.ManyRelatedField):
+                many.append((name, field.source))
+                continue
+            keys.append(name)
+            columns.append(field.source)
+            fields.append((name, field))
+        if 'id' not in columns:
+            raise ValueError(f'{serializer_class.__name__} has no id field')
+        return names, keys, columns, fields, many
+
+    def extra_columns(self):
+        """Columns read after the serialized ones, for ``finish``."""
+        return []
+
+    def queryset(self, queryset):
+        """``queryset`` as rows for ``serialize``: named tuples of the serializer's columns."""
+        return queryset.prefetch_related(None).values_list(*self.columns, *self.extra_columns(), named=True)
+
+    def m2m(self, source):
+        """The through model of many-to-many field ``source``, and its names for this side and the other."""
+        field = self.model._meta.get_field(source)
+        return field.remote_field.through, field.m2m_field_name(), field.m2m_reverse_field_name()
+
+    def related_querysets(self, ids):
+        """``{name: queryset of (id, related...)}`` rows for the many-to-many fields."""
+        querysets = {}
+        for name, source in self.many:
+            through, own, other = self.m2m(source)
+            querysets[name] = through.objects.filter(**{f'{own}__in': ids}).order_by(other).values_list(own, other)
+        return querysets
+
+    def serialize(self, rows):
+        ids = [row[self.id_index] for row in rows]
+        related = {name: list(rows) for name, rows in self.related_querysets(ids).items()} if ids else {}
+        return self.build(rows, related)
+
+    async def aserialize(self, rows):
+        ids = [row[self.id_index] for row in rows]
+        related = {}
+        if ids:
+            for name, queryset in self.related_querysets(ids).items():
+                related[name] = [row async for row in queryset]
+        return self.build(rows, related)
+
+    def group(self, name, rows):
+        grouped = defaultdict(list)
+        for owner, other in rows:
+            grouped[owner].append(other)
+        return grouped
+
+    def finish(self, data, row, related):
+        """Hook to add what the serializer's own ``to_representation`` adds."""
+
+    def build(self, rows, related):
+        with metrics.span('serialize'):
+            keys, converters, id_index = self.keys, self.converters, self.id_index
+            many = [(name, self.group(name, related.get(name, ()))) for name, _source in self.many]
+            template = dict.fromkeys(self.names)
+            results = []
+            for row in rows:
+                data = template.copy()
+                data.update(zip(keys, row))
+                for name, convert in converters:
+                    value = data[name]
+                    if value is not None:
+                        data[name] = convert(value)
+                for name, grouped in many:
+                    data[name] = grouped.get(row[id_index], [])
+                self.finish(data, row, related)
+                results.append(data)
+            return results
+
+
+class ClientValuesSerializer(ValuesSerializer):
+    serializer_class = ClientSerializer
+
+
+class ProjectValuesSerializer(ValuesSerializer):
+    serializer_class = ProjectSerializer
+
+
+class TagValuesSerializer(ValuesSerializer):
+    serializer_class = TagSerializer
+
+
+class TimeEntryValuesSerializer(ValuesSerializer):
+    """TimeEntrySerializer, ``expand`` context included."""
+    serializer_class = TimeEntrySerializer
+
+    @property
+    def expand(self):
+        return self.context.get('expand') or ()
+
+    def extra_columns(self):
+        columns = []
+        if 'project' in self.expand:
+            columns += ['project__name', 'project__color']
+        if 'client' in self.expand:
+            columns += ['client__name']
+        return columns
+
+    def related_querysets(self, ids):
+        querysets = super().related_querysets(ids)
+        if 'tags' in self.expand:
+            _through, own, other = self.m2m('tags')
+            querysets['tags'] = querysets['tags'].values_list(own, other, f'{other}__name', f'{other}__color')
+        return querysets
+
+    def group(self, name, rows):
+        if name != 'tags' or 'tags' not in self.expand:
+            return super().group(name, rows)
+        self.tag_summaries = defaultdict(list)
+        grouped = defaultdict(list)
+        for entry_id, tag_id, tag_name, color in rows:
+            grouped[entry_id].append(tag_id)
+            self.tag_summaries[entry_id].append({'id': tag_id, 'name': tag_name, 'color': color})
+        return grouped
+
+    def finish(self, data, row, related):
+        expand = self.expand
+        if not expand:
+            return
+        expanded = {}
+        if 'project' in expand:
+            expanded['project'] = (
+                {'id': row.project, 'name': row.project__name, 'color': row.project__color}
+                if row.project is not None else None
+            )
+        if 'client' in expand:
+            expanded['client'] = {'id': row.client, 'name': row.client__name} if row.client is not None else None
+        if 'tags' in expand:
+            expanded['tags'] = self.tag_summaries.get(row.id, [])
+        data['expanded'] = expanded
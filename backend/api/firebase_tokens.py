@@ -0,0 +1,173 @@
+"""Local verification of Firebase ID tokens.
+
+Firebase ID tokens are RS256 JWTs signed with Google's rotating
+``securetoken`` keys. Verifying them locally against an in-process copy of
+those certificates avoids a round trip per request, and verified claims are
+cached by token hash until the token's own ``exp``.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.request import urlopen
+
+import jwt
+from cryptography.x509 import load_pem_x509_certificate
+from django.conf import settings
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+ISSUER_PREFIX = 'https://securetoken.google.com/'
+SERVICE_ACCOUNT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../firebase-adminsdk.json'))
+
+
+class TokenError(Exception):
+    pass
+
+
+def fetch_certificates(url, timeout=10):
+    """Download Google's signing certificates. Returns ``(certs, max_age)``."""
+    with urlopen(url, timeout=timeout) as response:
+        certs = json.loads(response.read().decode('utf-8'))
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+    return certs, int(match.group(1)) if match else 3600
+
+
+class CertificateCache:
+    """In-process cache of Google's public keys, keyed by ``kid``.
+
+    Keys are refreshed when the ``Cache-Control`` lifetime runs out, or early
+    when a token names a ``kid`` we have not seen (i.e. Google rotated keys).
+    Early refreshes are rate limited so garbage ``kid`` values can't turn
+    every request into a fetch.
+    """
+
+    def __init__(self, url=GOOGLE_CERTS_URL, fetch=fetch_certificates, clock=time.time, min_refresh_interval=60):
+        self.url = url
+        self.fetch = fetch
+        self.clock = clock
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._expires_at = 0
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def get_key(self, kid):
+        with self._lock:
+            now = self.clock()
+            if now >= self._expires_at:
+                self._refresh(now)
+            elif kid not in self._keys and now - self._fetched_at >= self.min_refresh_interval:
+                self._refresh(now)
+            return self._keys.get(kid)
+
+    def _refresh(self, now):
+        try:
+            certs, max_age = self.fetch(self.url)
+        except Exception as e:
+            if not self._keys:
+                raise TokenError(f'Could not fetch signing certificates: {e}')
+            # Keep serving the keys we have and retry after the refresh interval
+            self._fetched_at = now
+            self._expires_at = now + self.min_refresh_interval
+            return
+        self._keys = {
+            kid: load_pem_x509_certificate(pem.encode('utf-8')).public_key()
+            for kid, pem in certs.items()
+        }
+        self._fetched_at = now
+        self._expires_at = now + max_age
+
+
+class TokenVerifier:
+    """Verify Firebase ID tokens, caching decoded claims until they expire."""
+
+    def __init__(self, project_id, certificates=None, clock=time.time, max_entries=10000, leeway=5):
+        self.project_id = project_id
+        self.certificates = certificates or CertificateCache(clock=clock)
+        self.clock = clock
+        self.max_entries = max_entries
+        self.leeway = leeway
+        self._claims = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, id_token):
+        key = hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+        now = self.clock()
+        with self._lock:
+            cached = self._claims.get(key)
+            if cached is not None:
+                if cached['exp'] > now:
+                    self._claims.move_to_end(key)
+                    return cached
+                del self._claims[key]
+        claims = self.decode(id_token)
+        with self._lock:
+            self._claims[key] = claims
+            while len(self._claims) > self.max_entries:
+                self._claims.popitem(last=False)
+        return claims
+
+    def decode(self, id_token):
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.InvalidTokenError as e:
+            raise TokenError(str(e))
+        if header.get('alg') != 'RS256':
+            raise TokenError('Firebase ID token has incorrect algorithm.')
+        public_key = self.certificates.get_key(header.get('kid'))
+        if public_key is None:
+            raise TokenError('Firebase ID token has an unknown key id.')
+        try:
+            claims = jwt.decode(
+                id_token,
+                public_key,
+                algorithms=['RS256'],
+                audience=self.project_id,
+                issuer=ISSUER_PREFIX + self.project_id,
+                leeway=self.leeway,
+                options={'require': ['exp', 'iat', 'sub']},
+            )
+        except jwt.InvalidTokenError as e:
+            raise TokenError(str(e))
+        subject = claims['sub']
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise TokenError('Firebase ID token has an invalid subject.')
+        now = self.clock()
+        if claims['exp'] <= now - self.leeway:
+            raise TokenError('Firebase ID token has expired.')
+        if claims.get('auth_time', 0) > now + self.leeway:
+            raise TokenError('Firebase ID token has a future auth_time.')
+        claims['uid'] = subject
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._claims.clear()
+
+
+def default_project_id():
+    project_id = getattr(settings, 'FIREBASE_PROJECT_ID', None) or os.getenv('FIREBASE_PROJECT_ID')
+    if project_id:
+        return project_id
+    with open(SERVICE_ACCOUNT_PATH) as f:
+        return json.load(f)['project_id']
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = TokenVerifier(default_project_id())
+    return _verifier
+
+
+def verify_id_token(id_token):
+    return get_verifier().verify(id_token)
@@ -0,0 +1,218 @@
+"""Database-backed background jobs.
+
+Work that shouldn't run in a web worker is queued as a ``Job`` row with
+``enqueue``. ``manage.py run_jobs`` claims due jobs and runs them in a
+pool of worker processes. A claim is a compare-and-set on ``status``, so
+any number of workers can share the queue on SQLite or PostgreSQL.
+
+A handler is the function named for the job's ``kind`` in ``HANDLERS``.
+It receives the Job and returns a JSON-serializable result (dates and
+decimals are encoded as DRF renders them). A handler that raises is
+retried after ``RETRY_SECONDS`` times the attempts so far, until
+``MAX_ATTEMPTS``. A job left running longer than ``STALE_SECONDS`` is
+presumed to belong to a dead worker and is requeued.
+
+Between polls the worker also does housekeeping: it requeues stale jobs,
+prunes finished ones after ``KEEP_DAYS``, and enqueues the weekly report
+emails (see ``api.report_jobs``).
+"""
+import django
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Worker processes per run_jobs; 0 runs jobs in the worker's own process
+    'PROCESSES': 2,
+    'POLL_SECONDS': 1.0,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_SECONDS': 60,
+    'STALE_SECONDS': 900,
+    'KEEP_DAYS': 7,
+    'HOUSEKEEPING_SECONDS': 300,
+    # Reports the rollup can't answer and spanning more days than this run as jobs
+    # (None: only when the client asks with ?async=1 or Prefer: respond-async)
+    'REPORT_INLINE_MAX_DAYS': None,
+}
+HANDLERS = {
+    'report': 'api.report_jobs.run_report',
+    'weekly_report': 'api.report_jobs.run_weekly_report',
+    'rebuild_rollups': 'api.rollups.run_rebuild',
+}
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class UnknownJob(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'JOBS', {})}
+
+
+def _job(kind, user, params, key, run_after):
+    if kind not in HANDLERS:
+        raise UnknownJob(f'No handler for job kind {kind!r}')
+    return Job(user=user, kind=kind, params=params or {}, key=key, run_after=run_after or timezone.now())
+
+
+def enqueue(kind, user=None, params=None, key=None, run_after=None):
+    """Queue a job. With ``key``, an existing job with that key is returned instead."""
+    job = _job(kind, user, params, key, run_after)
+    if key is None:
+        job.save()
+        return job
+    return Job.objects.get_or_create(key=key, defaults={
+        'user': job.user, 'kind': kind, 'params': job.params, 'run_after': job.run_after,
+    })[0]
+
+
+async def aenqueue(kind, user=None, params=None, run_after=None):
+    job = _job(kind, user, params, None, run_after)
+    await job.asave()
+    return job
+
+
+def enqueue_many(jobs, now=None):
+    """Bulk-queue ``(kind, user_id, params, key)`` tuples, skipping keys already queued. Returns how many were new."""
+    now = now or timezone.now()
+    rows = [_job(kind, None, params, key, now) for kind, _user_id, params, key in jobs]
+    for row, (_kind, user_id, _params, _key) in zip(rows, jobs):
+        row.user_id = user_id
+    keys = [row.key for row in rows if row.key is not None]
+    existing = set(Job.objects.filter(key__in=keys).values_list('key', flat=True))
+    Job.objects.bulk_create([row for row in rows if row.key not in existing], ignore_conflicts=True)
+    return len(rows) - len(existing)
+
+
+def claim(now=None):
+    """Mark the oldest due job running and return it, or None if nothing is due."""
+    while True:
+        now = now or timezone.now()
+        job = Job.objects.filter(status=QUEUED, run_after__lte=now).order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        # Another worker may have claimed it since the read
+        taken = Job.objects.filter(pk=job.pk, status=QUEUED).update(
+            status=RUNNING, started_at=now, attempts=F('attempts') + 1,
+        )
+        if taken:
+            job.refresh_from_db()
+            return job
+
+
+def _jsonable(result):
+    return json.loads(json.dumps(result, cls=JSONEncoder))
+
+
+def execute(job_id):
+    """Run a claimed job and record its outcome. Returns the job's new status."""
+    close_old_connections()
+    try:
+        job = Job.objects.select_related('user').get(pk=job_id)
+        config = get_config()
+        try:
+            result = _jsonable(import_string(HANDLERS[job.kind])(job))
+        except Exception as e:
+            logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.kind, job.attempts)
+            now = timezone.now()
+            if job.attempts < config['MAX_ATTEMPTS']:
+                retry = now + timedelta(seconds=config['RETRY_SECONDS'] * job.attempts)
+                Job.objects.filter(pk=job.pk).update(status=QUEUED, error=str(e), run_after=retry)
+                return QUEUED
+            Job.objects.filter(pk=job.pk).update(status=FAILED, error=str(e), finished_at=now)
+            return FAILED
+        Job.objects.filter(pk=job.pk).update(status=DONE, result=result, error='', finished_at=timezone.now())
+        return DONE
+    finally:
+        close_old_connections()
+
+
+def requeue_stale(now=None):
+    """Requeue (or fail, after MAX_ATTEMPTS) jobs whose worker seems to have died. Returns how many."""
+    config = get_config()
+    now = now or timezone.now()
+    stale = Job.objects.filter(status=RUNNING, started_at__lt=now - timedelta(seconds=config['STALE_SECONDS']))
+    failed = stale.filter(attempts__gte=config['MAX_ATTEMPTS']).update(
+        status=FAILED, error='The worker running this job stopped.', finished_at=now,
+    )
+    return failed + stale.update(status=QUEUED, run_after=now)
+
+
+def prune(now=None):
+    """Delete finished jobs older than KEEP_DAYS. Returns how many."""
+    cutoff = (now or timezone.now()) - timedelta(days=get_config()['KEEP_DAYS'])
+    return Job.objects.filter(status__in=[DONE, FAILED], finished_at__lt=cutoff).delete()[0]
+
+
+def housekeeping(schedule=True):
+    from . import report_jobs
+    requeue_stale()
+    prune()
+    if schedule:
+        report_jobs.schedule_weekly_reports()
+
+
+def run_pending(limit=None):
+    """Run due jobs in this process until none are left (or ``limit``). Returns how many ran."""
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim()
+        if job is None:
+            break
+        execute(job.pk)
+        ran += 1
+    return ran
+
+
+def work(processes=None, poll=None, once=False, schedule=True):
+    """The run_jobs loop. With ``once``, returns the number of jobs run when the queue is empty."""
+    config = get_config()
+    processes = config['PROCESSES'] if processes is None else processes
+    poll = config['POLL_SECONDS'] if poll is None else poll
+    ran, housekept = 0, None
+    executor = None
+    if processes:
+        # Spawned, not forked: a fork would share the parent's database sockets. Children
+        # set Django up before unpickling anything that imports the models.
+        executor = ProcessPoolExecutor(processes, multiprocessing.get_context('spawn'), django.setup)
+    pending = set()
+    try:
+        while True:
+            if housekept is None or time.monotonic() - housekept >= config['HOUSEKEEPING_SECONDS']:
+                housekeeping(schedule)
+                housekept = time.monotonic()
+            if executor is None:
+                if run_pending(1):
+                    ran += 1
+                    continue
+            else:
+                while len(pending) < processes:
+                    job = claim()
+                    if job is None:
+                        break
+                    pending.add(executor.submit(execute, job.pk))
+                if pending:
+                    done, pending = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                    ran += len(done)
+                    continue
+            if once:
+                return ran
+            time.sleep(poll)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
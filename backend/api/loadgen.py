@@ -0,0 +1,100 @@
+"""Synthetic data for load testing.
+
+Everything is written with ``bulk_create``, so model signals do not fire.
+Rollups, tag usage counts and the search index for the generated users
+are rebuilt once at the end. Distributions are rough but shaped like real usage:
+- a few projects get most of the time;
+- entries cluster on weekday working hours;
+- durations are log-normal around 45 minutes;
+- most entries carry zero to two tags.
+"""
+import math
+import random
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.utils import timezone
+from . import rollups, search, tag_usage
+from .models import Client, Project, Settings, Tag, TimeEntry
+
+WORDS = [
+    'review', 'planning', 'standup', 'design', 'bugfix', 'deploy', 'research',
+    'call', 'email', 'docs', 'testing', 'refactor', 'support', 'workshop',
+]
+COLORS = ['#3b82f6', '#ef4444', '#10b981', '#f59e0b', '#8b5cf6', '#ec4899', '#14b8a6']
+
+
+def _zipf_weights(count):
+    return [1 / (rank + 1) for rank in range(count)]
+
+
+def _start_time(rng, first_day, days):
+    while True:
+        day = first_day + timedelta(days=rng.randrange(days))
+        # Weekends see about a sixth of weekday activity
+        if day.weekday() < 5 or rng.random() < 0.15:
+            break
+    hour = min(max(rng.gauss(12, 2.5), 6), 22)
+    return day + timedelta(seconds=int(hour * 3600))
+
+
+def _duration(rng):
+    seconds = rng.lognormvariate(math.log(45 * 60), 0.8)
+    return int(min(max(seconds, 5 * 60), 8 * 3600))
+
+
+def seed(users=1, clients=5, projects=20, tags=10, entries=1000, days=365,
+         prefix='load', rng_seed=0, batch_size=5000, now=None):
+    """Create ``users`` users, each with the given numbers of related rows.
+
+    Returns the created users. Usernames are ``<prefix>-<n>``.
+    """
+    rng = random.Random(rng_seed)
+    now = now or timezone.now()
+    first_day = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    created = User.objects.bulk_create([User(username=f'{prefix}-{n}') for n in range(users)])
+    created = list(User.objects.filter(username__in=[user.username for user in created]))
+    Settings.objects.bulk_create([Settings(user=user) for user in created])
+    for user in created:
+        client_rows = Client.objects.bulk_create([
+            Client(user=user, name=f'Client {n}', email=f'client{n}@{prefix}.test',
+                   status='active' if rng.random() < 0.8 else 'inactive')
+            for n in range(clients)
+        ])
+        project_rows = Project.objects.bulk_create([
+            Project(
+                user=user, name=f'Project {n}', color=rng.choice(COLORS),
+                client=rng.choice(client_rows) if client_rows and rng.random() < 0.7 else None,
+                status=rng.choices(['active', 'completed', 'on-hold'], [6, 3, 1])[0],
+                due_date=(first_day + timedelta(days=rng.randrange(days + 90))).date() if rng.random() < 0.3 else None,
+            )
+            for n in range(projects)
+        ])
+        tag_rows = Tag.objects.bulk_create([
+            Tag(user=user, name=f'{rng.choice(WORDS)}-{n}', color=rng.choice(COLORS))
+            for n in range(tags)
+        ])
+        project_weights = _zipf_weights(len(project_rows))
+        tag_weights = _zipf_weights(len(tag_rows))
+        through = TimeEntry.tags.through
+        for offset in range(0, entries, batch_size):
+            batch = []
+            for _ in range(min(batch_size, entries - offset)):
+                project = rng.choices(project_rows, project_weights)[0] if project_rows and rng.random() < 0.9 else None
+                start = _start_time(rng, first_day, days)
+                duration = _duration(rng)
+                batch.append(TimeEntry(
+                    user=user, description=' '.join(rng.sample(WORDS, rng.randint(1, 3))),
+                    project=project, client=project.client if project else None,
+                    start_time=start, end_time=start + timedelta(seconds=duration), duration=duration,
+                ))
+            TimeEntry.objects.bulk_create(batch)
+            links = []
+            for entry in batch:
+                count = rng.choices([0, 1, 2, 3], [3, 4, 2, 1])[0] if tag_rows else 0
+                picked = {tag.pk for tag in rng.choices(tag_rows, tag_weights, k=count)}
+                links.extend(through(timeentry_id=entry.pk, tag_id=tag_id) for tag_id in picked)
+            through.objects.bulk_create(links)
+    rollups.rebuild(users=created)
+    tag_usage.reconcile(users=created)
+    search.rebuild(users=created)
+    return created
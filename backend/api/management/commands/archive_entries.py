@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api import archive, buckets
+
+
+class Command(BaseCommand):
+    help = 'Move finished time entries older than the archive horizon to the archive table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', help='Username to archive (repeatable). Defaults to all users.')
+        parser.add_argument('--days', type=int, help='Archive entries starting more than this many days ago. Defaults to ARCHIVE["HORIZON_DAYS"].')
+        parser.add_argument('--before', help='Archive entries starting before this date/time (UTC unless it has an offset).')
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        if options['before'] and options['days'] is not None:
+            raise CommandError('Pass --before or --days, not both.')
+        try:
+            before = buckets.parse_bound(options['before'], buckets.UTC)
+        except buckets.InvalidBound as e:
+            raise CommandError(str(e))
+        before = before or archive.horizon(days=options['days'])
+        users = None
+        if options['users']:
+            users = User.objects.filter(username__in=options['users'])
+        moved = archive.archive(before, users, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} entries starting before {before.isoformat()}.'))
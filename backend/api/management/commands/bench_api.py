@@ -0,0 +1,63 @@
+import json
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api import benchmarks, loadgen
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the main API endpoints (p50/p95 latency, queries, peak memory). '
+        'Without --username a dataset is generated and rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Benchmark an existing user, e.g. one made by seed_load.')
+        parser.add_argument('--entries', type=int, default=10000, help='Entries to generate when no --username is given.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--only', action='append', help='Only run scenarios with this name prefix. Repeatable.')
+        parser.add_argument('--output', '-o', help='Write results to this JSON baseline file.')
+        parser.add_argument('--compare', help='Compare against this JSON baseline; exit non-zero on regressions.')
+        parser.add_argument(
+            '--latency-tolerance', type=float,
+            help='Relative p50/p95 slack for --compare (default 0.25/0.5). Raise it on noisy machines.',
+        )
+
+    def handle(self, *args, **options):
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {options["username"]!r}.')
+            results = benchmarks.run(user, options['repeat'], options['only'])
+        else:
+            try:
+                with transaction.atomic():
+                    [user] = loadgen.seed(entries=options['entries'], prefix='bench-api')
+                    results = benchmarks.run(user, options['repeat'], options['only'])
+                    raise Rollback
+            except Rollback:
+                pass
+        for name, metrics in results.items():
+            self.stdout.write(
+                f'{name:>26}: p50 {metrics["p50_ms"]:8.1f} ms   p95 {metrics["p95_ms"]:8.1f} ms'
+                f'   {metrics["queries"]:3d} queries   peak {metrics["peak_kb"]:9,.0f} KiB'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write('\n')
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            tolerance = None
+            if options['latency_tolerance'] is not None:
+                tolerance = {'p50_ms': options['latency_tolerance'], 'p95_ms': options['latency_tolerance']}
+            regressions = benchmarks.compare(baseline, results, tolerance)
+            if regressions:
+                raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
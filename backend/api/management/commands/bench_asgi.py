@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+from api import benchmarks
+
+# The endpoints with async implementations
+ASYNC_SCENARIOS = ('reports.', 'calendar.', 'time_entries.', 'projects.', 'tags.', 'clients.')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/second of the async endpoints through the WSGI and ASGI handlers '
+        'at the same concurrency. Needs committed data (see seed_load) and JWT authentication.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User whose data is requested, e.g. load-0 from seed_load.')
+        parser.add_argument('--concurrency', type=int, default=8, help='WSGI threads, or ASGI requests in flight.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and mode.')
+        parser.add_argument('--only', action='append', help='Only run scenarios with this name prefix. Repeatable.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named {options["username"]!r}.')
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        prefixes = options['only'] or ASYNC_SCENARIOS
+        for name, path, params, cold in benchmarks.scenarios(user):
+            if not any(name.startswith(prefix) for prefix in prefixes):
+                continue
+            rates = {
+                mode: benchmarks.throughput(
+                    mode, path, params, headers, options['concurrency'], options['requests'], cold,
+                )
+                for mode in ('wsgi', 'asgi')
+            }
+            self.stdout.write(
+                f'{name:>26}: wsgi {rates["wsgi"]:8.1f} req/s   asgi {rates["asgi"]:8.1f} req/s'
+                f'   {rates["asgi"] / rates["wsgi"]:5.2f}x'
+            )
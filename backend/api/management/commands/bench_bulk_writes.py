@@ -0,0 +1,49 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIClient
+from api.models import Tag
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare per-object and /bulk/ time entry writes. All data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = options['count']
+        results = {}
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user('bench-bulk-writes')
+                tag = Tag.objects.create(user=user, name='bench')
+                api = APIClient()
+                api.force_authenticate(user)
+                items = [
+                    {
+                        'user': user.id, 'description': f'entry {i}', 'duration': 1800, 'tags': [tag.id],
+                        'start_time': f'2025-01-{i % 28 + 1:02d}T{i % 24:02d}:00:00Z',
+                        'end_time': f'2025-01-{i % 28 + 1:02d}T{i % 24:02d}:30:00Z',
+                    }
+                    for i in range(count)
+                ]
+                started = time.perf_counter()
+                for item in items:
+                    api.post('/api/time-entries/', item, format='json')
+                results['per-object'] = time.perf_counter() - started
+                started = time.perf_counter()
+                for offset in range(0, count, 1000):
+                    api.post('/api/time-entries/bulk/', items[offset:offset + 1000], format='json')
+                results['bulk'] = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        for name, elapsed in results.items():
+            self.stdout.write(f'{name:>10}: {count} entries in {elapsed:.3f}s ({count / elapsed:,.0f} entries/s)')
+        self.stdout.write(f'speedup: {results["per-object"] / results["bulk"]:.1f}x')
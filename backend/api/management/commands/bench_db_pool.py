@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the per-request cost of opening a database connection with taking one '
+        'from the connection pool (api.db_pool), against a configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to connect to.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Threads, each like a worker thread.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per mode.')
+
+    def handle(self, *args, **options):
+        if options['database'] not in connections:
+            raise CommandError(f'No database named {options["database"]!r}.')
+        settings_dict = connections[options['database']].settings_dict
+        results = {
+            mode: benchmarks.connection_latency(
+                settings_dict, mode == 'pooled', options['requests'], options['concurrency'],
+            )
+            for mode in ('direct', 'pooled')
+        }
+        for mode, result in results.items():
+            self.stdout.write(
+                f'{mode:>6}: p50 {result["p50_ms"]:8.3f} ms   p95 {result["p95_ms"]:8.3f} ms'
+                f'   {result["per_second"]:9.1f} req/s'
+            )
+        self.stdout.write(f'pooled p50 is {results["direct"]["p50_ms"] / results["pooled"]["p50_ms"]:.2f}x faster')
@@ -0,0 +1,49 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api import benchmarks, compression, loadgen
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare payload sizes and render times of the JSON, columnar JSON and MessagePack '
+        'renderers, raw and compressed. Without --username a dataset is generated and rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Benchmark an existing user, e.g. one made by seed_load.')
+        parser.add_argument('--entries', type=int, default=10000, help='Entries to generate when no --username is given.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--only', action='append', help='Only run scenarios with this name prefix. Repeatable.')
+
+    def handle(self, *args, **options):
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {options["username"]!r}.')
+            results = benchmarks.payload_sizes(user, options['repeat'], options['only'])
+        else:
+            try:
+                with transaction.atomic():
+                    [user] = loadgen.seed(entries=options['entries'], prefix='bench-renderers')
+                    results = benchmarks.payload_sizes(user, options['repeat'], options['only'])
+                    raise Rollback
+            except Rollback:
+                pass
+        encodings = [name for name, _stream in compression.codecs()]
+        for name, formats in results.items():
+            self.stdout.write(name)
+            baseline = formats['json']
+            for renderer_name, row in formats.items():
+                line = (
+                    f'  {renderer_name:>9}: {row["bytes"]:>10,} B ({row["bytes"] / baseline["bytes"]:6.1%})'
+                    f'   render {row["render_ms"]:8.2f} ms'
+                )
+                for encoding in encodings:
+                    line += f'   {encoding} {row[f"{encoding}_bytes"]:>9,} B in {row[f"{encoding}_ms"]:6.2f} ms'
+                self.stdout.write(line)
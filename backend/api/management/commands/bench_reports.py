@@ -0,0 +1,98 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from api import reports, rollups
+from api.models import Client, Project, Tag, TimeEntry
+
+
+def legacy_report(entries):
+    """The original five-query ReportsView implementation, kept as a baseline."""
+    total_duration = entries.aggregate(Sum('duration'))['duration__sum'] or 0
+    total_entries = entries.count()
+    project_stats = entries.values('project__name').annotate(total=Sum('duration'))
+    client_stats = entries.values('client__name').annotate(total=Sum('duration'))
+    daily_stats = entries.annotate(date=TruncDate('start_time')).values('date').annotate(total=Sum('duration')).order_by('date')
+    return {
+        'total_duration': total_duration,
+        'total_entries': total_entries,
+        'project_stats': list(project_stats),
+        'client_stats': list(client_stats),
+        'daily_stats': list(daily_stats),
+    }
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare report latency: legacy five-query path, single-pass engine and rollup. Data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = self.generate(options['entries'], options['batch_size'])
+                self.run(user, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def generate(self, count, batch_size):
+        rng = random.Random(42)
+        user = User.objects.create_user('bench-reports')
+        clients = [Client.objects.create(user=user, name=f'Client {i}', email=f'c{i}@bench.test', status='active') for i in range(10)]
+        projects = [Project.objects.create(user=user, name=f'Project {i}', client=rng.choice(clients), status='active') for i in range(40)]
+        tags = [Tag.objects.create(user=user, name=f'tag {i}') for i in range(15)]
+        origin = datetime(2022, 1, 1, tzinfo=dt_timezone.utc)
+        through = TimeEntry.tags.through
+        started = time.perf_counter()
+        for offset in range(0, count, batch_size):
+            batch = []
+            for _ in range(min(batch_size, count - offset)):
+                project = rng.choice(projects)
+                start = origin + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))
+                duration = rng.randrange(300, 4 * 3600)
+                batch.append(TimeEntry(
+                    user=user, description='bench', project=project, client=project.client,
+                    start_time=start, end_time=start + timedelta(seconds=duration), duration=duration,
+                ))
+            TimeEntry.objects.bulk_create(batch)
+            through.objects.bulk_create([
+                through(timeentry_id=entry.pk, tag_id=tag.pk)
+                for entry in batch for tag in rng.sample(tags, rng.randrange(3))
+            ])
+        rollups.rebuild(users=[user])
+        self.stdout.write(f'generated {count:,} entries in {time.perf_counter() - started:.1f}s')
+        return user
+
+    def time(self, label, repeat, func):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        self.stdout.write(f'{label:>34}: p50 {statistics.median(samples) * 1000:8.1f} ms   min {min(samples) * 1000:8.1f} ms')
+        return statistics.median(samples)
+
+    def run(self, user, repeat):
+        entries = TimeEntry.objects.filter(user=user)
+        year = entries.filter(start_time__gte='2023-01-01T00:00:00Z', start_time__lt='2024-01-01T00:00:00Z')
+        for label, queryset in (('all entries', entries), ('one year', year)):
+            self.stdout.write(label)
+            legacy = self.time('legacy (5 queries)', repeat, lambda: legacy_report(queryset))
+            engine = self.time('engine (1 query)', repeat, lambda: reports.entry_report(queryset))
+            self.time('engine + week/hour/tag', repeat, lambda: reports.entry_report(queryset, reports.BREAKDOWNS))
+            self.stdout.write(f'{"engine speedup":>34}: {legacy / engine:.2f}x')
+        self.time('rollup, all entries', repeat, lambda: rollups.report(user))
+        self.time('rollup, one year', repeat, lambda: rollups.report(user, start='2023-01-01', end='2024-01-01'))
@@ -0,0 +1,45 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api import benchmarks, loadgen
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare rows/second of the DRF list serializers and the values serializers of api.fast_serializers. '
+        'Without --username a dataset is generated and rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Benchmark an existing user, e.g. one made by seed_load.')
+        parser.add_argument('--entries', type=int, default=10000, help='Entries to generate when no --username is given.')
+        parser.add_argument('--limit', type=int, help='Serialize at most this many rows per scenario.')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--only', action='append', help='Only run scenarios with this name prefix. Repeatable.')
+
+    def handle(self, *args, **options):
+        arguments = (options['repeat'], options['limit'], options['only'])
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {options["username"]!r}.')
+            results = benchmarks.serializer_throughput(user, *arguments)
+        else:
+            try:
+                with transaction.atomic():
+                    [user] = loadgen.seed(entries=options['entries'], prefix='bench-serializers')
+                    results = benchmarks.serializer_throughput(user, *arguments)
+                    raise Rollback
+            except Rollback:
+                pass
+        for name, row in results.items():
+            speedup = row['values'] / row['drf'] if row['drf'] else 0
+            self.stdout.write(
+                f'{name:<20} {row["rows"]:>8,} rows   drf {row["drf"]:>10,} rows/s'
+                f'   values {row["values"]:>10,} rows/s   ({speedup:.1f}x)'
+            )
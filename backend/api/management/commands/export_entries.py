@@ -0,0 +1,39 @@
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api import archive, export
+
+
+class Command(BaseCommand):
+    help = 'Stream a user\'s time entries as CSV, JSON Lines or Parquet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=sorted(export.STREAMS), default='csv')
+        parser.add_argument('--start', help='Only entries starting at or after this date/time.')
+        parser.add_argument('--end', help='Only entries starting before this date/time.')
+        parser.add_argument('--output', '-o', help='File to write. Defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named {options["username"]!r}.')
+        try:
+            entries = export.export_querysets(user, options['start'], options['end'], archive.archived_before(user.pk))
+            rows = export.iter_rows(entries, chunk_size=options['chunk_size'])
+            content = export.stream(options['format'], rows)
+        except export.ExportError as e:
+            raise CommandError(str(e))
+        binary = options['format'] == 'parquet'
+        if not options['output']:
+            for part in content:
+                if binary:
+                    sys.stdout.buffer.write(part)
+                else:
+                    self.stdout.write(part, ending='')
+            return
+        with open(options['output'], 'wb' if binary else 'w', newline=None if binary else '') as out:
+            for part in content:
+                out.write(part)
@@ -0,0 +1,15 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from api import sync
+
+
+class Command(BaseCommand):
+    help = 'Delete sync tombstones older than the retention window.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Override SYNC_TOMBSTONE_RETENTION_DAYS.')
+
+    def handle(self, *args, **options):
+        older_than = timedelta(days=options['days']) if options['days'] else None
+        deleted = sync.prune(older_than)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstones.'))
@@ -0,0 +1,18 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DailyRollup table from raw time entries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', help='Username to rebuild (repeatable). Defaults to all users.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        users = None
+        if options['users']:
+            users = User.objects.filter(username__in=options['users'])
+        rows = rollups.rebuild(users=users, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows.'))
@@ -0,0 +1,17 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from api import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of entries, projects and clients.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', help='Username to reindex (repeatable). Defaults to all users.')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['users']:
+            users = User.objects.filter(username__in=options['users'])
+        written = search.rebuild(users=users)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {written} documents.'))
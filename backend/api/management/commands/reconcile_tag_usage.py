@@ -0,0 +1,17 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from api import tag_usage
+
+
+class Command(BaseCommand):
+    help = 'Recount Tag.usage_count from the entry/tag links and repair any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', help='Username to reconcile (repeatable). Defaults to all users.')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['users']:
+            users = User.objects.filter(username__in=options['users'])
+        repaired = tag_usage.reconcile(users=users)
+        self.stdout.write(self.style.SUCCESS(f'Repaired usage counts of {repaired} tags.'))
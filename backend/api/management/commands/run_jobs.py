@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (reports, weekly report emails) in a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, help='Worker processes; 0 runs jobs in this process. Defaults to JOBS["PROCESSES"].')
+        parser.add_argument('--poll', type=float, help='Seconds between queue checks when idle. Defaults to JOBS["POLL_SECONDS"].')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+        parser.add_argument('--no-schedule', action='store_false', dest='schedule', help='Don\'t queue weekly report emails.')
+
+    def handle(self, *args, **options):
+        ran = jobs.work(options['processes'], options['poll'], options['once'], options['schedule'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs.'))
@@ -0,0 +1,34 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api import loadgen
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, clients, projects, tags and time entries for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--clients', type=int, default=5, help='Clients per user.')
+        parser.add_argument('--projects', type=int, default=20, help='Projects per user.')
+        parser.add_argument('--tags', type=int, default=10, help='Tags per user.')
+        parser.add_argument('--entries', type=int, default=10000, help='Time entries per user.')
+        parser.add_argument('--days', type=int, default=365, help='Spread entries over this many past days.')
+        parser.add_argument('--prefix', default='load', help='Usernames are <prefix>-<n>.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable datasets.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users named {prefix}-* already exist; pick another --prefix.')
+        started = time.perf_counter()
+        users = loadgen.seed(
+            users=options['users'], clients=options['clients'], projects=options['projects'],
+            tags=options['tags'], entries=options['entries'], days=options['days'],
+            prefix=prefix, rng_seed=options['seed'], batch_size=options['batch_size'],
+        )
+        total = len(users) * options['entries']
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users and {total:,} time entries in {time.perf_counter() - started:.1f}s.'
+        ))
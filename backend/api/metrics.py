@@ -0,0 +1,335 @@
+"""Per-request performance instrumentation.
+
+``PerformanceMiddleware`` times every request and, through
+``connection.execute_wrapper``, every database query it runs. Serializers
+report their time through ``span('serialize')``. Each request then gets a
+``Server-Timing`` header and one structured log line on ``api.perf``, and
+is added to an in-process histogram per URL name that ``MetricsView``
+serves in Prometheus text format.
+
+Slow-query logging is opt-in (``PERF_METRICS['SLOW_QUERY_MS']``). Stack
+traces are expensive, so only a sample of slow queries carry one.
+
+Histograms live in process memory: under a multi-process server each
+worker reports its own counts, which Prometheus sums on scrape.
+
+``MetricsView`` only answers requests with ``Authorization: Bearer
+<PERF_METRICS['TOKEN']>``; without a token configured it is disabled.
+Client addresses aren't checked: behind the reverse proxy they are all
+the proxy's.
+"""
+import bisect
+import contextvars
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('api.perf')
+slow_query_logger = logging.getLogger('api.perf.slow_query')
+
+# Upper bounds in seconds, as in the Prometheus client defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'LOG_REQUESTS': True,
+    'SLOW_QUERY_MS': None,
+    'SLOW_QUERY_STACK_SAMPLE_RATE': 0.1,
+    # Bearer token the Prometheus scraper sends; None disables MetricsView
+    'TOKEN': None,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PERF_METRICS', {})}
+
+
+def scrape_allowed(request):
+    """Whether ``request`` carries the metrics token."""
+    token = get_config()['TOKEN']
+    if not token:
+        return False
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.spans = {}
+        self.depth = 0
+        self.size = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def current():
+    """The metrics of the request being served, or None outside one."""
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block to the current request's ``name`` total.
+
+    Nested spans are not counted twice, so a serializer that renders nested
+    serializers only reports its own outermost call.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics.depth:
+        yield
+        return
+    metrics.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.depth -= 1
+        metrics.spans[name] = metrics.spans.get(name, 0.0) + time.perf_counter() - started
+
+
+class QueryTimer:
+    """An execute wrapper that counts queries and logs slow ones."""
+
+    def __init__(self, metrics, slow_ms=None, sample_rate=0.0):
+        self.metrics = metrics
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.queries += 1
+            self.metrics.db_seconds += elapsed
+            if self.slow_ms is not None and elapsed * 1000 >= self.slow_ms:
+                self.log_slow(sql, elapsed, context['connection'].alias)
+
+    def log_slow(self, sql, elapsed, alias):
+        record = {'db': alias, 'duration_ms': round(elapsed * 1000, 2), 'sql': sql}
+        if self.sample_rate and random.random() < self.sample_rate:
+            # Drop the frames of this wrapper and Django's cursor internals
+            record['stack'] = ''.join(traceback.format_stack(limit=25)[:-3])
+        slow_query_logger.warning(json.dumps(record))
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Request histograms and totals keyed by (URL name, method, status class)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.totals = {}
+
+    def clear(self):
+        with self._lock:
+            self.durations = {}
+            self.totals = {}
+
+    def observe(self, labels, metrics):
+        with self._lock:
+            histogram = self.durations.get(labels)
+            if histogram is None:
+                histogram = self.durations[labels] = Histogram()
+            histogram.observe(metrics.elapsed)
+            totals = self.totals.setdefault(labels, {'db_queries': 0, 'db_seconds': 0.0, 'serialize_seconds': 0.0, 'response_bytes': 0})
+            totals['db_queries'] += metrics.queries
+            totals['db_seconds'] += metrics.db_seconds
+            totals['serialize_seconds'] += metrics.spans.get('serialize', 0.0)
+            totals['response_bytes'] += metrics.size
+
+    def render(self):
+        """Everything observed so far, in the Prometheus text exposition format."""
+        with self._lock:
+            durations = {labels: (list(h.counts), h.sum) for labels, h in self.durations.items()}
+            totals = {labels: dict(values) for labels, values in self.totals.items()}
+        lines = [
+            '# HELP api_request_duration_seconds Wall time spent serving requests.',
+            '# TYPE api_request_duration_seconds histogram',
+        ]
+        for labels, (counts, total) in sorted(durations.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'api_request_duration_seconds_bucket{{{_labels(labels, le=le)}}} {cumulative}')
+            lines.append(f'api_request_duration_seconds_sum{{{_labels(labels)}}} {total!r}')
+            lines.append(f'api_request_duration_seconds_count{{{_labels(labels)}}} {cumulative}')
+        for name, help_text in (
+            ('db_queries', 'Database queries run while serving requests.'),
+            ('db_seconds', 'Time spent in the database while serving requests.'),
+            ('serialize_seconds', 'Time spent in serializers while serving requests.'),
+            ('response_bytes', 'Response body bytes sent.'),
+        ):
+            lines.append(f'# HELP api_request_{name}_total {help_text}')
+            lines.append(f'# TYPE api_request_{name}_total counter')
+            for labels, values in sorted(totals.items()):
+                lines.append(f'api_request_{name}_total{{{_labels(labels)}}} {values[name]!r}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    view, method, status = labels
+    pairs = {'view': view, 'method': method, 'status': status, **extra}
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in pairs.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def server_timing(metrics):
+    parts = [f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.queries} queries"']
+    for name, seconds in sorted(metrics.spans.items()):
+        parts.append(f'{name};dur={seconds * 1000:.1f}')
+    parts.append(f'total;dur={metrics.elapsed * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        config = get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self.timing_queries(metrics, config):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.respond(request, response, metrics, config)
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            # Connections belong to the thread the ORM runs queries in, so
+            # the wrappers are installed and removed from there too
+            queries = await sync_to_async(self.timing_queries)(metrics, config)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(queries.close)()
+        finally:
+            _current.reset(token)
+        return self.respond(request, response, metrics, config)
+
+    def respond(self, request, response, metrics, config):
+        if response.streaming:
+            # Headers go out before the body is produced, so they carry
+            # only the time to first byte; the log line waits for the end.
+            if config['SERVER_TIMING']:
+                response['Server-Timing'] = server_timing(metrics)
+            if not response.is_async:
+                response.streaming_content = self.stream(response.streaming_content, request, response, metrics, config)
+            elif self.is_async:
+                response.streaming_content = self.astream(response.streaming_content, request, response, metrics, config)
+            else:
+                # A sync server buffers async bodies elsewhere; record what we have
+                self.finish(request, response, metrics, config)
+            return response
+        metrics.size = len(response.content)
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(metrics)
+        self.finish(request, response, metrics, config)
+        return response
+
+    @staticmethod
+    def timing_queries(metrics, config):
+        stack = ExitStack()
+        timer = QueryTimer(metrics, config['SLOW_QUERY_MS'], config['SLOW_QUERY_STACK_SAMPLE_RATE'])
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        return stack
+
+    def stream(self, content, request, response, metrics, config):
+        token = _current.set(metrics)
+        try:
+            with self.timing_queries(metrics, config):
+                for chunk in content:
+                    metrics.size += len(chunk)
+                    yield chunk
+        finally:
+            _current.reset(token)
+            self.finish(request, response, metrics, config)
+
+    async def astream(self, content, request, response, metrics, config):
+        token = _current.set(metrics)
+        try:
+            queries = await sync_to_async(self.timing_queries)(metrics, config)
+            try:
+                async for chunk in content:
+                    metrics.size += len(chunk)
+                    yield chunk
+            finally:
+                await sync_to_async(queries.close)()
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Closed by the event loop's finalizer, in another context
+                pass
+            self.finish(request, response, metrics, config)
+
+    def finish(self, request, response, metrics, config):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else '<unresolved>'
+        registry.observe((view, request.method, f'{response.status_code // 100}xx'), metrics)
+        if config['LOG_REQUESTS']:
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'duration_ms': round(metrics.elapsed * 1000, 2),
+                'db_queries': metrics.queries,
+                'db_ms': round(metrics.db_seconds * 1000, 2),
+                'serialize_ms': round(metrics.spans.get('serialize', 0.0) * 1000, 2),
+                'bytes': metrics.size,
+            }))
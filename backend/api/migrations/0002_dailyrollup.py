@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-17 16:05
+
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _utc_date(value):
+    return value.astimezone(dt_timezone.utc).date()
+
+
+def populate_rollups(apps, schema_editor):
+    # A frozen copy of rollups.rebuild as of this migration: UTC days, no running timers
+    TimeEntry = apps.get_model('api', 'TimeEntry')
+    DailyRollup = apps.get_model('api', 'DailyRollup')
+    through = TimeEntry._meta.get_field('tags').remote_field.through
+    tags_by_entry = {}
+    for entry_id, tag_id in through.objects.values_list('timeentry_id', 'tag_id').iterator(chunk_size=2000):
+        tags_by_entry.setdefault(entry_id, []).append(tag_id)
+    totals = {}
+    entries = TimeEntry.objects.only('id', 'user', 'project', 'client', 'start_time', 'end_time', 'duration')
+    for entry in entries.iterator(chunk_size=2000):
+        end_date = _utc_date(entry.end_time - timedelta(microseconds=1)) if entry.end_time else None
+        key = (entry.user_id, _utc_date(entry.start_time), end_date, entry.project_id, entry.client_id)
+        for tag_id in [None, *tags_by_entry.get(entry.id, ())]:
+            duration, count = totals.get(key + (tag_id,), (0, 0))
+            totals[key + (tag_id,)] = (duration + (entry.duration or 0), count + 1)
+    DailyRollup.objects.bulk_create(
+        (DailyRollup(user_id=user_id, date=date, end_date=end_date, project_id=project_id, client_id=client_id,
+                     tag_id=tag_id, total_duration=duration, entry_count=count)
+         for (user_id, date, end_date, project_id, client_id, tag_id), (duration, count) in totals.items()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('total_duration', models.BigIntegerField(default=0)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.client')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.project')),
+                ('tag', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.tag')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'tag', 'date'], name='api_rollup_user_tag_date')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:19
+
+from datetime import timedelta, timezone as dt_timezone
+from django.db import migrations, models
+
+
+def close_extra_running_entries(apps, schema_editor):
+    # Keep each user's latest open entry running; close the others at their
+    # client-supplied duration so the one-running-timer constraint holds.
+    TimeEntry = apps.get_model('api', 'TimeEntry')
+    latest = {}
+    open_entries = TimeEntry.objects.filter(end_time__isnull=True).order_by('user_id', '-start_time', '-id')
+    for entry in open_entries.only('id', 'user_id', 'start_time', 'duration').iterator():
+        if entry.user_id not in latest:
+            latest[entry.user_id] = entry.id
+            continue
+        TimeEntry.objects.filter(pk=entry.pk).update(
+            end_time=entry.start_time + timedelta(seconds=max(entry.duration or 0, 0))
+        )
+
+
+def populate_running_since(apps, schema_editor):
+    # A frozen copy of rollups.rebuild as of this migration: UTC days, running timers keyed by their start
+    TimeEntry = apps.get_model('api', 'TimeEntry')
+    DailyRollup = apps.get_model('api', 'DailyRollup')
+    through = TimeEntry._meta.get_field('tags').remote_field.through
+    tags_by_entry = {}
+    for entry_id, tag_id in through.objects.values_list('timeentry_id', 'tag_id').iterator(chunk_size=2000):
+        tags_by_entry.setdefault(entry_id, []).append(tag_id)
+    totals = {}
+    entries = TimeEntry.objects.only('id', 'user', 'project', 'client', 'start_time', 'end_time', 'duration')
+    for entry in entries.iterator(chunk_size=2000):
+        tz = dt_timezone.utc
+        end_date = (entry.end_time - timedelta(microseconds=1)).astimezone(tz).date() if entry.end_time else None
+        running_since = entry.start_time if entry.end_time is None else None
+        key = (entry.user_id, entry.start_time.astimezone(tz).date(), end_date, entry.project_id, entry.client_id, running_since)
+        # A running timer's time is added live by reports
+        stored = 0 if entry.end_time is None else entry.duration or 0
+        for tag_id in [None, *tags_by_entry.get(entry.id, ())]:
+            duration, count = totals.get(key + (tag_id,), (0, 0))
+            totals[key + (tag_id,)] = (duration + stored, count + 1)
+    DailyRollup.objects.all().delete()
+    DailyRollup.objects.bulk_create(
+        (DailyRollup(user_id=user_id, date=date, end_date=end_date, project_id=project_id, client_id=client_id,
+                     running_since=running_since, tag_id=tag_id, total_duration=duration, entry_count=count)
+         for (user_id, date, end_date, project_id, client_id, running_since, tag_id), (duration, count) in totals.items()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_sync_updated_at_tombstones'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_extra_running_entries, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='dailyrollup',
+            name='running_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='timeentry',
+            constraint=models.UniqueConstraint(condition=models.Q(('end_time__isnull', True)), fields=('user',), name='api_entry_one_running'),
+        ),
+        migrations.RunPython(populate_running_since, migrations.RunPython.noop),
+    ]
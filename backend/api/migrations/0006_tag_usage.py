@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:38
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_usage(apps, schema_editor):
+    # A frozen copy of tag_usage.reconcile as of this migration
+    Tag = apps.get_model('api', 'Tag')
+    TimeEntry = apps.get_model('api', 'TimeEntry')
+    through = TimeEntry._meta.get_field('tags').remote_field.through
+    links = through.objects.filter(tag=OuterRef('pk')).order_by().values('tag')
+    Tag.objects.update(
+        usage_count=Coalesce(Subquery(links.annotate(n=Count('*')).values('n')), Value(0)),
+        last_used_at=Subquery(links.annotate(latest=Max('timeentry__start_time')).values('latest')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_running_timer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='last_used_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-usage_count'], name='api_tag_user_usage'),
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+    ]
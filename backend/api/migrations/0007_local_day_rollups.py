@@ -0,0 +1,54 @@
+from datetime import timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.db import migrations
+
+UTC = ZoneInfo('UTC')
+
+
+def _zone(name):
+    try:
+        return ZoneInfo(name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        return UTC
+
+
+def rebuild_in_local_days(apps, schema_editor):
+    # A frozen copy of rollups.rebuild as of this migration: days in each user's timezone
+    TimeEntry = apps.get_model('api', 'TimeEntry')
+    DailyRollup = apps.get_model('api', 'DailyRollup')
+    Settings = apps.get_model('api', 'Settings')
+    zones = {user_id: _zone(name) for user_id, name in Settings.objects.values_list('user_id', 'timezone')}
+    through = TimeEntry._meta.get_field('tags').remote_field.through
+    tags_by_entry = {}
+    for entry_id, tag_id in through.objects.values_list('timeentry_id', 'tag_id').iterator(chunk_size=2000):
+        tags_by_entry.setdefault(entry_id, []).append(tag_id)
+    totals = {}
+    entries = TimeEntry.objects.only('id', 'user', 'project', 'client', 'start_time', 'end_time', 'duration')
+    for entry in entries.iterator(chunk_size=2000):
+        tz = zones.get(entry.user_id, UTC)
+        end_date = (entry.end_time - timedelta(microseconds=1)).astimezone(tz).date() if entry.end_time else None
+        running_since = entry.start_time if entry.end_time is None else None
+        key = (entry.user_id, entry.start_time.astimezone(tz).date(), end_date, entry.project_id, entry.client_id, running_since)
+        # A running timer's time is added live by reports
+        stored = 0 if entry.end_time is None else entry.duration or 0
+        for tag_id in [None, *tags_by_entry.get(entry.id, ())]:
+            duration, count = totals.get(key + (tag_id,), (0, 0))
+            totals[key + (tag_id,)] = (duration + stored, count + 1)
+    DailyRollup.objects.all().delete()
+    DailyRollup.objects.bulk_create(
+        (DailyRollup(user_id=user_id, date=date, end_date=end_date, project_id=project_id, client_id=client_id,
+                     running_since=running_since, tag_id=tag_id, total_duration=duration, entry_count=count)
+         for (user_id, date, end_date, project_id, client_id, running_since, tag_id), (duration, count) in totals.items()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_tag_usage'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_in_local_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db import migrations
+
+# A frozen copy of api.search's index as of this migration.
+# resource code, model, title fields, body fields
+RESOURCES = (
+    (1, 'TimeEntry', ('description',), ()),
+    (2, 'Project', ('name',), ('description',)),
+    (3, 'Client', ('name', 'company'), ('notes',)),
+)
+
+
+def _documents(apps):
+    for code, model_name, title_fields, body_fields in RESOURCES:
+        rows = apps.get_model('api', model_name).objects.order_by()
+        for pk, user_id, *values in rows.values_list('pk', 'user_id', *title_fields, *body_fields).iterator(chunk_size=2000):
+            values = [value or '' for value in values]
+            split = len(title_fields)
+            yield pk * 4 + code, f'u{user_id}', ' '.join(values[:split]), ' '.join(values[split:])
+
+
+def _batches(documents, size=2000):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS api_search USING fts5("
+                "owner, title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            for batch in _batches(_documents(apps)):
+                cursor.executemany('INSERT OR REPLACE INTO api_search (rowid, owner, title, body) VALUES (%s, %s, %s, %s)', batch)
+        elif connection.vendor == 'postgresql':
+            language = getattr(settings, 'SEARCH', {}).get('LANGUAGE', 'simple')
+            cursor.execute('CREATE TABLE IF NOT EXISTS api_search (id bigint PRIMARY KEY, document tsvector NOT NULL)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS api_search_document ON api_search USING gin (document)')
+            for batch in _batches(_documents(apps)):
+                cursor.executemany(
+                    "INSERT INTO api_search (id, document) VALUES (%s, "
+                    "setweight(to_tsvector('simple', %s), 'D') || "
+                    "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+                    "setweight(to_tsvector(%s::regconfig, %s), 'B')) "
+                    "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document",
+                    [(doc_id, owner, language, title, language, body) for doc_id, owner, title, body in batch],
+                )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS api_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_local_day_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def create_missing_settings(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    Settings = apps.get_model('api', 'Settings')
+    missing = User.objects.filter(settings__isnull=True).values_list('pk', flat=True)
+    Settings.objects.bulk_create([Settings(user_id=user_id) for user_id in missing])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_settings, migrations.RunPython.noop),
+    ]
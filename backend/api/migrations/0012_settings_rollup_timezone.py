@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+def rollups_match_timezones(apps, schema_editor):
+    # Timezone changes rebuilt the rollup inline until now, so every row is current
+    Settings = apps.get_model('api', 'Settings')
+    Settings.objects.update(rollup_timezone=models.F('timezone'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='settings',
+            name='rollup_timezone',
+            field=models.CharField(default='UTC', max_length=100),
+        ),
+        migrations.RunPython(rollups_match_timezones, migrations.RunPython.noop),
+    ]
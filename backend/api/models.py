@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Client(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -11,6 +12,12 @@ class Client(models.Model):
     notes = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=[('active', 'Active'), ('inactive', 'Inactive')])
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='api_client_user_updated'),
+        ]
 
 class Project(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -21,6 +28,13 @@ class Project(models.Model):
     description = models.TextField(blank=True)
     due_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'due_date'], name='api_project_user_due'),
+            models.Index(fields=['user', 'updated_at'], name='api_project_user_updated'),
+        ]
 
 class Tag(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -28,7 +42,15 @@ class Tag(models.Model):
     color = models.CharField(max_length=20, default="#3b82f6")
     description = models.TextField(blank=True)
     usage_count = models.IntegerField(default=0)
+    last_used_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='api_tag_user_updated'),
+            models.Index(fields=['user', '-usage_count'], name='api_tag_user_usage'),
+        ]
 
 class TimeEntry(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -40,6 +62,41 @@ class TimeEntry(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     duration = models.IntegerField(default=0)  # in seconds
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start_time'], name='api_entry_user_start'),
+            models.Index(fields=['user', 'project', 'start_time'], name='api_entry_user_proj_start'),
+            models.Index(fields=['user', 'updated_at'], name='api_entry_user_updated'),
+        ]
+        constraints = [
+            # A row without end_time is a running timer; at most one per user.
+            # The partial index also makes "current timer" a single lookup.
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(end_time__isnull=True), name='api_entry_one_running',
+            ),
+        ]
+
+class ArchivedTimeEntry(models.Model):
+    # Finished TimeEntry rows older than the archive horizon, moved here with
+    # their ids by api.archive. Same fields, so report and calendar code reads
+    # either table, but one index and no auto_now: rows keep their timestamps.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    description = models.CharField(max_length=255)
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
+    client = models.ForeignKey(Client, on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
+    tags = models.ManyToManyField(Tag, blank=True, related_name='archived_entries')
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    duration = models.IntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start_time'], name='api_archived_user_start'),
+        ]
 
 class Settings(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -53,4 +110,67 @@ class Settings(models.Model):
     weekly_reports = models.BooleanField(default=True)
     time_format = models.CharField(max_length=10, default="24h")
     date_format = models.CharField(max_length=20, default="MM/DD/YYYY")
-    theme = models.CharField(max_length=20, default="system")
\ No newline at end of file
+    theme = models.CharField(max_length=20, default="system")
+    # Entries starting before this were moved to ArchivedTimeEntry (see api.archive)
+    archived_before = models.DateTimeField(null=True, blank=True)
+    # The timezone DailyRollup rows are keyed in; differs from timezone until
+    # the rebuild queued by a timezone change has run (see api.rollups)
+    rollup_timezone = models.CharField(max_length=100, default="UTC")
+    updated_at = models.DateTimeField(auto_now=True)
+
+class Tombstone(models.Model):
+    # Records deletions so /api/sync/ can report them to clients
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    resource = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='api_tombstone_user_deleted'),
+        ]
+
+class DailyRollup(models.Model):
+    # Pre-aggregated TimeEntry totals per local day in the user's
+    # Settings.timezone, maintained by api.signals.
+    # Rows with tag=None count every entry once; rows with a tag hold the
+    # same figures restricted to entries carrying that tag.
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True)
+    client = models.ForeignKey(Client, on_delete=models.SET_NULL, null=True, blank=True)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, null=True, blank=True)
+    # Start of the running timer counted in this row, which adds live time to reports
+    running_since = models.DateTimeField(null=True, blank=True)
+    total_duration = models.BigIntegerField(default=0)
+    entry_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'tag', 'date'], name='api_rollup_user_tag_date'),
+        ]
+
+class Job(models.Model):
+    # A unit of background work run by manage.py run_jobs; see api.jobs
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, default='queued', choices=[
+        ('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'),
+    ])
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    # Jobs with a key are enqueued at most once, e.g. one weekly report per user and week
+    key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='api_job_status_run_after'),
+            models.Index(fields=['user', '-created_at'], name='api_job_user_created'),
+        ]
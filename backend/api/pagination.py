@@ -0,0 +1,123 @@
+import base64
+import json
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination over ``(start_time, id)`` with opaque cursors.
+
+    Pagination is opt-in: it applies when the request carries ``cursor`` or
+    ``page_size``, so plain list requests keep returning a bare array.
+    Pass ``ordering=-start_time`` for newest-first pages.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    time_field = 'start_time'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @property
+    def page_size(self):
+        return getattr(settings, 'TIME_ENTRY_PAGE_SIZE', 100)
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'TIME_ENTRY_MAX_PAGE_SIZE', 1000)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.page_rows(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.page_rows([row async for row in queryset])
+
+    def page_queryset(self, queryset, request):
+        """The queryset for the requested page plus one row, or None if not paginating."""
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        position, self.descending = self.decode_cursor(request)
+        if position is None:
+            self.descending = params.get(self.ordering_query_param) == '-' + self.time_field
+        field = self.time_field
+        if self.descending:
+            queryset = queryset.order_by('-' + field, '-id')
+        else:
+            queryset = queryset.order_by(field, 'id')
+        if position is not None:
+            moment, pk = position
+            op = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{op}': moment}) | Q(**{field: moment, f'id__{op}': pk})
+            )
+        return queryset[:self.page_size_value + 1]
+
+    def page_rows(self, rows):
+        self.has_next = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            moment, pk, descending = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            moment = parse_datetime(moment)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if moment is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (moment, pk), bool(descending)
+
+    def encode_cursor(self, row):
+        # row is a model instance or a named values_list() row
+        payload = json.dumps([getattr(row, self.time_field).isoformat(), row.id, self.descending])
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii').rstrip('=')
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.ordering_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
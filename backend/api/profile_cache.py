@@ -0,0 +1,105 @@
+"""Cached per-user Settings and profile payloads.
+
+The frontend reads ``/api/settings/`` on nearly every page, and every
+timezone-aware view needs ``Settings.timezone``. The serialized Settings
+and ``/api/user/`` payloads are kept in the report cache backend, keyed by
+user id. On top of that they are memoized on the request, so one request
+reads them at most once.
+
+That backend must be shared by every worker (production configures one;
+see ``api.report_cache``). With the per-process ``locmem`` default, a
+Settings change made through one worker would not reach the others until
+``REPORT_CACHE['TIMEOUT']``, so it is only correct with a single worker.
+
+Signals drop the keys when a Settings row or a user is saved. They drop
+them again when the transaction commits, so a reader that ran in between
+can't leave behind a copy from before the commit. Queryset updates bypass
+the signals; callers that issue one call ``forget_settings``.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from . import report_cache
+from .models import Settings
+from .serializers import SettingsSerializer, UserSerializer
+
+
+def _settings_key(user_id):
+    return f'settings:{user_id}'
+
+
+def _profile_key(user_id):
+    return f'profile:{user_id}'
+
+
+def _memo(request):
+    if request is None:
+        return {}
+    memo = getattr(request, '_profile_cache', None)
+    if memo is None:
+        memo = request._profile_cache = {}
+    return memo
+
+
+def load_settings(user_id):
+    """The user's Settings row, created on the spot for users that predate eager creation."""
+    return Settings.objects.get_or_create(user_id=user_id)[0]
+
+
+def get_settings(user_id, request=None):
+    """The user's serialized Settings, as ``/api/settings/`` returns them."""
+    memo, key = _memo(request), _settings_key(user_id)
+    if key not in memo:
+        backend = report_cache.get_cache().backend
+        payload = backend.get_many([key]).get(key)
+        if payload is None:
+            payload = dict(SettingsSerializer(load_settings(user_id)).data)
+            backend.set_many({key: payload})
+        memo[key] = payload
+    return memo[key]
+
+
+async def aget_settings(user_id, request=None):
+    memo, key = _memo(request), _settings_key(user_id)
+    if key not in memo:
+        backend = report_cache.get_cache().backend
+        payload = (await backend.aget_many([key])).get(key)
+        if payload is None:
+            row = await Settings.objects.aget_or_create(user_id=user_id)
+            payload = dict(SettingsSerializer(row[0]).data)
+            await backend.aset_many({key: payload})
+        memo[key] = payload
+    return memo[key]
+
+
+def get_profile(user, request=None):
+    """The ``/api/user/`` payload of ``user``."""
+    memo, key = _memo(request), _profile_key(user.pk)
+    if key not in memo:
+        backend = report_cache.get_cache().backend
+        payload = backend.get_many([key]).get(key)
+        if payload is None:
+            payload = dict(UserSerializer(user).data)
+            backend.set_many({key: payload})
+        memo[key] = payload
+    return memo[key]
+
+
+def _forget(key):
+    backend = report_cache.get_cache().backend
+    backend.set_many({key: None})
+    transaction.on_commit(lambda: backend.set_many({key: None}))
+
+
+def forget_settings(user_id):
+    _forget(_settings_key(user_id))
+
+
+def forget_profile(user_id):
+    _forget(_profile_key(user_id))
+
+
+def create_missing_settings():
+    """Give every user without a Settings row a default one. Returns how many were made."""
+    missing = User.objects.filter(settings__isnull=True).values_list('pk', flat=True)
+    created = Settings.objects.bulk_create([Settings(user_id=user_id) for user_id in missing])
+    return len(created)
@@ -0,0 +1,66 @@
+"""Compact response formats, chosen per request.
+
+JSON stays the default. A client opts into another format with an
+``Accept`` header or ``?format=``:
+
+- ``application/vnd.columnar+json`` (``?format=columnar``): JSON with
+  every list of like-shaped objects turned into ``{"columns": {field:
+  [values...]}}``, so a field name appears once per list, not once per
+  row. Lists nested in a row's values are converted the same way.
+- ``application/msgpack`` (``?format=msgpack``): MessagePack, with
+  dates, decimals and UUIDs encoded as the JSON renderer encodes them.
+  Needs the optional ``msgpack`` package; without it the format is not
+  offered and asking for it gets a 406.
+
+``api.compression`` compresses any of them per ``Accept-Encoding``.
+"""
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def columnar(data):
+    """``data`` with each list of dicts sharing the same keys turned into columns."""
+    if isinstance(data, dict):
+        return {key: columnar(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        if data and all(isinstance(row, dict) for row in data):
+            fields = data[0].keys()
+            if all(row.keys() == fields for row in data):
+                return {'columns': {field: columnar([row[field] for row in data]) for field in fields}}
+        return [columnar(item) for item in data]
+    return data
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    available = msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
+
+
+class ContentNegotiation(DefaultContentNegotiation):
+    """Leaves out renderers whose optional dependency is missing."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderers = [renderer for renderer in renderers if getattr(renderer, 'available', True)]
+        return super().select_renderer(request, renderers, format_suffix)
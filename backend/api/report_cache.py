@@ -0,0 +1,392 @@
+"""Cache for report and calendar payloads.
+
+Cached payloads are never deleted directly. Each one records the version
+stamps of the things it depends on (a user's days, months, all of their
+entries, or their projects/clients/tags), and invalidation just writes a
+new stamp. That keeps invalidation precise and works with any Django cache
+backend, which can't enumerate keys. The stamps also yield the ETag and
+Last-Modified validators, so a 304 never needs the database.
+
+Stamps live apart from the payloads, so caching many payloads can't evict
+them. A stamp that goes missing anyway (a shared cache evicting it, or a
+restart) is replaced by a new one on the next read, never treated as
+"unchanged": payloads and ETags from before then no longer match.
+
+The default ``locmem`` backend lives in one process. A stamp written by one
+worker never reaches the others, which keep serving the old payloads (with
+ETags that still validate) until ``TIMEOUT``. It is only correct with a
+single worker process. Production sets ``REPORT_CACHE['BACKEND'] = 'django'``
+over a shared cache, and ``manage.py check --deploy`` warns otherwise.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core import checks
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+# Ranges longer than this depend on month stamps instead of day stamps
+MAX_DAY_STAMPS = 31
+
+
+class LocMemLRUBackend:
+    def __init__(self, max_entries=2048, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                value, expires_at = item
+                if expires_at is not None and expires_at <= now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, mapping, timeout=-1):
+        timeout = self.timeout if timeout == -1 else timeout
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (value, expires_at)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add_many(self, mapping, timeout=-1):
+        """Set the keys of ``mapping`` that have no live value."""
+        found = self.get_many(mapping)
+        self.set_many({key: value for key, value in mapping.items() if key not in found}, timeout)
+
+    # In-process and lock-guarded, so the async API can simply call through
+    async def aget_many(self, keys):
+        return self.get_many(keys)
+
+    async def aset_many(self, mapping, timeout=-1):
+        self.set_many(mapping, timeout)
+
+    async def aadd_many(self, mapping, timeout=-1):
+        self.add_many(mapping, timeout)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend:
+    def __init__(self, alias='default', timeout=300, key_prefix='reports'):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def _key(self, key):
+        return f'{self.key_prefix}:{key}'
+
+    def get_many(self, keys):
+        found = self.cache.get_many([self._key(key) for key in keys])
+        return {key: found[self._key(key)] for key in keys if self._key(key) in found}
+
+    def set_many(self, mapping, timeout=-1):
+        timeout = self.timeout if timeout == -1 else timeout
+        self.cache.set_many({self._key(key): value for key, value in mapping.items()}, timeout)
+
+    async def aget_many(self, keys):
+        found = await self.cache.aget_many([self._key(key) for key in keys])
+        return {key: found[self._key(key)] for key in keys if self._key(key) in found}
+
+    async def aset_many(self, mapping, timeout=-1):
+        timeout = self.timeout if timeout == -1 else timeout
+        await self.cache.aset_many({self._key(key): value for key, value in mapping.items()}, timeout)
+
+    # Django caches have no add_many; add is atomic per key on Redis and Memcached
+    def add_many(self, mapping, timeout=-1):
+        timeout = self.timeout if timeout == -1 else timeout
+        for key, value in mapping.items():
+            self.cache.add(self._key(key), value, timeout)
+
+    async def aadd_many(self, mapping, timeout=-1):
+        timeout = self.timeout if timeout == -1 else timeout
+        for key, value in mapping.items():
+            await self.cache.aadd(self._key(key), value, timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ReportCache:
+    def __init__(self, backend, stamp_backend=None):
+        self.backend = backend
+        self.stamp_backend = stamp_backend or backend
+
+    @staticmethod
+    def _stamp_key(user_id, dep):
+        return f'stamp:{user_id}:{dep}'
+
+    @staticmethod
+    def new_stamp():
+        return f'{time.time():.6f}:{uuid.uuid4().hex[:8]}'
+
+    def _missing(self, keys, found):
+        stamp = self.new_stamp()
+        return {key: stamp for key in keys.values() if found.get(key) is None}
+
+    def stamps(self, user_id, deps):
+        keys = {dep: self._stamp_key(user_id, dep) for dep in deps}
+        found = self.stamp_backend.get_many(keys.values())
+        missing = self._missing(keys, found)
+        if missing:
+            self.stamp_backend.add_many(missing, timeout=None)
+            # Another worker may have added its own first
+            missing.update(self.stamp_backend.get_many(missing))
+            found.update(missing)
+        return {dep: found[key] for dep, key in sorted(keys.items())}
+
+    async def astamps(self, user_id, deps):
+        keys = {dep: self._stamp_key(user_id, dep) for dep in deps}
+        found = await self.stamp_backend.aget_many(keys.values())
+        missing = self._missing(keys, found)
+        if missing:
+            await self.stamp_backend.aadd_many(missing, timeout=None)
+            missing.update(await self.stamp_backend.aget_many(missing))
+            found.update(missing)
+        return {dep: found[key] for dep, key in sorted(keys.items())}
+
+    def invalidate(self, user_id, deps):
+        stamp = self.new_stamp()
+        self.stamp_backend.set_many({self._stamp_key(user_id, dep): stamp for dep in deps}, timeout=None)
+
+    def validators(self, kind, user_id, params, stamps):
+        """Return ``(payload key, etag, last_modified)`` for the given stamps."""
+        ident = json.dumps([kind, user_id, params], sort_keys=True, default=str)
+        key = f'payload:{user_id}:' + hashlib.sha1(ident.encode('utf-8')).hexdigest()
+        etag = '"' + hashlib.sha1(json.dumps([key, stamps], sort_keys=True).encode('utf-8')).hexdigest() + '"'
+        modified = [float(stamp.split(':', 1)[0]) for stamp in stamps.values() if stamp]
+        return key, etag, max(modified) if modified else None
+
+    def fetch(self, key, stamps, compute):
+        cached = self.backend.get_many([key]).get(key)
+        if cached is not None and cached['stamps'] == stamps:
+            return cached['value'], cached['computed_at']
+        computed_at = time.time()
+        value = compute()
+        self.backend.set_many({key: {'value': value, 'stamps': stamps, 'computed_at': computed_at}})
+        return value, computed_at
+
+    async def afetch(self, key, stamps, acompute):
+        cached = (await self.backend.aget_many([key])).get(key)
+        if cached is not None and cached['stamps'] == stamps:
+            return cached['value'], cached['computed_at']
+        computed_at = time.time()
+        value = await acompute()
+        await self.backend.aset_many({key: {'value': value, 'stamps': stamps, 'computed_at': computed_at}})
+        return value, computed_at
+
+    def clear(self):
+        self.backend.clear()
+        if self.stamp_backend is not self.backend:
+            self.stamp_backend.clear()
+
+
+def parse_moment(value):
+    """Parse a filter bound into a UTC datetime, or None if it can't be parsed."""
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            try:
+                parsed = parse_date(value)
+            except ValueError:
+                return None
+        value = parsed
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=dt_timezone.utc)
+        return value.astimezone(dt_timezone.utc)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day, tzinfo=dt_timezone.utc)
+    return None
+
+
+def _days(first, last):
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+def _months(first, last):
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append(f'month:{year:04d}-{month:02d}')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def range_dependencies(start, end):
+    """Stamps a payload over entries between ``start`` and ``end`` depends on."""
+    first, last = parse_moment(start), parse_moment(end)
+    if first is None or last is None or last < first:
+        return ['entries', 'meta']
+    first, last = first.date(), last.date()
+    if (last - first).days < MAX_DAY_STAMPS:
+        return [f'day:{day.isoformat()}' for day in _days(first, last)] + ['meta']
+    return _months(first, last) + ['meta']
+
+
+def entry_dependencies(*entries):
+    """Stamps to invalidate when these (old/new) versions of an entry change.
+
+    Every range filter bounds start_time, so a payload that includes an
+    entry always covers the entry's start day.
+    """
+    deps = {'entries'}
+    for entry in entries:
+        moment = parse_moment(entry.start_time) if entry is not None else None
+        if moment is None:
+            continue
+        day = moment.date()
+        deps.add(f'day:{day.isoformat()}')
+        deps.update(_months(day, day))
+    return deps
+
+
+def invalidate(user_id, deps):
+    # Once now for reads inside this transaction, and again after commit so a
+    # payload computed concurrently from pre-commit data can't stay cached.
+    cache = get_cache()
+    deps = list(deps)
+    cache.invalidate(user_id, deps)
+    transaction.on_commit(lambda: cache.invalidate(user_id, deps))
+
+
+def cached_response(request, kind, params, deps, compute, live=None):
+    """Serve ``compute()`` through the report cache with ETag/Last-Modified.
+
+    Conditional GETs are answered with a 304 from the stamps alone. If
+    ``live`` is given it maps the payload to ``(payload to send, changes
+    over time)``. A payload that changes over time, like a report with a
+    running timer, is sent without validators and never answered with a 304.
+    """
+    cache = get_cache()
+    stamps = cache.stamps(request.user.pk, deps)
+    key, etag, last_modified = cache.validators(kind, request.user.pk, params, stamps)
+    etag = _representation(request, etag)
+    value = ticking = None
+    if live is not None:
+        value, computed_at = cache.fetch(key, stamps, compute)
+        value, ticking = live(value)
+    not_modified = None if ticking else _not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    if live is None:
+        value, computed_at = cache.fetch(key, stamps, compute)
+    return _response(value, ticking, etag, last_modified or computed_at)
+
+
+async def acached_response(request, kind, params, deps, acompute, live=None):
+    """``cached_response`` for async views; ``acompute`` is a coroutine function."""
+    cache = get_cache()
+    stamps = await cache.astamps(request.user.pk, deps)
+    key, etag, last_modified = cache.validators(kind, request.user.pk, params, stamps)
+    etag = _representation(request, etag)
+    value = ticking = None
+    if live is not None:
+        value, computed_at = await cache.afetch(key, stamps, acompute)
+        value, ticking = live(value)
+    not_modified = None if ticking else _not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    if live is None:
+        value, computed_at = await cache.afetch(key, stamps, acompute)
+    return _response(value, ticking, etag, last_modified or computed_at)
+
+
+def _representation(request, etag):
+    # Each format (see api.renderers) is a different representation with its own ETag
+    renderer_format = getattr(getattr(request, 'accepted_renderer', None), 'format', 'json')
+    return etag if renderer_format == 'json' else f'{etag[:-1]}-{renderer_format}"'
+
+
+def _not_modified(request, etag, last_modified):
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified) if last_modified else None
+    )
+    if response is not None:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def _response(value, ticking, etag, last_modified):
+    response = Response(value)
+    patch_vary_headers(response, ('Accept',))
+    if ticking:
+        response['Cache-Control'] = 'private, no-store'
+        return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def normalize_params(params, fields):
+    return {field: str(params.get(field)) for field in fields if params.get(field) not in (None, '')}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def check_shared_backend(app_configs=None, **kwargs):
+    """Deploy check: invalidation only works when every worker uses the same cache."""
+    config = getattr(settings, 'REPORT_CACHE', {})
+    if config.get('BACKEND', 'locmem') == 'django':
+        alias = config.get('ALIAS', 'default')
+        if settings.CACHES.get(alias, {}).get('BACKEND') not in PER_PROCESS_CACHES:
+            return []
+    return [checks.Warning(
+        'The report cache is per-process, so with more than one worker, invalidations and '
+        'Settings changes made in one worker are not seen by the others.',
+        hint="Set REPORT_CACHE['BACKEND'] = 'django' with a shared cache (Redis, Memcached) "
+             'in CACHES, or run a single worker process.',
+        id='api.W001',
+    )]
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = getattr(settings, 'REPORT_CACHE', {})
+                timeout = config.get('TIMEOUT', 300)
+                if config.get('BACKEND', 'locmem') == 'django':
+                    alias = config.get('ALIAS', 'default')
+                    backend = DjangoCacheBackend(alias, timeout)
+                    stamps = DjangoCacheBackend(config.get('STAMP_ALIAS') or alias, timeout)
+                else:
+                    backend = LocMemLRUBackend(config.get('MAX_ENTRIES', 2048), timeout)
+                    stamps = LocMemLRUBackend(config.get('MAX_STAMPS', 65536), None)
+                _cache = ReportCache(backend, stamps)
+    return _cache
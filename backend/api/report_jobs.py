@@ -0,0 +1,129 @@
+"""Reports computed off the request thread, and the weekly report emails.
+
+``abuild`` computes a report payload; ``/api/reports/`` calls it inline,
+or queues a ``report`` job that calls it in a worker (see ``api.jobs``).
+
+Users with ``Settings.weekly_reports`` and ``email_notifications`` on
+get an email summing up their last full week, Monday to Sunday in their
+timezone. ``schedule_weekly_reports`` queues one ``weekly_report`` job
+per user and week; the job key makes a second call a no-op, so every
+worker can call it. The mail goes through Django's email backend.
+"""
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from django.core.mail import send_mail
+from django.utils import timezone
+from . import archive, buckets, jobs, reports, rollups
+from .models import Settings
+
+
+async def abuild(user, params, start, end, tz, boundary=None, rollups_ready=True):
+    """The report for normalized ``params``, before ``reports.with_live_time``.
+
+    ``rollups_ready`` is ``rollups.ready`` for the user: after a timezone
+    change the rollup is skipped until its rebuild has run.
+    """
+    project = params.get('project')
+    client = params.get('client')
+    tag = params.get('tag')
+    breakdowns = reports.parse_breakdowns(params.get('breakdowns'))
+    # Filters on local-midnight bounds are answered from the DailyRollup table, which
+    # still counts archived entries; the archive is only read when the range reaches it
+    if rollups_ready and rollups.can_answer(start, end, breakdowns, tz):
+        return await rollups.areport(
+            user, start=start, end=end, project=project, client=client, tag=tag, breakdowns=breakdowns, tz=tz,
+            archived=archive.reaches(boundary, start),
+        )
+    sources = []
+    for model in archive.entry_models(boundary, start):
+        entries = model.objects.filter(user=user)
+        if start:
+            entries = entries.filter(start_time__gte=start)
+        if end:
+            entries = entries.filter(end_time__lte=end)
+        if project:
+            entries = entries.filter(project_id=project)
+        if client:
+            entries = entries.filter(client_id=client)
+        if tag:
+            entries = entries.filter(tags__id=tag)
+        sources.append(entries)
+    return await reports.aentry_report(sources, breakdowns, tz, start, end)
+
+
+def runs_inline(params, start, end, tz, rollups_ready=True):
+    """Whether a report is cheap enough to compute in the request (see JOBS['REPORT_INLINE_MAX_DAYS'])."""
+    max_days = jobs.get_config()['REPORT_INLINE_MAX_DAYS']
+    breakdowns = reports.parse_breakdowns(params.get('breakdowns'))
+    if max_days is None or (rollups_ready and rollups.can_answer(start, end, breakdowns, tz)):
+        return True
+    # An open range may cover the user's whole history
+    return start is not None and end is not None and (end - start) <= timedelta(days=max_days)
+
+
+def run_report(job):
+    params = job.params['params']
+    tz = buckets.user_timezone(job.user_id)
+    start = buckets.parse_bound(params.get('start'), tz)
+    end = buckets.parse_bound(params.get('end'), tz)
+    report = async_to_sync(abuild)(
+        job.user, params, start, end, tz, archive.archived_before(job.user_id), rollups.ready(job.user_id),
+    )
+    return reports.with_live_time(report)[0]
+
+
+def last_week(now, tz):
+    """The Monday starting the last full local week before ``now``."""
+    return buckets.week_start(buckets.local_date(now, tz)) - timedelta(days=7)
+
+
+def schedule_weekly_reports(now=None):
+    """Queue the weekly report of every opted-in user whose last full week has none yet. Returns how many were queued."""
+    now = now or timezone.now()
+    opted_in = (
+        Settings.objects.filter(weekly_reports=True, email_notifications=True)
+        .exclude(user__email='').values_list('user_id', 'timezone')
+    )
+    queued = []
+    for user_id, tz_name in opted_in.iterator():
+        week = last_week(now, buckets.get_timezone(tz_name)).isoformat()
+        queued.append(('weekly_report', user_id, {'week': week}, f'weekly:{user_id}:{week}'))
+    return jobs.enqueue_many(queued, now)
+
+
+def _hours(seconds):
+    minutes = round(seconds / 60)
+    return f'{minutes // 60}h {minutes % 60:02d}m'
+
+
+def weekly_email(week, report, goal_hours):
+    """The subject and plain-text body of a weekly report."""
+    lines = [
+        f'Your week of {week:%d %B %Y}',
+        '',
+        f'Total: {_hours(report["total_duration"])} over {report["total_entries"]} entries (goal: {goal_hours}h)',
+    ]
+    projects = sorted(report['project_stats'], key=lambda row: -row['total'])
+    if projects:
+        lines += ['', 'Projects:']
+        lines += [f'  {row["project__name"] or "No project"}: {_hours(row["total"])}' for row in projects if row['total']]
+    lines += ['', 'Days:']
+    lines += [f'  {row["date"]:%a %d %b}: {_hours(row["total"])}' for row in report['daily_stats']]
+    return f'Weekly report: {_hours(report["total_duration"])} tracked', '\n'.join(lines) + '\n'
+
+
+def run_weekly_report(job):
+    settings = Settings.objects.get(user_id=job.user_id)
+    user = job.user
+    if not (settings.weekly_reports and settings.email_notifications and user.email):
+        # Opted out since the job was queued
+        return {'sent_to': None}
+    tz = buckets.get_timezone(settings.timezone)
+    week = buckets.parse_bound(job.params['week'], tz).date()
+    start, end = buckets.local_midnight(week, tz), buckets.local_midnight(week + timedelta(days=7), tz)
+    report = async_to_sync(abuild)(
+        user, {}, start, end, tz, settings.archived_before, settings.timezone == settings.rollup_timezone,
+    )
+    subject, body = weekly_email(week, report, settings.weekly_goal)
+    send_mail(subject, body, None, [user.email])
+    return {'sent_to': user.email, 'week': week, 'total_duration': report['total_duration']}
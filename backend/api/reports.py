@@ -0,0 +1,225 @@
+"""Report engine.
+
+Every breakdown comes from one grouped query at the finest grain requested:
+(project, client, day[, hour]). The result has at most one row per
+combination, so the totals, counts and per-project, per-client, per-day,
+per-week, per-month and per-hour figures are folded from it in Python.
+This gives the same results on every backend, with no GROUPING SETS. A
+per-tag breakdown needs its own query, because joining tags would count
+an entry once per tag.
+
+Days, weeks, months and hours are local to the user's timezone. An entry
+that runs past local midnight gets a grain row of its own, carrying its
+start and end, and its time is split over the days it touches (see
+``buckets.split``). Day, week and month series have no gaps.
+
+A running timer (no ``end_time``) counts as one entry with no stored
+duration. The grain row holding it also carries its start time as
+``running_since``, and ``with_live_time`` adds the elapsed time when the
+report is served. That keeps cached payloads valid while a timer runs and
+needs no query of its own.
+"""
+import asyncio
+from datetime import timedelta
+from django.db.models import Case, Count, DateTimeField, F, IntegerField, Max, Min, Sum, Value, When
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+from . import buckets
+
+BREAKDOWNS = ('tag', 'week', 'month', 'hour')
+
+STORED_DURATION = Case(When(end_time__isnull=True, then=Value(0)), default=F('duration'), output_field=IntegerField())
+RUNNING_SINCE = Case(When(end_time__isnull=True, then=F('start_time')), output_field=DateTimeField())
+
+
+def parse_breakdowns(value):
+    if isinstance(value, (list, tuple)):
+        names = value
+    else:
+        names = (value or '').split(',')
+    return tuple(name for name in BREAKDOWNS if name in {n.strip() for n in names})
+
+
+def _add(bucket, key, amount):
+    bucket[key] = bucket.get(key, 0) + amount
+
+
+def fold(rows, breakdowns=(), tz=buckets.UTC, first=None, last=None, spans=()):
+    """Fold grain rows (``project__name``, ``client__name``, ``date``, optional
+    ``hour``, ``total``, ``count``, ``running_since``) into the report payload.
+
+    A row with a ``span`` spreads its total from ``span_start`` to ``span_end``
+    over local days. Rows whose ``end_date`` is after their ``date`` (rollup
+    rows of entries past midnight) leave their days to ``spans``, which are
+    ``{span_start, span_end, total}`` rows of the entries themselves.
+    ``first``/``last`` bound the day series; by default it spans the data.
+    """
+    total_duration = total_entries = 0
+    projects, clients, days, hours = {}, {}, {}, {}
+    running = None
+    spans = list(spans)
+    for row in rows:
+        if row.get('running_since'):
+            running = {'since': row['running_since'], 'timezone': tz.key, 'tags': []}
+            running.update((field, row[field]) for field in ('project__name', 'client__name', 'date', 'hour') if field in row)
+        total = row['total'] or 0
+        total_duration += total
+        total_entries += row['count'] or 0
+        _add(projects, row['project__name'], total)
+        _add(clients, row['client__name'], total)
+        if row.get('span'):
+            spans.append({'span_start': row['span_start'], 'span_end': row['span_end'], 'total': total})
+        elif not (row.get('end_date') and row['end_date'] > row['date']):
+            _add(days, row['date'], total)
+        if 'hour' in breakdowns:
+            _add(hours, row['hour'], total)
+    for span in spans:
+        for day, seconds in buckets.split(span['span_start'], span['span_end'], span['total'] or 0, tz):
+            _add(days, day, seconds)
+    report = {
+        'total_duration': total_duration,
+        'total_entries': total_entries,
+        'project_stats': [{'project__name': name, 'total': total} for name, total in projects.items()],
+        'client_stats': [{'client__name': name, 'total': total} for name, total in clients.items()],
+        'daily_stats': buckets.daily(days, first, last),
+    }
+    _add_series(report, breakdowns)
+    if 'hour' in breakdowns:
+        report['hourly_stats'] = [{'hour': hour, 'total': hours.get(hour, 0)} for hour in range(24)]
+    if running:
+        report['running'] = running
+    return report
+
+
+def _add_series(report, breakdowns):
+    if 'week' in breakdowns:
+        report['weekly_stats'] = buckets.weekly(report['daily_stats'])
+    if 'month' in breakdowns:
+        report['monthly_stats'] = buckets.monthly(report['daily_stats'])
+
+
+def tag_stats(rows, name_field, running=None):
+    # Untagged entries group under None and are left out. A tag may have a
+    # row per table when archived entries are included.
+    totals = {}
+    for row in rows:
+        if row[name_field] is None:
+            continue
+        _add(totals, row[name_field], row['total'] or 0)
+        if running is not None and row.get('running_since'):
+            running['tags'].append(row[name_field])
+    return [{'tag__name': name, 'total': total} for name, total in totals.items()]
+
+
+def _bump(rows, field, value, seconds):
+    return [dict(row, total=row['total'] + seconds) if row[field] == value else row for row in rows]
+
+
+def with_live_time(report, now=None):
+    """Return ``(payload, live)`` for a folded report.
+
+    ``payload`` is a copy of ``report`` with the running timer's elapsed time
+    added to every figure it counts towards and ``running_since`` set;
+    ``live`` is whether a timer is running, so the figures change over time.
+    ``report`` itself is left untouched, as it may be a cached object.
+    """
+    running = report.get('running')
+    payload = {key: value for key, value in report.items() if key != 'running'}
+    payload['running_since'] = running['since'] if running else None
+    if not running:
+        return payload, False
+    now = now or timezone.now()
+    seconds = max(0, int((now - running['since']).total_seconds()))
+    payload['total_duration'] += seconds
+    payload['project_stats'] = _bump(payload['project_stats'], 'project__name', running['project__name'], seconds)
+    payload['client_stats'] = _bump(payload['client_stats'], 'client__name', running['client__name'], seconds)
+    days = {row['date']: row['total'] for row in payload['daily_stats']}
+    for day, portion in buckets.split(running['since'], now, seconds, buckets.get_timezone(running['timezone'])):
+        _add(days, day, portion)
+    # The timer may run past the last day of an open-ended report
+    first = payload['daily_stats'][0]['date'] if payload['daily_stats'] else None
+    payload['daily_stats'] = buckets.daily(days, first, max(days) if days else None)
+    _add_series(payload, [name for name in ('week', 'month') if f'{name}ly_stats' in payload])
+    if 'hourly_stats' in payload and 'hour' in running:
+        payload['hourly_stats'] = _bump(payload['hourly_stats'], 'hour', running['hour'], seconds)
+    if 'tag_stats' in payload:
+        payload['tag_stats'] = [
+            dict(row, total=row['total'] + seconds) if row['tag__name'] in running['tags'] else row
+            for row in payload['tag_stats']
+        ]
+    return payload, True
+
+
+def entry_queries(entries, breakdowns=(), tz=buckets.UTC):
+    """Return the grain and tag querysets (None without a tag breakdown)
+    for a filtered TimeEntry queryset. Their rows feed ``assemble``."""
+    grain = {'date': TruncDate('start_time', tzinfo=tz)}
+    if 'hour' in breakdowns:
+        grain['hour'] = ExtractHour('start_time', tzinfo=tz)
+    # Entries ending on a later local day are grouped on their own to be split
+    span = Case(When(end_date__gt=F('date'), then=F('id')), output_field=IntegerField())
+    rows = (
+        entries.annotate(**grain, end_date=TruncDate('end_time', tzinfo=tz))
+        .annotate(span=span)
+        .values('project__name', 'client__name', *grain, 'span')
+        .annotate(
+            total=Sum(STORED_DURATION), count=Count('id'), running_since=Max(RUNNING_SINCE),
+            span_start=Min('start_time'), span_end=Max('end_time'),
+        )
+        .order_by()
+    )
+    tags = None
+    if 'tag' in breakdowns:
+        tags = entries.values('tags__name').annotate(total=Sum(STORED_DURATION), running_since=Max(RUNNING_SINCE)).order_by()
+    return rows, tags
+
+
+def day_range(start, end, tz):
+    """The first and last local day of a report between aware ``start``/``end``."""
+    first = buckets.local_date(start, tz) if start else None
+    last = buckets.local_date(end - timedelta(microseconds=1), tz) if end else None
+    return first, last
+
+
+def assemble(rows, tags, breakdowns, tag_field, tz=buckets.UTC, start=None, end=None, spans=()):
+    report = fold(rows, breakdowns, tz, *day_range(start, end, tz), spans=spans)
+    if tags is not None:
+        report['tag_stats'] = tag_stats(tags, tag_field, report.get('running'))
+    return report
+
+
+async def aevaluate(queryset):
+    """The rows of ``queryset`` (None stays None), without blocking the event loop."""
+    return None if queryset is None else [row async for row in queryset]
+
+
+async def aassemble(rows, tags, breakdowns, tag_field, tz=buckets.UTC, start=None, end=None):
+    """``assemble`` for async views; the two querysets are evaluated concurrently."""
+    rows, tags = await asyncio.gather(aevaluate(rows), aevaluate(tags))
+    return assemble(rows, tags, breakdowns, tag_field, tz, start, end)
+
+
+def _sources(entries):
+    return list(entries) if isinstance(entries, (list, tuple)) else [entries]
+
+
+def _concat(results):
+    return None if results[0] is None else [row for rows in results for row in rows]
+
+
+def entry_report(entries, breakdowns=(), tz=buckets.UTC, start=None, end=None):
+    """Compute a report from a filtered TimeEntry queryset, or a list of
+    querysets (e.g. with ArchivedTimeEntry) whose rows are combined.
+
+    ``start``/``end`` are the report's bounds, which set the day series.
+    """
+    queries = [entry_queries(source, breakdowns, tz) for source in _sources(entries)]
+    rows = _concat([list(query[0]) for query in queries])
+    tags = _concat([None if query[1] is None else list(query[1]) for query in queries])
+    return assemble(rows, tags, breakdowns, 'tags__name', tz, start, end)
+
+
+async def aentry_report(entries, breakdowns=(), tz=buckets.UTC, start=None, end=None):
+    queries = [entry_queries(source, breakdowns, tz) for source in _sources(entries)]
+    results = await asyncio.gather(*(aevaluate(queryset) for query in queries for queryset in query))
+    return assemble(_concat(results[::2]), _concat(results[1::2]), breakdowns, 'tags__name', tz, start, end)
@@ -0,0 +1,284 @@
+import asyncio
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import F, Max, Q, Sum
+from django.utils.dateparse import parse_date, parse_datetime
+from . import buckets, profile_cache, report_cache, reports
+from .models import ArchivedTimeEntry, DailyRollup, Settings, TimeEntry
+
+# end_date is the local day of (end_time - 1us), so that the raw filter
+# ``end_time <= <local midnight of D>`` is exactly ``end_date < D`` on the rollup.
+END_EPSILON = timedelta(microseconds=1)
+
+
+def _as_datetime(field_name, value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return TimeEntry._meta.get_field(field_name).to_python(value)
+
+
+def _local_date(value, tz):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return buckets.local_date(value, tz)
+
+
+def entry_keys(entry, tag_ids, base=True, tz=buckets.UTC):
+    """Return the rollup keys a TimeEntry contributes to.
+
+    Dates are local to ``tz``, the user's timezone. With ``base=False``
+    only the per-tag keys are returned, which is what adding or removing
+    tags on an existing entry touches. A running timer (no ``end_time``)
+    gets rows of its own, keyed by its start time, so reports can add the
+    time elapsed since then.
+    """
+    start_time = _as_datetime('start_time', entry.start_time)
+    end_time = _as_datetime('end_time', entry.end_time)
+    key = {
+        'user_id': entry.user_id,
+        'date': _local_date(start_time, tz),
+        'end_date': _local_date(end_time - END_EPSILON, tz) if end_time else None,
+        'project_id': entry.project_id,
+        'client_id': entry.client_id,
+        'running_since': start_time if end_time is None else None,
+    }
+    keys = [dict(key, tag_id=None)] if base else []
+    keys.extend(dict(key, tag_id=tag_id) for tag_id in tag_ids)
+    return keys
+
+
+def stored_duration(entry):
+    # A running timer's time is added live by reports.with_live_time
+    return 0 if entry.end_time is None else entry.duration or 0
+
+
+def apply(keys, duration, count):
+    """Add ``duration`` seconds and ``count`` entries to each rollup key."""
+    apply_totals({_ident(key): (duration, count) for key in keys})
+
+
+def apply_totals(totals):
+    """Apply ``{key ident: (duration, count)}`` deltas, one row update per key."""
+    totals = {ident: delta for ident, delta in totals.items() if delta[0] or delta[1]}
+    if not totals:
+        return
+    with transaction.atomic():
+        for ident, (duration, count) in totals.items():
+            key = dict(ident)
+            row = DailyRollup.objects.filter(**key).values_list('pk', flat=True).first()
+            if row is None:
+                DailyRollup.objects.create(total_duration=duration, entry_count=count, **key)
+                continue
+            DailyRollup.objects.filter(pk=row).update(
+                total_duration=F('total_duration') + duration,
+                entry_count=F('entry_count') + count,
+            )
+            if count < 0:
+                DailyRollup.objects.filter(pk=row, entry_count__lte=0).delete()
+
+
+def apply_entries(changes):
+    """Apply many ``(entry, tag_ids, sign)`` changes, merging shared keys first."""
+    totals, zones = {}, {}
+    for entry, tag_ids, sign in changes:
+        if entry.user_id not in zones:
+            zones[entry.user_id] = buckets.user_timezone(entry.user_id)
+        for key in entry_keys(entry, tag_ids, tz=zones[entry.user_id]):
+            ident = _ident(key)
+            duration, count = totals.get(ident, (0, 0))
+            totals[ident] = (duration + sign * stored_duration(entry), count + sign)
+    apply_totals(totals)
+
+
+def _ident(key):
+    return tuple(sorted(key.items()))
+
+
+def add_entry(entry, tag_ids, base=True, tz=buckets.UTC):
+    apply(entry_keys(entry, tag_ids, base, tz=tz), stored_duration(entry), 1)
+
+
+def remove_entry(entry, tag_ids, base=True, tz=buckets.UTC):
+    apply(entry_keys(entry, tag_ids, base, tz=tz), -stored_duration(entry), -1)
+
+
+def rebuild(users=None, batch_size=2000):
+    """Recompute the rollup table from TimeEntry and ArchivedTimeEntry. Returns rows written.
+
+    Also records the timezone the rows are now keyed in as ``Settings.rollup_timezone``.
+    """
+    rollups = DailyRollup.objects.all()
+    user_settings = Settings.objects.all()
+    if users is not None:
+        rollups = rollups.filter(user__in=users)
+        user_settings = user_settings.filter(user__in=users)
+    names, stale = {}, {}
+    for user_id, name, rollup_name in user_settings.values_list('user_id', 'timezone', 'rollup_timezone'):
+        names[user_id] = name
+        if name != rollup_name:
+            stale.setdefault(name, []).append(user_id)
+    zones = {user_id: buckets.get_timezone(name) for user_id, name in names.items()}
+    totals = {}
+    for entry_model in (TimeEntry, ArchivedTimeEntry):
+        entries = entry_model.objects.all()
+        if users is not None:
+            entries = entries.filter(user__in=users)
+        field = entry_model._meta.get_field('tags')
+        entry_column = field.m2m_column_name()
+        tags_by_entry = {}
+        tag_links = field.remote_field.through.objects.filter(
+            **{f'{field.m2m_field_name()}__in': entries}
+        ).values_list(entry_column, 'tag_id')
+        for entry_id, tag_id in tag_links.iterator(chunk_size=batch_size):
+            tags_by_entry.setdefault(entry_id, []).append(tag_id)
+        for entry in entries.only(
+            'id', 'user', 'project', 'client', 'start_time', 'end_time', 'duration'
+        ).iterator(chunk_size=batch_size):
+            tz = zones.get(entry.user_id, buckets.UTC)
+            for key in entry_keys(entry, tags_by_entry.get(entry.id, ()), tz=tz):
+                ident = _ident(key)
+                duration, count = totals.get(ident, (0, 0))
+                totals[ident] = (duration + stored_duration(entry), count + 1)
+    with transaction.atomic():
+        rollups.delete()
+        DailyRollup.objects.bulk_create(
+            (DailyRollup(total_duration=duration, entry_count=count, **dict(ident))
+             for ident, (duration, count) in totals.items()),
+            batch_size=batch_size,
+        )
+        # A user whose timezone changed again since it was read stays pending
+        for name, user_ids in stale.items():
+            Settings.objects.filter(user__in=user_ids, timezone=name).update(rollup_timezone=name)
+    for user_ids in stale.values():
+        for user_id in user_ids:
+            profile_cache.forget_settings(user_id)
+    return len(totals)
+
+
+def run_rebuild(job):
+    """Job handler: rebuild a user's rows in their new timezone (queued by api.signals)."""
+    rows = rebuild(users=[job.user_id])
+    report_cache.invalidate(job.user_id, ['meta'])
+    return {'rows': rows}
+
+
+def ready(user_id, request=None):
+    """Whether the user's rollup rows are keyed in their current timezone, so reports can read them."""
+    return not profile_cache.get_settings(user_id, request)['rollups_pending']
+
+
+async def aready(user_id, request=None):
+    return not (await profile_cache.aget_settings(user_id, request))['rollups_pending']
+
+
+def day_boundary(value, tz=buckets.UTC):
+    """Return the local date ``value`` falls on if it is exactly local midnight, else None.
+
+    Dates and naive datetimes are taken as local, as in ``buckets.parse_bound``.
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            try:
+                return parse_date(value)
+            except ValueError:
+                return None
+        value = parsed
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(tz)
+    if value.time() != time(0):
+        return None
+    return value.date()
+
+
+def can_answer(start=None, end=None, breakdowns=(), tz=buckets.UTC):
+    """Whether a report with these filters can be served from the rollup."""
+    if 'hour' in breakdowns:
+        return False
+    if start and day_boundary(start, tz) is None:
+        return False
+    if end and day_boundary(end, tz) is None:
+        return False
+    return True
+
+
+def report_queries(user, start=None, end=None, project=None, client=None, tag=None, breakdowns=(), tz=buckets.UTC):
+    """The rollup counterpart of ``reports.entry_queries``."""
+    rows = DailyRollup.objects.filter(user=user)
+    if start:
+        rows = rows.filter(date__gte=day_boundary(start, tz))
+    if end:
+        rows = rows.filter(end_date__lt=day_boundary(end, tz))
+    if project:
+        rows = rows.filter(project_id=project)
+    if client:
+        rows = rows.filter(client_id=client)
+    tagged = rows.filter(tag_id=tag) if tag else rows.filter(tag__isnull=False)
+    rows = rows.filter(tag_id=tag) if tag else rows.filter(tag__isnull=True)
+    grain = (
+        rows.values('project__name', 'client__name', 'date', 'end_date')
+        .annotate(total=Sum('total_duration'), count=Sum('entry_count'), running_since=Max('running_since'))
+        .order_by()
+    )
+    tags = None
+    if 'tag' in breakdowns:
+        tags = tagged.values('tag__name').annotate(total=Sum('total_duration'), running_since=Max('running_since')).order_by()
+    return grain, tags
+
+
+def span_queries(user, grain, end=None, project=None, client=None, tag=None, tz=buckets.UTC, archived=False):
+    """The entries behind grain rows that run past local midnight, or None.
+
+    Their days can't be told from the rollup, so they are read from
+    TimeEntry, one index range per local day they start on, and from
+    ArchivedTimeEntry too if ``archived``.
+    """
+    days = sorted({row['date'] for row in grain if row['end_date'] and row['end_date'] > row['date']})
+    if not days:
+        return None
+    ranges = Q()
+    for day in days:
+        lower = buckets.local_midnight(day, tz)
+        upper = buckets.local_midnight(day + timedelta(days=1), tz)
+        ranges |= Q(start_time__gte=lower, start_time__lt=upper, end_time__gt=upper)
+    spans = None
+    for model in (TimeEntry, ArchivedTimeEntry) if archived else (TimeEntry,):
+        entries = model.objects.filter(ranges, user=user)
+        if end:
+            entries = entries.filter(end_time__lte=buckets.local_midnight(day_boundary(end, tz), tz))
+        if project:
+            entries = entries.filter(project_id=project)
+        if client:
+            entries = entries.filter(client_id=client)
+        if tag:
+            entries = entries.filter(tags__id=tag)
+        entries = entries.values(span_start=F('start_time'), span_end=F('end_time'), total=F('duration'))
+        spans = entries if spans is None else spans.union(entries, all=True)
+    return spans
+
+
+def report(user, start=None, end=None, project=None, client=None, tag=None, breakdowns=(), tz=buckets.UTC,
+           archived=False):
+    grain, tags = report_queries(user, start, end, project, client, tag, breakdowns, tz)
+    grain = list(grain)
+    spans = span_queries(user, grain, end, project, client, tag, tz, archived)
+    return reports.assemble(grain, tags, breakdowns, 'tag__name', tz, *_bounds(start, end, tz), spans=spans or ())
+
+
+async def areport(user, start=None, end=None, project=None, client=None, tag=None, breakdowns=(), tz=buckets.UTC,
+                  archived=False):
+    grain, tags = report_queries(user, start, end, project, client, tag, breakdowns, tz)
+    grain, tags = await asyncio.gather(reports.aevaluate(grain), reports.aevaluate(tags))
+    spans = await reports.aevaluate(span_queries(user, grain, end, project, client, tag, tz, archived))
+    return reports.assemble(grain, tags, breakdowns, 'tag__name', tz, *_bounds(start, end, tz), spans=spans or ())
+
+
+def _bounds(start, end, tz):
+    return tuple(
+        None if value is None else buckets.local_midnight(day_boundary(value, tz), tz)
+        for value in (start, end)
+    )
@@ -0,0 +1,361 @@
+"""Full-text search over time entries, projects and clients.
+
+Each searchable row has one document in the ``api_search`` index, written
+in the same transaction as the row. A document holds the owner, a title
+(the entry's description, the project's name, the client's name and
+company) and a body (the project's description, the client's notes). On
+SQLite the index is an FTS5 table; on PostgreSQL it is a ``tsvector``
+column with a GIN index. ``get_index`` picks one for a connection, and
+both take the same calls.
+
+A document's id is ``object id * 4 + resource code``, so writes and
+deletes touch exactly one row. The owner is stored as a token in the
+document itself (its own FTS5 column, weight D in the tsvector), so a
+query only reads the user's postings. Ranking ignores it.
+
+Every query word matches as a prefix. Results are ranked (bm25 on
+SQLite, ts_rank on PostgreSQL, higher is better) and paged with opaque
+``(rank, id)`` cursors.
+"""
+import base64
+import json
+import re
+from django.conf import settings
+from django.db import connection as default_connection
+from .models import ArchivedTimeEntry, Client, Project, TimeEntry
+from .serializers import optimize_entry_queryset
+from .sync import RESOURCES as SYNC_RESOURCES
+
+DEFAULTS = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 100,
+    'MAX_TERMS': 8,
+    # PostgreSQL text search configuration for titles, bodies and queries
+    'LANGUAGE': 'simple',
+}
+# name: (code, model, title fields, body fields)
+RESOURCES = {
+    'time_entries': (1, TimeEntry, ('description',), ()),
+    'projects': (2, Project, ('name',), ('description',)),
+    'clients': (3, Client, ('name', 'company'), ('notes',)),
+}
+CODES = {code: name for name, (code, model, title, body) in RESOURCES.items()}
+RESOURCE_NAMES = {model: name for name, (code, model, title, body) in RESOURCES.items()}
+WORD = re.compile(r'\w+')
+
+
+class SearchError(Exception):
+    pass
+
+
+class SearchUnavailable(SearchError):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SEARCH', {})}
+
+
+def document_id(resource, pk):
+    return pk * 4 + RESOURCES[resource][0]
+
+
+def _document(resource, pk, user_id, values):
+    _code, _model, title_fields, _body_fields = RESOURCES[resource]
+    values = [value or '' for value in values]
+    split = len(title_fields)
+    return document_id(resource, pk), user_id, ' '.join(values[:split]), ' '.join(values[split:])
+
+
+def text_fields(resource):
+    _code, _model, title_fields, body_fields = RESOURCES[resource]
+    return title_fields + body_fields
+
+
+def terms(query):
+    words = WORD.findall((query or '').lower())[:get_config()['MAX_TERMS']]
+    if not words:
+        raise SearchError('q must contain at least one word')
+    return words
+
+
+class SQLiteIndex:
+    """An FTS5 table; the rowid is the document id."""
+
+    def install(self, cursor):
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS api_search USING fts5("
+            "owner, title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    def uninstall(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS api_search')
+
+    def upsert(self, cursor, documents):
+        cursor.executemany(
+            'INSERT OR REPLACE INTO api_search (rowid, owner, title, body) VALUES (%s, %s, %s, %s)',
+            [(doc_id, f'u{user_id}', title, body) for doc_id, user_id, title, body in documents],
+        )
+
+    def delete(self, cursor, ids):
+        cursor.executemany('DELETE FROM api_search WHERE rowid = %s', [(doc_id,) for doc_id in ids])
+
+    def delete_owner(self, cursor, user_id):
+        cursor.execute('DELETE FROM api_search WHERE api_search MATCH %s', [f'owner : "u{user_id}"'])
+
+    def clear(self, cursor):
+        cursor.execute('DELETE FROM api_search')
+
+    def matches(self, user_id, words):
+        # Column weights: owner, title, body
+        words = ' AND '.join(f'"{word}"*' for word in words)
+        sql = (
+            'SELECT rowid AS id, -bm25(api_search, 0.0, 2.0, 1.0) AS score '
+            'FROM api_search WHERE api_search MATCH %s'
+        )
+        return sql, [f'owner : "u{user_id}" AND {{title body}} : ({words})']
+
+
+class PostgresIndex:
+    """A ``(id, document tsvector)`` table with a GIN index on the document."""
+
+    def __init__(self, language='simple'):
+        self.language = language
+
+    def install(self, cursor):
+        cursor.execute('CREATE TABLE IF NOT EXISTS api_search (id bigint PRIMARY KEY, document tsvector NOT NULL)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS api_search_document ON api_search USING gin (document)')
+
+    def uninstall(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS api_search')
+
+    def upsert(self, cursor, documents):
+        cursor.executemany(
+            "INSERT INTO api_search (id, document) VALUES (%s, "
+            "setweight(to_tsvector('simple', %s), 'D') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'B')) "
+            "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document",
+            [
+                (doc_id, f'u{user_id}', self.language, title, self.language, body)
+                for doc_id, user_id, title, body in documents
+            ],
+        )
+
+    def delete(self, cursor, ids):
+        cursor.execute('DELETE FROM api_search WHERE id = ANY(%s)', [list(ids)])
+
+    def delete_owner(self, cursor, user_id):
+        cursor.execute("DELETE FROM api_search WHERE document @@ to_tsquery('simple', %s)", [f'u{user_id}:D'])
+
+    def clear(self, cursor):
+        cursor.execute('TRUNCATE api_search')
+
+    def matches(self, user_id, words):
+        # Weights are {D, C, B, A}; query words only match titles (A) and bodies (B)
+        sql = (
+            "SELECT id, ts_rank('{0, 0, 0.4, 1.0}', document, q.query)::float8 AS score "
+            "FROM api_search, (SELECT to_tsquery('simple', %s) && to_tsquery(%s::regconfig, %s) AS query) AS q "
+            "WHERE document @@ q.query"
+        )
+        return sql, [f'u{user_id}:D', self.language, ' & '.join(f'{word}:*AB' for word in words)]
+
+
+class NullIndex:
+    """Other databases: writes are dropped and searches refused."""
+
+    def install(self, cursor):
+        pass
+
+    def uninstall(self, cursor):
+        pass
+
+    def upsert(self, cursor, documents):
+        pass
+
+    def delete(self, cursor, ids):
+        pass
+
+    def delete_owner(self, cursor, user_id):
+        pass
+
+    def clear(self, cursor):
+        pass
+
+    def matches(self, user_id, words):
+        raise SearchUnavailable('Full-text search needs SQLite (FTS5) or PostgreSQL.')
+
+
+def get_index(connection=None):
+    vendor = (connection or default_connection).vendor
+    if vendor == 'sqlite':
+        return SQLiteIndex()
+    if vendor == 'postgresql':
+        return PostgresIndex(get_config()['LANGUAGE'])
+    return NullIndex()
+
+
+def install(connection=None):
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        get_index(connection).install(cursor)
+
+
+def uninstall(connection=None):
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        get_index(connection).uninstall(cursor)
+
+
+def index(instances, connection=None):
+    """Write the documents of searchable ``instances``; others are ignored."""
+    documents = []
+    for instance in instances:
+        resource = RESOURCE_NAMES.get(type(instance))
+        if resource is not None:
+            values = [getattr(instance, field) for field in text_fields(resource)]
+            documents.append(_document(resource, instance.pk, instance.user_id, values))
+    if documents:
+        connection = connection or default_connection
+        with connection.cursor() as cursor:
+            get_index(connection).upsert(cursor, documents)
+
+
+def remove(instances, connection=None):
+    ids = [
+        document_id(RESOURCE_NAMES[type(instance)], instance.pk)
+        for instance in instances
+        if type(instance) in RESOURCE_NAMES
+    ]
+    if ids:
+        connection = connection or default_connection
+        with connection.cursor() as cursor:
+            get_index(connection).delete(cursor, ids)
+
+
+def remove_user(user_id, connection=None):
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        get_index(connection).delete_owner(cursor, user_id)
+
+
+def rebuild(users=None, connection=None, batch_size=2000):
+    """Reindex every document (or ``users``' documents). Returns the number written."""
+    connection = connection or default_connection
+    search_index = get_index(connection)
+    written = 0
+    with connection.cursor() as cursor:
+        if users is None:
+            search_index.clear(cursor)
+        else:
+            users = [getattr(user, 'pk', user) for user in users]
+            for user_id in users:
+                search_index.delete_owner(cursor, user_id)
+        for resource, model in _sources():
+            rows = model.objects.using(connection.alias).order_by()
+            if users is not None:
+                rows = rows.filter(user__in=users)
+            rows = rows.values_list('pk', 'user_id', *text_fields(resource))
+            batch = []
+            for pk, user_id, *values in rows.iterator(chunk_size=batch_size):
+                batch.append(_document(resource, pk, user_id, values))
+                if len(batch) >= batch_size:
+                    search_index.upsert(cursor, batch)
+                    written, batch = written + len(batch), []
+            search_index.upsert(cursor, batch)
+            written += len(batch)
+    return written
+
+
+def _sources():
+    # Archived entries keep their ids, and their documents, as time entries
+    for resource, (_code, model, _title, _body) in RESOURCES.items():
+        yield resource, model
+        if model is TimeEntry:
+            yield resource, ArchivedTimeEntry
+
+
+def encode_cursor(score, doc_id):
+    payload = json.dumps([score, doc_id])
+    return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(encoded):
+    try:
+        padded = encoded + '=' * (-len(encoded) % 4)
+        score, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return float(score), int(doc_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise SearchError('Invalid cursor')
+
+
+def parse_types(value):
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in RESOURCES]
+    if unknown:
+        raise SearchError(f'Unknown type: {", ".join(unknown)}')
+    return names
+
+
+def parse_page_size(value):
+    config = get_config()
+    try:
+        size = int(value) if value else config['PAGE_SIZE']
+    except (TypeError, ValueError):
+        size = config['PAGE_SIZE']
+    return max(1, min(size, config['MAX_PAGE_SIZE']))
+
+
+def search(user, query, types=None, cursor=None, page_size=None, connection=None):
+    """One page of ``user``'s documents matching ``query``, best first.
+
+    Returns ``(hits, next_cursor)``; hits are ``(resource, id, rank)``.
+    """
+    words = terms(query)
+    types = parse_types(types)
+    after = decode_cursor(cursor) if cursor else None
+    limit = parse_page_size(page_size)
+    connection = connection or default_connection
+    sql, params = get_index(connection).matches(user.pk, words)
+    conditions = []
+    if types and len(types) < len(RESOURCES):
+        conditions.append(f'id %% 4 IN ({", ".join(str(RESOURCES[name][0]) for name in types)})')
+    if after is not None:
+        conditions.append('(score < %s OR (score = %s AND id > %s))')
+        params += [after[0], after[0], after[1]]
+    where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(
+            f'SELECT score, id FROM ({sql}) AS matches{where} ORDER BY score DESC, id LIMIT %s',
+            params + [limit + 1],
+        )
+        rows = db_cursor.fetchall()
+    next_cursor = encode_cursor(*rows[limit - 1]) if len(rows) > limit else None
+    hits = [(CODES[doc_id % 4], doc_id // 4, score) for score, doc_id in rows[:limit]]
+    return hits, next_cursor
+
+
+def results(user, hits):
+    """``[{'type', 'id', 'rank', 'object'}]`` for ``hits``, skipping rows that are gone."""
+    ids = {}
+    for resource, pk, _rank in hits:
+        ids.setdefault(resource, []).append(pk)
+    objects = {}
+    for resource, pks in ids.items():
+        model, serializer_class = SYNC_RESOURCES[resource]
+        rows = model.objects.filter(user=user, pk__in=pks)
+        if model is TimeEntry:
+            rows = optimize_entry_queryset(rows)
+        rows = list(rows)
+        if model is TimeEntry and len(rows) < len(pks):
+            found = {row.pk for row in rows}
+            rows += optimize_entry_queryset(
+                ArchivedTimeEntry.objects.filter(user=user, pk__in=[pk for pk in pks if pk not in found])
+            )
+        for row, data in zip(rows, serializer_class(rows, many=True).data):
+            objects[resource, row.pk] = data
+    return [
+        {'type': resource, 'id': pk, 'rank': rank, 'object': objects[resource, pk]}
+        for resource, pk, rank in hits
+        if (resource, pk) in objects
+    ]
@@ -1,13 +1,21 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
 from django.contrib.auth.models import User
-from .models import Client, Project, Tag, TimeEntry, Settings
+from .models import Client, Job, Project, Tag, TimeEntry, Settings
+from . import metrics
 
-class UserSerializer(serializers.ModelSerializer):
+class ModelSerializer(serializers.ModelSerializer):
+    # Rendering time shows up as the "serialize" entry of Server-Timing
+    def to_representation(self, instance):
+        with metrics.span('serialize'):
+            return super().to_representation(instance)
+
+class UserSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email']
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password']
@@ -21,27 +29,89 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
         return user
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(ModelSerializer):
     class Meta:
         model = Client
         fields = '__all__'
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(ModelSerializer):
     class Meta:
         model = Project
         fields = '__all__'
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
+        # Maintained by api.tag_usage
+        read_only_fields = ['usage_count', 'last_used_at']
 
-class TimeEntrySerializer(serializers.ModelSerializer):
+class ProjectSummarySerializer(ModelSerializer):
+    class Meta:
+        model = Project
+        fields = ['id', 'name', 'color']
+
+class ClientSummarySerializer(ModelSerializer):
+    class Meta:
+        model = Client
+        fields = ['id', 'name']
+
+class TagSummarySerializer(ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['id', 'name', 'color']
+
+EXPANDABLE_RELATIONS = ('project', 'client', 'tags')
+
+def parse_expand(value):
+    """Parse ``?expand=project,client,tags`` into a tuple of relation names."""
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in EXPANDABLE_RELATIONS]
+    if unknown:
+        raise serializers.ValidationError({'expand': [f'Unknown relation: {", ".join(unknown)}']})
+    return tuple(name for name in EXPANDABLE_RELATIONS if name in names)
+
+def optimize_entry_queryset(queryset, expand=()):
+    """Load what TimeEntrySerializer needs up front, so a list costs a fixed number of queries."""
+    related = [name for name in ('project', 'client') if name in expand]
+    if related:
+        queryset = queryset.select_related(*related)
+    # Tags in id order, as api.fast_serializers lists them
+    return queryset.prefetch_related(Prefetch('tags', queryset=Tag.objects.order_by('id')))
+
+class TimeEntrySerializer(ModelSerializer):
     class Meta:
         model = TimeEntry
         fields = '__all__'
 
-class SettingsSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        expand = self.context.get('expand')
+        if expand:
+            expanded = {}
+            if 'project' in expand:
+                expanded['project'] = ProjectSummarySerializer(instance.project).data if instance.project_id else None
+            if 'client' in expand:
+                expanded['client'] = ClientSummarySerializer(instance.client).data if instance.client_id else None
+            if 'tags' in expand:
+                expanded['tags'] = TagSummarySerializer(instance.tags.all(), many=True).data
+            data['expanded'] = expanded
+        return data
+
+class SettingsSerializer(ModelSerializer):
+    # True while reports wait for the rollup rebuild queued by a timezone change
+    rollups_pending = serializers.SerializerMethodField()
     class Meta:
         model = Settings
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        # Set by api.archive and api.rollups
+        read_only_fields = ['archived_before', 'rollup_timezone']
+    def get_rollups_pending(self, obj):
+        return obj.timezone != obj.rollup_timezone
+
+class JobSerializer(ModelSerializer):
+    # The result is served by /api/jobs/<id>/result/
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'params', 'error', 'attempts', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
@@ -0,0 +1,232 @@
+import threading
+from contextlib import contextmanager
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from . import buckets, events, jobs, profile_cache, report_cache, rollups, search, sync, tag_usage
+from .models import Client, Project, Settings, Tag, TimeEntry
+
+ROLLUP_FIELDS = ('user', 'project', 'client', 'start_time', 'end_time', 'duration')
+
+_state = threading.local()
+
+
+@contextmanager
+def suspended():
+    """Disable these handlers in the current thread.
+
+    Bulk write paths use this and maintain rollups and caches themselves
+    in aggregate rather than once per object.
+    """
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def _active():
+    return not getattr(_state, 'suspended', False)
+
+
+def _tag_ids(entry):
+    return list(entry.tags.values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=TimeEntry)
+def remember_previous_entry(sender, instance, raw=False, **kwargs):
+    instance._previous = None
+    if raw or instance.pk is None or not _active():
+        return
+    instance._previous = TimeEntry.objects.filter(pk=instance.pk).only(*ROLLUP_FIELDS).first()
+
+
+@receiver(post_save, sender=TimeEntry)
+def entry_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or not _active():
+        return
+    previous = getattr(instance, '_previous', None)
+    instance._previous = None
+    report_cache.invalidate(instance.user_id, report_cache.entry_dependencies(previous, instance))
+    tz = buckets.user_timezone(instance.user_id)
+    if previous is None:
+        # A new entry has no tags until m2m_changed fires.
+        tag_ids = [] if created else _tag_ids(instance)
+        rollups.add_entry(instance, tag_ids, tz=tz)
+        return
+    old_keys = rollups.entry_keys(previous, (), tz=tz)
+    if old_keys == rollups.entry_keys(instance, (), tz=tz) and previous.duration == instance.duration:
+        return
+    tag_ids = _tag_ids(instance)
+    rollups.remove_entry(previous, tag_ids, tz=tz)
+    rollups.add_entry(instance, tag_ids, tz=tz)
+
+
+@receiver(pre_delete, sender=TimeEntry)
+def entry_deleting(sender, instance, origin=None, **kwargs):
+    # Deleting the user cascades to its rollup rows as well.
+    if isinstance(origin, User) or not _active():
+        return
+    report_cache.invalidate(instance.user_id, report_cache.entry_dependencies(instance))
+    tag_ids = _tag_ids(instance)
+    rollups.remove_entry(instance, tag_ids, tz=buckets.user_timezone(instance.user_id))
+    # The through rows go with the entry without an m2m_changed signal
+    tag_usage.removed(tag_ids)
+
+
+@receiver(m2m_changed, sender=TimeEntry.tags.through)
+def entry_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not _active():
+        return
+    # pk_set on remove may name rows that were never linked, so the linked
+    # subset is captured before the change and used afterwards.
+    if action in ('pre_remove', 'pre_clear'):
+        own, other = ('tag_id', 'timeentry_id') if reverse else ('timeentry_id', 'tag_id')
+        links = sender.objects.filter(**{own: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{other + '__in': pk_set})
+        instance._rollup_removed = set(links.values_list(other, flat=True))
+        return
+    if action in ('post_remove', 'post_clear'):
+        pk_set = getattr(instance, '_rollup_removed', None) or set()
+        instance._rollup_removed = None
+        change, usage = rollups.remove_entry, tag_usage.removed
+    elif action == 'post_add':
+        change, usage = rollups.add_entry, tag_usage.added
+    else:
+        return
+    if not pk_set:
+        return
+    if reverse:
+        usage([instance.pk], entries=len(pk_set))
+    else:
+        usage(pk_set)
+    tz = buckets.user_timezone(instance.user_id)
+    if reverse:
+        for entry in TimeEntry.objects.filter(pk__in=pk_set).only(*ROLLUP_FIELDS):
+            change(entry, [instance.pk], base=False, tz=tz)
+            report_cache.invalidate(entry.user_id, report_cache.entry_dependencies(entry))
+        sync.touch_entries(pk_set)
+        events.changed(instance.user_id, 'time_entries', 'upsert', pk_set)
+    else:
+        change(instance, list(pk_set), base=False, tz=tz)
+        report_cache.invalidate(instance.user_id, report_cache.entry_dependencies(instance))
+        sync.touch_entries([instance.pk])
+        events.changed(instance.user_id, 'time_entries', 'upsert', [instance.pk])
+
+
+@receiver(pre_save, sender=Settings)
+def remember_previous_timezone(sender, instance, raw=False, **kwargs):
+    instance._previous_timezone = None
+    if not raw and instance.pk is not None and _active():
+        instance._previous_timezone = Settings.objects.filter(pk=instance.pk).values_list('timezone', flat=True).first()
+
+
+@receiver(post_save, sender=Settings)
+def timezone_changed(sender, instance, raw=False, **kwargs):
+    # Rollup rows are keyed by local day, so a new timezone moves them all
+    if raw:
+        return
+    profile_cache.forget_settings(instance.user_id)
+    if not _active():
+        return
+    previous = getattr(instance, '_previous_timezone', None) or 'UTC'
+    if previous == instance.timezone or instance.timezone == instance.rollup_timezone:
+        return
+    if buckets.get_timezone(instance.timezone).key == buckets.get_timezone(instance.rollup_timezone).key:
+        # A name for the zone the rows are keyed in, e.g. an unknown one for UTC
+        Settings.objects.filter(pk=instance.pk).update(rollup_timezone=instance.timezone)
+        instance.rollup_timezone = instance.timezone
+        return
+    # Rebuilding every row can take long; until the job has run, reports skip the rollup
+    jobs.enqueue('rebuild_rollups', instance.user)
+    report_cache.invalidate(instance.user_id, ['meta'])
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_reports_on_related_change(sender, instance, raw=False, **kwargs):
+    # Names and due dates appear in every report and calendar payload
+    if not raw and _active():
+        report_cache.invalidate(instance.user_id, ['meta'])
+
+
+@receiver(pre_delete, sender=Client)
+@receiver(pre_delete, sender=Project)
+@receiver(pre_delete, sender=Tag)
+def touch_sync_dependents(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, User) or not _active():
+        return
+    sync.touch_dependents(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=TimeEntry)
+def record_sync_tombstone(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, User) or not _active():
+        return
+    sync.record_deletions([instance])
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=TimeEntry)
+def index_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not _active():
+        return
+    # Stopping a timer saves only end_time and duration
+    if update_fields is not None and not set(update_fields) & set(search.text_fields(search.RESOURCE_NAMES[sender])):
+        return
+    search.index([instance])
+
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=TimeEntry)
+def unindex_deleted(sender, instance, origin=None, **kwargs):
+    # A deleted user's documents go at once, in user_deleted
+    if isinstance(origin, User) or not _active():
+        return
+    search.remove([instance])
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    search.remove_user(instance.pk)
+    profile_cache.forget_settings(instance.pk)
+    profile_cache.forget_profile(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    profile_cache.forget_profile(instance.pk)
+    # Every user has Settings from the start, so reads never have to create them
+    if created and not raw:
+        Settings.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=TimeEntry)
+@receiver(post_save, sender=Settings)
+def publish_saved(sender, instance, raw=False, **kwargs):
+    if not raw and _active():
+        events.instances_changed([instance], 'upsert')
+
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=TimeEntry)
+def publish_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, User) or not _active():
+        return
+    events.instances_changed([instance], 'delete')
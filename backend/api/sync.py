@@ -0,0 +1,130 @@
+"""Incremental sync of a user's clients, projects, tags, entries and settings.
+
+A sync token encodes the server time at which a sync snapshot was taken.
+Reads look back ``SYNC_OVERLAP`` before that time, so rows committed by
+transactions that were still in flight are not missed. Clients upsert by
+id, so seeing a row twice is harmless.
+
+``time_entries`` includes archived entries (see ``api.archive``). Archiving
+keeps ``updated_at``, so it doesn't resend them; a full snapshot has them,
+as do later changes that touch them.
+"""
+import base64
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import profile_cache
+from .models import ArchivedTimeEntry, Client, Project, Settings, Tag, TimeEntry, Tombstone
+from .serializers import (
+    ClientSerializer, ProjectSerializer, SettingsSerializer, TagSerializer, TimeEntrySerializer,
+    optimize_entry_queryset,
+)
+
+RESOURCES = {
+    'clients': (Client, ClientSerializer),
+    'projects': (Project, ProjectSerializer),
+    'tags': (Tag, TagSerializer),
+    'time_entries': (TimeEntry, TimeEntrySerializer),
+}
+RESOURCE_NAMES = {model: name for name, (model, serializer) in RESOURCES.items()}
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def encode_token(moment):
+    return base64.urlsafe_b64encode(json.dumps({'t': moment.isoformat()}).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_token(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        moment = parse_datetime(json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))['t'])
+    except (TypeError, KeyError, ValueError, UnicodeError):
+        raise InvalidToken('Invalid sync token.')
+    if moment is None:
+        raise InvalidToken('Invalid sync token.')
+    return moment
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+
+
+def changes(user, token=None):
+    """Everything that changed for ``user`` since ``token`` (or everything)."""
+    now = timezone.now()
+    since = decode_token(token) if token else None
+    # Tombstones older than the retention window may have been pruned
+    reset = since is None or since < now - retention()
+    payload = {'token': encode_token(now), 'reset': reset, 'deleted': {}}
+    for name, (model, serializer_class) in RESOURCES.items():
+        sources = [model.objects.filter(user=user)]
+        if model is TimeEntry:
+            # A snapshot replaces the client's state, so it must hold the archive too
+            sources = [optimize_entry_queryset(rows) for rows in sources + [ArchivedTimeEntry.objects.filter(user=user)]]
+        payload[name] = []
+        for rows in sources:
+            if not reset:
+                rows = rows.filter(updated_at__gt=since - SYNC_OVERLAP)
+            payload[name] += serializer_class(rows, many=True).data
+        deleted = []
+        if not reset:
+            deleted = list(Tombstone.objects.filter(
+                user=user, resource=name, deleted_at__gt=since - SYNC_OVERLAP
+            ).values_list('object_id', flat=True).distinct())
+        payload['deleted'][name] = deleted
+    user_settings = Settings.objects.filter(user=user)
+    if not reset:
+        user_settings = user_settings.filter(updated_at__gt=since - SYNC_OVERLAP)
+    user_settings = user_settings.first()
+    payload['settings'] = SettingsSerializer(user_settings).data if user_settings else None
+    return payload
+
+
+def record_deletions(instances):
+    """Write tombstones for deleted instances of synced models."""
+    Tombstone.objects.bulk_create([
+        Tombstone(user_id=instance.user_id, resource=RESOURCE_NAMES[type(instance)], object_id=instance.pk)
+        for instance in instances
+        if type(instance) in RESOURCE_NAMES
+    ])
+
+
+def touch_dependents(model, pks):
+    """Bump updated_at on rows whose serialized form changes when ``pks`` are deleted.
+
+    SET_NULL foreign keys and cleared through rows are written with queryset
+    updates that bypass auto_now, so sync would otherwise miss them.
+    """
+    if not pks:
+        return
+    now = timezone.now()
+    if model is Client:
+        Project.objects.filter(client__in=pks).update(updated_at=now)
+        for entries in (TimeEntry, ArchivedTimeEntry):
+            entries.objects.filter(client__in=pks).update(updated_at=now)
+    elif model is Project:
+        for entries in (TimeEntry, ArchivedTimeEntry):
+            entries.objects.filter(project__in=pks).update(updated_at=now)
+        user_settings = Settings.objects.filter(default_project__in=pks)
+        for user_id in user_settings.values_list('user_id', flat=True):
+            profile_cache.forget_settings(user_id)
+        user_settings.update(updated_at=now)
+    elif model is Tag:
+        for entries in (TimeEntry, ArchivedTimeEntry):
+            entries.objects.filter(tags__in=pks).update(updated_at=now)
+
+
+def touch_entries(pks):
+    if pks:
+        TimeEntry.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+def prune(older_than=None):
+    cutoff = timezone.now() - (older_than or retention())
+    return Tombstone.objects.filter(deleted_at__lt=cutoff).delete()[0]
@@ -0,0 +1,68 @@
+"""Denormalized ``Tag.usage_count`` and ``Tag.last_used_at``.
+
+``usage_count`` is the number of entries carrying a tag. It changes with
+``F()`` updates as tags are linked and unlinked, so concurrent writers can't
+lose counts, and ``reconcile`` recomputes it from the through table when
+it drifts (raw SQL, fixtures). ``last_used_at`` is the last time the tag
+was put on an entry. Neither touches ``updated_at``: they are derived, and
+bumping it would send every tagged entry's tags through ``/api/sync/``.
+"""
+from collections import Counter
+from django.db.models import Count, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import ArchivedTimeEntry, Tag, TimeEntry
+
+
+def apply(deltas, now=None):
+    """Add ``{tag id: change}`` to the counts, with one UPDATE per distinct change."""
+    tags_by_delta = {}
+    for tag_id, delta in deltas.items():
+        if delta:
+            tags_by_delta.setdefault(delta, []).append(tag_id)
+    now = now or timezone.now()
+    for delta, tag_ids in tags_by_delta.items():
+        fields = {'usage_count': F('usage_count') + delta}
+        if delta > 0:
+            fields['last_used_at'] = now
+        Tag.objects.filter(pk__in=tag_ids).update(**fields)
+
+
+def added(tag_ids, entries=1):
+    apply({tag_id: entries for tag_id in tag_ids})
+
+
+def removed(tag_ids, entries=1):
+    apply({tag_id: -entries for tag_id in tag_ids})
+
+
+def relation_deltas(before, after):
+    """Count changes between ``(instance, relations)`` pairs, as passed to ``bulk_changed``."""
+    deltas = Counter()
+    for sign, pairs in ((-1, before), (1, after)):
+        for _instance, relations in pairs:
+            for tag in relations.get('tags', ()):
+                deltas[tag.pk] += sign
+    return deltas
+
+
+def reconcile(users=None):
+    """Recount usage from the through tables. Returns the number of tags repaired.
+
+    Archived entries (``api.archive``) still count towards their tags.
+    """
+    links = TimeEntry.tags.through.objects.filter(tag=OuterRef('pk')).order_by().values('tag')
+    archived = ArchivedTimeEntry.tags.through.objects.filter(tag=OuterRef('pk')).order_by().values('tag')
+    actual = (
+        Coalesce(Subquery(links.annotate(n=Count('*')).values('n')), Value(0))
+        + Coalesce(Subquery(archived.annotate(n=Count('*')).values('n')), Value(0))
+    )
+    tags = Tag.objects.all()
+    if users is not None:
+        tags = tags.filter(user__in=users)
+    repaired = tags.exclude(usage_count=actual).update(usage_count=actual)
+    # Tags used before last_used_at existed date from their latest entry
+    tags.filter(last_used_at__isnull=True, usage_count__gt=0).update(
+        last_used_at=Subquery(links.annotate(latest=Max('timeentry__start_time')).values('latest'))
+    )
+    return repaired
@@ -1,3 +1,1580 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gc
+import gzip
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipUnless
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import exceptions
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import archive, benchmarks, buckets, compression, db_pool, events, fast_serializers, firebase_tokens, jobs, loadgen, metrics, profile_cache, report_cache, report_jobs, reports, rollups, search, sync, tag_usage, timers
+from .authentication import FirebaseAuthentication
+from .management.commands.bench_reports import legacy_report
+from .renderers import MessagePackRenderer, columnar
+from .models import ArchivedTimeEntry, Client, DailyRollup, Job, Project, Settings, Tag, TimeEntry
+from .serializers import ProjectSerializer, optimize_entry_queryset
+from .views import TimeEntryViewSet
 
-# Create your tests here.
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        report_cache.get_cache().clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.client_obj = Client.objects.create(user=self.user, name='Acme', email='a@acme.test', status='active')
+        self.project = Project.objects.create(user=self.user, name='Site', client=self.client_obj, status='active')
+        self.other_project = Project.objects.create(user=self.user, name='App', status='active')
+        self.tag = Tag.objects.create(user=self.user, name='billable')
+        self.other_tag = Tag.objects.create(user=self.user, name='meeting')
+
+    def entry(self, start, hours=1, **kwargs):
+        kwargs.setdefault('description', 'work')
+        kwargs.setdefault('project', self.project)
+        end = start + timedelta(hours=hours)
+        return TimeEntry.objects.create(
+            user=self.user, start_time=start, end_time=end, duration=int(hours * 3600), **kwargs
+        )
+
+
+class ReportTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        first = self.entry(utc(2025, 7, 1, 9), client=self.client_obj)
+        first.tags.add(self.tag, self.other_tag)
+        self.entry(utc(2025, 7, 1, 23), hours=2, project=self.other_project).tags.add(self.tag)
+        self.entry(utc(2025, 7, 3, 10), hours=0.5)
+        TimeEntry.objects.create(user=self.user, description='running', start_time=utc(2025, 7, 4, 8))
+        # Freeze the clock at the running entry's start, so it adds no live time
+        patcher = mock.patch.object(reports, 'timezone', mock.Mock(now=lambda: utc(2025, 7, 4, 8)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def raw_report(self, **params):
+        # Non-aligned bounds force ReportsView onto the raw TimeEntry path
+        self.assertFalse(rollups.can_answer(params.get('start'), params.get('end')))
+        return self.api.get('/api/reports/', params).json()
+
+    def assertReportsEqual(self, left, right):
+        key = lambda row: str(row)
+        for field in ('project_stats', 'client_stats'):
+            left[field] = sorted(left[field], key=key)
+            right[field] = sorted(right[field], key=key)
+        # Series are zero-filled to the bounds, which the raw path shifts on purpose
+        for field in ('daily_stats', 'weekly_stats', 'monthly_stats'):
+            for report in (left, right):
+                if field in report:
+                    report[field] = [row for row in report[field] if row['total']]
+        self.assertEqual(left, right)
+
+
+class RollupTests(ReportTestCase):
+    def test_rollup_matches_raw_entries(self):
+        cases = [
+            ({}, {'start': '2000-01-01T00:00:01Z'}),
+            ({'start': '2025-07-02'}, {'start': '2025-07-01T23:59:59.999999Z'}),
+            ({'end': '2025-07-02'}, {'end': '2025-07-02T00:00:00.000001Z'}),
+            ({'end': '2025-07-02T00:00:00Z', 'tag': self.tag.id}, {'end': '2025-07-02T00:00:00.000001Z', 'tag': self.tag.id}),
+            ({'project': self.project.id}, {'project': self.project.id, 'start': '2000-01-01T00:00:01Z'}),
+            ({'client': self.client_obj.id}, {'client': self.client_obj.id, 'start': '2000-01-01T00:00:01Z'}),
+        ]
+        for rollup_params, raw_params in cases:
+            with self.subTest(rollup_params):
+                self.assertTrue(rollups.can_answer(rollup_params.get('start'), rollup_params.get('end')))
+                rolled = self.api.get('/api/reports/', rollup_params).json()
+                self.assertReportsEqual(rolled, self.raw_report(**raw_params))
+
+    def test_post_uses_same_report(self):
+        rolled = self.api.post('/api/reports/', {'tag': self.tag.id}, format='json').json()
+        self.assertEqual(rolled['total_entries'], 2)
+        self.assertEqual(rolled['total_duration'], 3 * 3600)
+
+    def test_incremental_updates_match_rebuild(self):
+        entry = TimeEntry.objects.get(description='running')
+        entry.end_time = utc(2025, 7, 4, 9)
+        entry.duration = 3600
+        entry.project = self.other_project
+        entry.save()
+        entry.tags.set([self.other_tag])
+        self.tag.timeentry_set.remove(entry, TimeEntry.objects.filter(duration=1800).get())
+        TimeEntry.objects.get(duration=7200).tags.clear()
+        TimeEntry.objects.filter(duration=1800).delete()
+        incremental = sorted(DailyRollup.objects.values_list(
+            'date', 'end_date', 'project_id', 'client_id', 'tag_id', 'total_duration', 'entry_count'
+        ), key=str)
+        call_command('rebuild_rollups', stdout=StringIO())
+        rebuilt = sorted(DailyRollup.objects.values_list(
+            'date', 'end_date', 'project_id', 'client_id', 'tag_id', 'total_duration', 'entry_count'
+        ), key=str)
+        self.assertEqual(incremental, rebuilt)
+
+    def test_deleting_tag_drops_its_rows(self):
+        self.tag.delete()
+        self.assertFalse(DailyRollup.objects.filter(tag_id__isnull=False).exclude(tag=self.other_tag).exists())
+        self.assertEqual(self.api.get('/api/reports/').json()['total_entries'], 4)
+
+
+class LocalDayTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tz = buckets.get_timezone('America/New_York')
+        self.api.put('/api/settings/', {'timezone': 'America/New_York'}, format='json')
+        jobs.run_pending()
+        # 23:00-01:00 local, the night before spring forward
+        self.entry(datetime(2025, 3, 8, 23, tzinfo=self.tz), hours=2)
+        self.entry(datetime(2025, 3, 10, 9, tzinfo=self.tz))
+        self.entry(datetime(2025, 3, 31, 23, 30, tzinfo=self.tz), project=self.other_project)
+
+    def local(self, *args):
+        return datetime(*args, tzinfo=self.tz)
+
+    def test_split_across_dst_transitions(self):
+        day = lambda *args: datetime(*args).date()
+        # March 9 has 23 hours, November 2 has 25
+        self.assertEqual(buckets.split(self.local(2025, 3, 8, 23), self.local(2025, 3, 10, 1), 25 * 3600, self.tz),
+                         [(day(2025, 3, 8), 3600), (day(2025, 3, 9), 23 * 3600), (day(2025, 3, 10), 3600)])
+        self.assertEqual(buckets.split(self.local(2025, 11, 2), self.local(2025, 11, 3), 25 * 3600, self.tz),
+                         [(day(2025, 11, 2), 25 * 3600)])
+        # Durations shorter than the span are shared out proportionally, summing exactly
+        portions = buckets.split(self.local(2025, 7, 1, 23), self.local(2025, 7, 2, 2), 1000, self.tz)
+        self.assertEqual(portions, [(day(2025, 7, 1), 333), (day(2025, 7, 2), 667)])
+
+    def test_report_days_weeks_and_months_are_local(self):
+        params = {'start': '2025-03-08', 'end': '2025-04-02', 'breakdowns': 'week,month'}
+        self.assertTrue(rollups.can_answer(
+            buckets.parse_bound(params['start'], self.tz), buckets.parse_bound(params['end'], self.tz), (), self.tz))
+        rolled = self.api.get('/api/reports/', params).json()
+        daily = {row['date']: row['total'] for row in rolled['daily_stats']}
+        self.assertEqual(len(daily), 25)
+        self.assertEqual({day: total for day, total in daily.items() if total}, {
+            '2025-03-08': 3600, '2025-03-09': 3600, '2025-03-10': 3600, '2025-03-31': 1800, '2025-04-01': 1800,
+        })
+        self.assertEqual(rolled['monthly_stats'], [{'month': '2025-03-01', 'total': 12600}, {'month': '2025-04-01', 'total': 1800}])
+        self.assertEqual(rolled['weekly_stats'][0], {'week': '2025-03-03', 'total': 7200})
+        self.assertEqual(rolled['weekly_stats'][-1], {'week': '2025-03-31', 'total': 3600})
+        self.assertEqual(sum(row['total'] for row in rolled['weekly_stats']), rolled['total_duration'])
+        # Naive datetimes are local too; this bound isn't midnight, so the raw path answers
+        raw = self.api.get('/api/reports/', dict(params, start='2025-03-08T00:00:01')).json()
+        self.assertEqual(raw, rolled)
+        with_hours = self.api.get('/api/reports/', dict(params, breakdowns='hour')).json()
+        self.assertEqual({row['hour'] for row in with_hours['hourly_stats'] if row['total']}, {23, 9})
+
+    def test_report_ranges_are_bounded(self):
+        self.api.put('/api/settings/', {'timezone': 'Asia/Tokyo'}, format='json')
+        for params in ({'start': '1000-01-01', 'end': '9999-12-31'}, {'start': '0001-01-01', 'end': '0001-02-01'},
+                       {'start': '2025-01-01', 'end': '9999-12-31T23:00:00'}, {'start': '2025-02-30T00:00:00'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.api.get('/api/reports/', params).status_code, 400)
+        # An open range fills in zero days only over MAX_DAYS at most
+        report = self.api.get('/api/reports/', {'start': '1000-01-01', 'breakdowns': 'month'}).json()
+        self.assertEqual(len(report['daily_stats']), 3)
+        self.assertEqual(sum(row['total'] for row in report['monthly_stats']), report['total_duration'])
+        self.assertEqual(len(self.api.get('/api/reports/', {'start': '2020-01-01'}).json()['daily_stats']), 1918)
+
+    def test_timezone_change_rebuilds_rollups(self):
+        self.assertEqual(self.api.get('/api/reports/', {'start': '2025-03-08', 'end': '2025-03-09'}).json()['total_duration'], 0)
+        new_york_days = set(DailyRollup.objects.values_list('date', flat=True))
+        saved = self.api.put('/api/settings/', {'timezone': 'UTC'}, format='json').json()
+        self.assertTrue(saved['rollups_pending'])
+        # The rebuild runs as a job; meanwhile reports skip the rollup
+        self.assertEqual(set(DailyRollup.objects.values_list('date', flat=True)), new_york_days)
+        report = self.api.get('/api/reports/', {'start': '2025-03-09', 'end': '2025-03-10'}).json()
+        self.assertEqual(report['daily_stats'], [{'date': '2025-03-09', 'total': 7200}])
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertFalse(self.api.get('/api/settings/').json()['rollups_pending'])
+        self.assertEqual(self.api.get('/api/reports/', {'start': '2025-03-09', 'end': '2025-03-10'}).json(), report)
+        self.assertEqual(set(DailyRollup.objects.values_list('date', flat=True)),
+                         {datetime(2025, 3, day).date() for day in (9, 10)} | {datetime(2025, 4, 1).date()})
+        # Unknown names mean UTC, which the rows are already keyed in
+        self.assertFalse(self.api.put('/api/settings/', {'timezone': 'Mars/Olympus'}, format='json').json()['rollups_pending'])
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_live_time_is_split_over_local_days(self):
+        running = TimeEntry.objects.create(user=self.user, description='late', start_time=self.local(2025, 4, 2, 23))
+        report = reports.entry_report(TimeEntry.objects.filter(user=self.user), ('month',), self.tz)
+        payload, live = reports.with_live_time(report, now=self.local(2025, 4, 3, 1))
+        self.assertTrue(live)
+        self.assertEqual(payload['running_since'], running.start_time)
+        self.assertEqual(payload['daily_stats'][-2:], [
+            {'date': datetime(2025, 4, 2).date(), 'total': 3600}, {'date': datetime(2025, 4, 3).date(), 'total': 3600},
+        ])
+        self.assertEqual(payload['monthly_stats'][-1], {'month': datetime(2025, 4, 1).date(), 'total': 1800 + 7200})
+        self.assertEqual(report['daily_stats'][-1], {'date': datetime(2025, 4, 2).date(), 'total': 0})
+
+
+class ReportEngineTests(ReportTestCase):
+    def test_engine_matches_legacy_queries(self):
+        entries = TimeEntry.objects.filter(user=self.user)
+        with self.assertNumQueries(1):
+            report = reports.entry_report(entries)
+        self.assertEqual(report.pop('running')['since'], utc(2025, 7, 4, 8))
+        legacy = legacy_report(entries)
+        # Legacy puts all of the 23:00-01:00 entry on its start day and skips empty days
+        self.assertEqual(report.pop('daily_stats'), [
+            {'date': utc(2025, 7, 1).date(), 'total': 2 * 3600},
+            {'date': utc(2025, 7, 2).date(), 'total': 3600},
+            {'date': utc(2025, 7, 3).date(), 'total': 1800},
+            {'date': utc(2025, 7, 4).date(), 'total': 0},
+        ])
+        legacy.pop('daily_stats')
+        self.assertReportsEqual(report, legacy)
+
+    def test_breakdowns(self):
+        with self.assertNumQueries(2):
+            report = reports.entry_report(TimeEntry.objects.filter(user=self.user), reports.BREAKDOWNS)
+        self.assertEqual(report['weekly_stats'], [{'week': utc(2025, 6, 30).date(), 'total': 3.5 * 3600}])
+        hours = {row['hour']: row['total'] for row in report['hourly_stats'] if row['total']}
+        self.assertEqual(hours, {9: 3600, 23: 7200, 10: 1800})
+        self.assertEqual(
+            sorted(report['tag_stats'], key=str),
+            [{'tag__name': 'billable', 'total': 3 * 3600}, {'tag__name': 'meeting', 'total': 3600}],
+        )
+
+    def test_breakdowns_on_rollup_match_raw(self):
+        self.assertTrue(rollups.can_answer(None, None, ('tag', 'week')))
+        self.assertFalse(rollups.can_answer(None, None, ('hour',)))
+        rolled = self.api.get('/api/reports/', {'breakdowns': 'tag,week'}).json()
+        raw = self.raw_report(start='2000-01-01T00:00:01Z', breakdowns='tag,week')
+        for report in (rolled, raw):
+            report['tag_stats'] = sorted(report['tag_stats'], key=str)
+        self.assertReportsEqual(rolled, raw)
+        hourly = self.api.get('/api/reports/', {'breakdowns': 'hour,bogus'}).json()
+        self.assertEqual(len(hourly['hourly_stats']), 24)
+        self.assertNotIn('tag_stats', hourly)
+
+
+class TimeEntryListTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        base = utc(2025, 7, 1, 9)
+        # Two entries share each start_time so the id tie-breaker matters
+        self.entries = [self.entry(base + timedelta(hours=i // 2)) for i in range(7)]
+
+    def test_unpaginated_list_is_a_plain_array(self):
+        self.assertEqual(len(self.api.get('/api/time-entries/').json()), 7)
+
+    def test_keyset_pages_cover_every_entry_once(self):
+        for ordering, expected in (('start_time', self.entries), ('-start_time', self.entries[::-1])):
+            seen = []
+            params = {'page_size': 3, 'ordering': ordering}
+            while True:
+                page = self.api.get('/api/time-entries/', params).json()
+                seen.extend(row['id'] for row in page['results'])
+                if not page['next_cursor']:
+                    break
+                params = {'cursor': page['next_cursor'], 'page_size': 3}
+            self.assertEqual(seen, [entry.id for entry in expected])
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.api.get('/api/time-entries/', {'cursor': 'nope'}).status_code, 404)
+
+    def test_stream_yields_ndjson(self):
+        self.entries[0].tags.add(self.tag)
+        response = self.api.get('/api/time-entries/', {'stream': '1'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows], [entry.id for entry in self.entries])
+        self.assertEqual(rows[0]['tags'], [self.tag.id])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are asserted against SQLite')
+class QueryPlanTests(ApiTestCase):
+    """Guard the composite indexes against regressions to table scans."""
+
+    def setUp(self):
+        super().setUp()
+        self.entry(utc(2025, 7, 1, 9)).tags.add(self.tag)
+        self.project.due_date = utc(2025, 7, 20).date()
+        self.project.save()
+
+    def plans(self, method, path, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.api, method)(path, data, format='json' if method == 'post' else None)
+        self.assertEqual(response.status_code, 200)
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans[query['sql']] = [row[-1] for row in cursor.fetchall()]
+        return plans
+
+    def assertUsesIndex(self, plans, table, index):
+        relevant = {sql: plan for sql, plan in plans.items() if f'FROM "{table}"' in sql}
+        self.assertTrue(relevant, f'no queries against {table}')
+        for sql, plan in relevant.items():
+            with self.subTest(sql=sql):
+                self.assertTrue(any(index in line for line in plan), plan)
+                self.assertFalse([line for line in plan if line.startswith(f'SCAN {table}')], plan)
+
+    def test_reports_raw_path_uses_user_start_index(self):
+        plans = self.plans('get', '/api/reports/', {'start': '2025-07-01T08:30:00Z'})
+        self.assertUsesIndex(plans, 'api_timeentry', 'api_entry_user_start')
+
+    def test_reports_project_filter_uses_user_project_start_index(self):
+        plans = self.plans('post', '/api/reports/', {'start': '2025-07-01T08:30:00Z', 'project': self.project.id})
+        self.assertUsesIndex(plans, 'api_timeentry', 'api_entry_user_proj_start')
+
+    def test_reports_rollup_path_uses_rollup_index(self):
+        plans = self.plans('get', '/api/reports/', {'start': '2025-07-01'})
+        self.assertUsesIndex(plans, 'api_dailyrollup', 'api_rollup_user_tag_date')
+
+    def test_current_timer_uses_partial_unique_index(self):
+        TimeEntry.objects.create(user=self.user, description='running', start_time=utc(2025, 7, 2, 9))
+        plans = self.plans('get', '/api/time-entries/current/', None)
+        self.assertUsesIndex(plans, 'api_timeentry', 'api_entry_one_running')
+
+    def test_calendar_uses_user_start_and_due_date_indexes(self):
+        plans = self.plans('get', '/api/calendar/', {'month': '2025-07'})
+        self.assertUsesIndex(plans, 'api_timeentry', 'api_entry_user_start')
+        self.assertUsesIndex(plans, 'api_project', 'api_project_user_due')
+
+    def test_tags_by_usage_use_usage_index(self):
+        plans = self.plans('get', '/api/tags/', {'ordering': 'usage'})
+        self.assertUsesIndex(plans, 'api_tag', 'api_tag_user_usage')
+        self.assertFalse([line for plan in plans.values() for line in plan if 'TEMP B-TREE' in line])
+
+
+class CalendarTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.api.put('/api/settings/', {'timezone': 'America/New_York'}, format='json')
+        # 22:00 on June 30 in New York
+        self.late = self.entry(utc(2025, 7, 1, 2))
+        self.entry(utc(2025, 7, 1, 14), hours=2)
+        self.entry(utc(2025, 7, 1, 16), hours=0.5, project=self.other_project)
+        self.entry(utc(2025, 7, 1, 18), hours=0.5, project=None)
+        self.project.due_date = utc(2025, 7, 1).date()
+        self.project.save()
+
+    def test_days_follow_the_user_timezone(self):
+        july = self.api.get('/api/calendar/', {'month': '2025-07'}).json()
+        self.assertEqual((july['start'], july['end'], july['timezone']), ('2025-07-01', '2025-07-31', 'America/New_York'))
+        self.assertEqual(len(july['entries']), 3)
+        june = self.api.get('/api/calendar/', {'start': '2025-06-30', 'end': '2025-06-30'}).json()
+        self.assertEqual([entry['id'] for entry in june['entries']], [self.late.id])
+        self.assertEqual(june['projects'], [])
+
+    def test_compact_mode_returns_day_buckets(self):
+        response = self.api.get('/api/calendar/', {'start': '2025-06-01', 'end': '2025-07-31', 'compact': 1})
+        payload = response.json()
+        self.assertNotIn('entries', payload)
+        self.assertEqual([project['name'] for project in payload['projects']], ['Site'])
+        self.assertEqual(payload['days'], [
+            {'date': '2025-06-30', 'seconds': 3600, 'entries': 1, 'projects': [
+                {'id': self.project.id, 'name': 'Site', 'seconds': 3600}]},
+            {'date': '2025-07-01', 'seconds': 10800, 'entries': 3, 'projects': [
+                {'id': self.project.id, 'name': 'Site', 'seconds': 7200},
+                {'id': None, 'name': None, 'seconds': 1800},
+                {'id': self.other_project.id, 'name': 'App', 'seconds': 1800}]},
+        ])
+
+    def test_invalid_ranges_are_rejected(self):
+        for params in ({}, {'month': '2025-13'}, {'start': '2025-07-02', 'end': '2025-07-01'},
+                       {'start': '2024-01-01', 'end': '2025-07-01'}, {'start': 'soon', 'end': '2025-07-01'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.api.get('/api/calendar/', params).status_code, 400)
+
+    def test_ranges_that_leave_the_datetime_range_are_rejected(self):
+        self.api.put('/api/settings/', {'timezone': 'Asia/Tokyo'}, format='json')
+        for params in ({'month': '0001-01'}, {'month': '9999-12'}, {'start': '0001-01-01', 'end': '0001-01-31'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.api.get('/api/calendar/', params).status_code, 400)
+        self.assertEqual(self.api.get('/api/calendar/', {'month': '0001-02'}).status_code, 200)
+
+    def test_range_filter_uses_user_start_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.api.get('/api/calendar/', {'start': '2025-06-01', 'end': '2025-07-31', 'compact': 1})
+        entry_sql = [query['sql'] for query in queries.captured_queries if 'FROM "api_timeentry"' in query['sql']]
+        self.assertEqual(len(entry_sql), 1)
+        self.assertIn('"api_timeentry"."start_time" >=', entry_sql[0])
+        self.assertNotIn('django_datetime_extract', entry_sql[0])
+
+
+def make_signing_cert(common_name='test-signer'):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.now(dt_timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return key, cert.public_bytes(serialization.Encoding.PEM).decode('ascii')
+
+
+class FirebaseTokenTests(TestCase):
+    project_id = 'test-project'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.keys = {kid: make_signing_cert(kid) for kid in ('k1', 'k2')}
+
+    def setUp(self):
+        self.published = {'k1': self.keys['k1'][1]}
+        self.fetches = 0
+        self.now = time.time()
+        self.certificates = firebase_tokens.CertificateCache(
+            fetch=self.fetch, clock=lambda: self.now, min_refresh_interval=30
+        )
+        self.verifier = firebase_tokens.TokenVerifier(self.project_id, self.certificates, clock=lambda: self.now)
+        self.auth = FirebaseAuthentication()
+        patcher = mock.patch.object(firebase_tokens, '_verifier', self.verifier)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, url):
+        self.fetches += 1
+        return dict(self.published), 600
+
+    def token(self, kid='k1', uid='firebase-uid', email='bob@example.com', **claims):
+        now = int(time.time())
+        payload = {
+            'iss': firebase_tokens.ISSUER_PREFIX + self.project_id, 'aud': self.project_id,
+            'sub': uid, 'iat': now, 'exp': now + 3600, 'auth_time': now, 'email': email,
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self.keys[kid][0], algorithm='RS256', headers={'kid': kid})
+
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.auth.authenticate(request)
+
+    def test_verified_claims_are_cached_until_exp(self):
+        token = self.token()
+        with mock.patch.object(self.verifier, 'decode', wraps=self.verifier.decode) as decode:
+            self.verifier.verify(token)
+            self.verifier.verify(token)
+            self.assertEqual(decode.call_count, 1)
+            self.now += 3600 + self.verifier.leeway + 1
+            with self.assertRaises(firebase_tokens.TokenError):
+                self.verifier.verify(token)
+            self.assertEqual(decode.call_count, 2)
+
+    def test_rejects_bad_tokens(self):
+        other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        forged = jwt.encode(jwt.decode(self.token(), options={'verify_signature': False}), other_key,
+                            algorithm='RS256', headers={'kid': 'k1'})
+        for token in (forged, self.token(aud='someone-else'), self.token(exp=int(time.time()) - 60), 'garbage'):
+            with self.subTest(token=token[:20]):
+                with self.assertRaises(exceptions.AuthenticationFailed):
+                    self.authenticate(token)
+
+    def test_unknown_kid_refreshes_certificates_once_rotated(self):
+        self.verifier.verify(self.token())
+        self.assertEqual(self.fetches, 1)
+        self.published['k2'] = self.keys['k2'][1]
+        # Refreshes for unknown kids are rate limited
+        with self.assertRaises(firebase_tokens.TokenError):
+            self.verifier.verify(self.token(kid='k2'))
+        self.assertEqual(self.fetches, 1)
+        self.now += 31
+        self.verifier.verify(self.token(kid='k2', uid='rotated'))
+        self.assertEqual(self.fetches, 2)
+
+    def test_outage_keeps_cached_keys_and_backs_off(self):
+        self.verifier.verify(self.token())
+        self.now += 601
+        self.fetch = mock.Mock(side_effect=OSError('unreachable'))
+        self.certificates.fetch = self.fetch
+        for uid in range(5):
+            self.assertEqual(self.verifier.verify(self.token(uid=f'user-{uid}'))['sub'], f'user-{uid}')
+        self.assertEqual(self.fetch.call_count, 1)
+        self.now += 31
+        self.verifier.verify(self.token(uid='later'))
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_user_lookup_writes_only_on_change(self):
+        user, _ = self.authenticate(self.token())
+        self.assertEqual((user.username, user.email), ('firebase-uid', 'bob@example.com'))
+        with self.assertNumQueries(1):
+            self.authenticate(self.token(iat=int(time.time()) - 1))
+        with CaptureQueriesContext(connection) as queries:
+            user, _ = self.authenticate(self.token(email='new@example.com'))
+        self.assertEqual(user.email, 'new@example.com')
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries.captured_queries), 1)
+
+
+class ReportCacheTests(ApiTestCase):
+    params = {'start': '2025-07-01', 'end': '2025-07-08'}
+
+    def setUp(self):
+        super().setUp()
+        self.inside = self.entry(utc(2025, 7, 2, 9))
+        self.outside = self.entry(utc(2025, 8, 2, 9))
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        self.assertEqual([warning.id for warning in report_cache.check_shared_backend()], ['api.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with override_settings(REPORT_CACHE={'BACKEND': 'django'}, CACHES=shared):
+            self.assertEqual(report_cache.check_shared_backend(), [])
+        with override_settings(REPORT_CACHE={'BACKEND': 'django'}):
+            self.assertEqual(len(report_cache.check_shared_backend()), 1)
+
+    def test_repeated_reports_are_served_from_cache(self):
+        first = self.api.get('/api/reports/', self.params)
+        with self.assertNumQueries(0):
+            second = self.api.get('/api/reports/', {'end': '2025-07-08', 'start': '2025-07-01', 'tag': ''})
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_conditional_get_returns_304(self):
+        etag = self.api.get('/api/reports/', self.params)['ETag']
+        with self.assertNumQueries(0):
+            response = self.api.get('/api/reports/', self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_evicted_stamps_are_replaced_not_reset(self):
+        etag = self.api.get('/api/reports/', self.params)['ETag']
+        cache = report_cache.get_cache()
+        self.assertIsNot(cache.stamp_backend, cache.backend)
+        # Filling the payload LRU leaves the stamps alone
+        cache.backend.set_many({f'filler:{n}': n for n in range(cache.backend.max_entries)})
+        self.assertEqual(self.api.get('/api/reports/', self.params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Once the stamps written by a change are gone, the ETag from before it must not match
+        self.inside.duration = 60
+        self.inside.save()
+        cache.stamp_backend.clear()
+        response = self.api.get('/api/reports/', self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_duration'], 60)
+        self.assertEqual(self.api.get('/api/reports/', self.params, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_invalidation_is_limited_to_affected_dates(self):
+        etag = self.api.get('/api/reports/', self.params)['ETag']
+        self.outside.duration = 60
+        self.outside.save()
+        self.assertEqual(self.api.get('/api/reports/', self.params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.inside.duration = 60
+        self.inside.save()
+        response = self.api.get('/api/reports/', self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_duration'], 60)
+
+    def test_related_changes_and_other_users_are_isolated(self):
+        calendar = self.api.get('/api/calendar/', {'month': '2025-07'})
+        other = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        Project.objects.create(user=other, name='Theirs', status='active')
+        self.assertEqual(self.api.get('/api/calendar/', {'month': '2025-07'}, HTTP_IF_NONE_MATCH=calendar['ETag']).status_code, 304)
+        self.project.name = 'Renamed'
+        self.project.save()
+        report = self.api.get('/api/reports/', self.params).json()
+        self.assertEqual(report['project_stats'], [{'project__name': 'Renamed', 'total': 3600}])
+        self.assertEqual(self.api.get('/api/calendar/', {'month': '2025-07'}, HTTP_IF_NONE_MATCH=calendar['ETag']).status_code, 200)
+
+
+class BulkEndpointTests(ApiTestCase):
+    def payload(self, day, **extra):
+        data = {
+            'user': self.user.id, 'description': f'import {day}', 'project': self.project.id,
+            'start_time': f'2025-07-{day:02d}T09:00:00Z', 'end_time': f'2025-07-{day:02d}T10:00:00Z',
+            'duration': 3600, 'tags': [self.tag.id],
+        }
+        data.update(extra)
+        return data
+
+    def assertRollupConsistent(self):
+        current = sorted(DailyRollup.objects.values_list('date', 'project_id', 'tag_id', 'total_duration', 'entry_count'), key=str)
+        rollups.rebuild()
+        self.assertEqual(current, sorted(DailyRollup.objects.values_list('date', 'project_id', 'tag_id', 'total_duration', 'entry_count'), key=str))
+
+    def test_bulk_create_entries_with_tags(self):
+        response = self.api.post('/api/time-entries/bulk/', [self.payload(day) for day in range(1, 8)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['tags'] for row in response.json()], [[self.tag.id]] * 7)
+        self.assertEqual(TimeEntry.objects.filter(tags=self.tag).count(), 7)
+        self.assertEqual(self.api.get('/api/reports/', {'tag': self.tag.id}).json()['total_duration'], 7 * 3600)
+        self.assertRollupConsistent()
+
+    def test_bulk_create_reports_per_item_errors_and_writes_nothing(self):
+        response = self.api.post('/api/time-entries/bulk/', [self.payload(1), self.payload(2, start_time='nope')], format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('start_time', errors[1])
+        self.assertFalse(TimeEntry.objects.exists())
+
+    def test_bulk_update_retags_and_moves_entries(self):
+        entries = [self.entry(utc(2025, 7, day, 9)) for day in (1, 2, 3)]
+        entries[0].tags.add(self.tag)
+        report = self.api.get('/api/reports/', {'start': '2025-07-01', 'end': '2025-07-05'}).json()
+        self.assertEqual(report['total_duration'], 3 * 3600)
+        items = [{'id': entry.id, 'tags': [self.other_tag.id]} for entry in entries]
+        items[1]['duration'] = 60
+        response = self.api.patch('/api/time-entries/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['tags'] for row in response.json()], [[self.other_tag.id]] * 3)
+        self.assertFalse(TimeEntry.objects.filter(tags=self.tag).exists())
+        report = self.api.get('/api/reports/', {'start': '2025-07-01', 'end': '2025-07-05'}).json()
+        self.assertEqual(report['total_duration'], 2 * 3600 + 60)
+        self.assertRollupConsistent()
+
+    def test_bulk_update_rejects_unknown_and_foreign_ids(self):
+        mine = self.entry(utc(2025, 7, 1, 9))
+        other = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        theirs = TimeEntry.objects.create(user=other, description='x', start_time=utc(2025, 7, 1, 9))
+        response = self.api.patch('/api/time-entries/bulk/', [
+            {'id': mine.id, 'duration': 1}, {'id': theirs.id, 'duration': 1}, {'id': mine.id},
+        ], format='json')
+        self.assertEqual(response.json()['errors'], [{}, {'id': ['Not found.']}, {'id': ['Duplicate id.']}])
+        mine.refresh_from_db()
+        self.assertEqual(mine.duration, 3600)
+
+    def test_bulk_delete(self):
+        entries = [self.entry(utc(2025, 7, day, 9)) for day in (1, 2)]
+        entries[0].tags.add(self.tag)
+        response = self.api.delete('/api/time-entries/bulk/', {'ids': [entries[0].id, 999999]}, format='json')
+        self.assertEqual(response.json(), {'deleted': [entries[0].id], 'not_found': [999999]})
+        self.assertEqual(list(TimeEntry.objects.values_list('id', flat=True)), [entries[1].id])
+        self.assertRollupConsistent()
+
+    def test_bulk_tags_and_projects(self):
+        response = self.api.post('/api/tags/bulk/', [{'user': self.user.id, 'name': f't{i}'} for i in range(3)], format='json')
+        self.assertEqual(response.status_code, 201)
+        ids = [row['id'] for row in response.json()]
+        self.api.patch('/api/tags/bulk/', [{'id': pk, 'color': '#000000'} for pk in ids], format='json')
+        self.assertEqual(set(Tag.objects.filter(id__in=ids).values_list('color', flat=True)), {'#000000'})
+        response = self.api.delete('/api/projects/bulk/', {'ids': [self.project.id]}, format='json')
+        self.assertEqual(response.json()['deleted'], [self.project.id])
+
+
+class TagUsageTests(ApiTestCase):
+    def usage(self):
+        return dict(Tag.objects.values_list('name', 'usage_count'))
+
+    def assertUsageConsistent(self):
+        self.assertEqual(tag_usage.reconcile(), 0)
+
+    def test_links_and_deletes_update_counts(self):
+        first, second = self.entry(utc(2025, 7, 1, 9)), self.entry(utc(2025, 7, 2, 9))
+        first.tags.add(self.tag, self.other_tag)
+        self.other_tag.timeentry_set.add(second)
+        self.assertEqual(self.usage(), {'billable': 1, 'meeting': 2})
+        self.assertIsNotNone(Tag.objects.get(pk=self.tag.pk).last_used_at)
+        first.tags.remove(self.tag, self.tag.pk + 100)
+        self.assertEqual(self.usage(), {'billable': 0, 'meeting': 2})
+        self.other_tag.timeentry_set.clear()
+        second.tags.add(self.tag)
+        self.assertEqual(self.usage(), {'billable': 1, 'meeting': 0})
+        second.delete()
+        self.assertEqual(self.usage(), {'billable': 0, 'meeting': 0})
+        self.assertUsageConsistent()
+
+    def test_bulk_endpoints_update_counts(self):
+        payload = {
+            'user': self.user.id, 'description': 'import', 'start_time': '2025-07-01T09:00:00Z',
+            'end_time': '2025-07-01T10:00:00Z', 'duration': 3600, 'tags': [self.tag.id],
+        }
+        ids = [row['id'] for row in self.api.post('/api/time-entries/bulk/', [payload] * 3, format='json').json()]
+        self.assertEqual(self.usage(), {'billable': 3, 'meeting': 0})
+        self.api.patch('/api/time-entries/bulk/', [{'id': ids[0], 'tags': [self.other_tag.id]}], format='json')
+        self.assertEqual(self.usage(), {'billable': 2, 'meeting': 1})
+        self.api.delete('/api/time-entries/bulk/', {'ids': ids[1:]}, format='json')
+        self.assertEqual(self.usage(), {'billable': 0, 'meeting': 1})
+        self.assertUsageConsistent()
+
+    def test_reconcile_repairs_drift_and_counts_are_read_only(self):
+        self.entry(utc(2025, 7, 1, 9)).tags.add(self.tag)
+        Tag.objects.update(usage_count=7, last_used_at=None)
+        out = StringIO()
+        call_command('reconcile_tag_usage', stdout=out)
+        self.assertIn('Repaired usage counts of 2 tags', out.getvalue())
+        self.assertEqual(self.usage(), {'billable': 1, 'meeting': 0})
+        self.assertEqual(Tag.objects.get(pk=self.tag.pk).last_used_at, utc(2025, 7, 1, 9))
+        self.api.patch(f'/api/tags/{self.tag.pk}/', {'usage_count': 50}, format='json')
+        self.assertEqual(self.usage()['billable'], 1)
+
+    def test_ordering_by_usage(self):
+        entry = self.entry(utc(2025, 7, 1, 9))
+        entry.tags.add(self.other_tag)
+        names = [tag['name'] for tag in self.api.get('/api/tags/', {'ordering': 'usage'}).json()]
+        self.assertEqual(names, ['meeting', 'billable'])
+
+
+class EntrySerializationTests(ApiTestCase):
+    def make_entries(self, count):
+        for i in range(count):
+            entry = self.entry(utc(2025, 7, 1 + i % 28, 9), client=self.client_obj)
+            entry.tags.add(self.tag, self.other_tag)
+
+    def count_queries(self, path, params):
+        report_cache.get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        for path, params in (
+            ('/api/time-entries/', {}),
+            ('/api/time-entries/', {'expand': 'project,client,tags'}),
+            ('/api/time-entries/', {'page_size': 50, 'expand': 'tags'}),
+            ('/api/calendar/', {'month': '2025-07', 'expand': 'project,client,tags'}),
+        ):
+            with self.subTest(path=path, params=params):
+                TimeEntry.objects.all().delete()
+                self.make_entries(2)
+                few = self.count_queries(path, params)
+                self.make_entries(20)
+                self.assertEqual(self.count_queries(path, params), few)
+
+    def test_expand_embeds_compact_relations(self):
+        self.make_entries(1)
+        row = self.api.get('/api/time-entries/', {'expand': 'project,tags'}).json()[0]
+        self.assertEqual(row['project'], self.project.id)
+        self.assertEqual(row['expanded'], {
+            'project': {'id': self.project.id, 'name': 'Site', 'color': '#3b82f6'},
+            'tags': [
+                {'id': self.tag.id, 'name': 'billable', 'color': '#3b82f6'},
+                {'id': self.other_tag.id, 'name': 'meeting', 'color': '#3b82f6'},
+            ],
+        })
+        self.assertNotIn('expanded', self.api.get('/api/time-entries/').json()[0])
+        self.assertEqual(self.api.get('/api/time-entries/', {'expand': 'user'}).status_code, 400)
+
+
+class ExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = self.entry(utc(2025, 7, 1, 9), client=self.client_obj, description='Kick-off, "v1"')
+        self.first.tags.add(self.tag, self.other_tag)
+        self.entry(utc(2025, 7, 2, 9))
+        self.entry(utc(2025, 8, 1, 9))
+
+    def test_csv_export_streams_filtered_rows(self):
+        response = self.api.get('/api/export/entries.csv', {'start': '2025-07-01', 'end': '2025-08-01'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['description'], 'Kick-off, "v1"')
+        self.assertEqual(rows[0]['tags'], 'billable;meeting')
+        self.assertEqual(rows[0]['client_name'], 'Acme')
+
+    def test_jsonl_export_and_unknown_format(self):
+        response = self.api.get('/api/export/entries.jsonl')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['project_name'] for row in rows], ['Site'] * 3)
+        self.assertEqual(self.api.get('/api/export/entries.xml').status_code, 400)
+
+    def test_export_command_writes_chunks(self):
+        out = StringIO()
+        call_command('export_entries', 'alice', '--format', 'jsonl', '--chunk-size', '1', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+    def test_parquet_export_is_optional(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.assertEqual(self.api.get('/api/export/entries.parquet').status_code, 400)
+            return
+        response = self.api.get('/api/export/entries.parquet')
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.column('tags').to_pylist()[0], ['billable', 'meeting'])
+
+
+class SyncTests(ApiTestCase):
+    def sync(self, token=None):
+        response = self.api.get('/api/sync/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_full_snapshot_then_only_changes(self):
+        entry = self.entry(utc(2025, 7, 1, 9))
+        snapshot = self.sync()
+        self.assertTrue(snapshot['reset'])
+        self.assertEqual([row['id'] for row in snapshot['time_entries']], [entry.id])
+        self.assertEqual(len(snapshot['tags']), 2)
+        with mock.patch.object(sync, 'SYNC_OVERLAP', timedelta(0)):
+            quiet = self.sync(snapshot['token'])
+            self.assertFalse(quiet['reset'])
+            self.assertEqual([quiet[name] for name in sync.RESOURCES], [[], [], [], []])
+            entry.tags.add(self.tag)
+            deleted_id = self.other_tag.id
+            self.other_tag.delete()
+            changed = self.sync(quiet['token'])
+        self.assertEqual([row['tags'] for row in changed['time_entries']], [[self.tag.id]])
+        self.assertEqual(changed['deleted']['tags'], [deleted_id])
+        self.assertEqual(changed['clients'], [])
+
+    def test_deleting_project_touches_entries(self):
+        entry = self.entry(utc(2025, 7, 1, 9))
+        token = self.sync()['token']
+        with mock.patch.object(sync, 'SYNC_OVERLAP', timedelta(0)):
+            self.api.delete('/api/projects/bulk/', {'ids': [self.project.id]}, format='json')
+            changed = self.sync(token)
+        self.assertEqual(changed['deleted']['projects'], [self.project.id])
+        self.assertEqual([(row['id'], row['project']) for row in changed['time_entries']], [(entry.id, None)])
+
+    def test_snapshots_include_archived_entries(self):
+        old = self.entry(utc(2023, 3, 1, 9))
+        old.tags.add(self.tag)
+        recent = self.entry(utc(2025, 7, 1, 9))
+        token = self.sync()['token']
+        call_command('archive_entries', '--before', '2024-01-01', stdout=StringIO())
+        snapshot = self.sync()
+        self.assertEqual(sorted((row['id'], row['tags']) for row in snapshot['time_entries']),
+                         [(old.id, [self.tag.id]), (recent.id, [])])
+        with mock.patch.object(sync, 'SYNC_OVERLAP', timedelta(0)):
+            # Archiving changes nothing the client sees
+            self.assertEqual(self.sync(token)['time_entries'], [])
+            self.api.delete('/api/projects/bulk/', {'ids': [self.project.id]}, format='json')
+            changed = self.sync(token)
+        self.assertEqual(sorted((row['id'], row['project']) for row in changed['time_entries']),
+                         [(old.id, None), (recent.id, None)])
+
+    def test_stale_or_invalid_tokens(self):
+        old = sync.encode_token(utc(2000, 1, 1))
+        self.assertTrue(self.sync(old)['reset'])
+        self.assertEqual(self.api.get('/api/sync/', {'since': 'nope'}).status_code, 400)
+
+
+class SearchTests(ApiTestCase):
+    def search(self, q, **params):
+        response = self.api.get('/api/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def found(self, q, **params):
+        return [(row['type'], row['id']) for row in self.search(q, **params)['results']]
+
+    def test_ranked_prefix_matches_across_resources(self):
+        meeting = self.entry(utc(2025, 3, 4, 9), description='Quarterly planning meeting')
+        self.entry(utc(2025, 3, 5, 9), description='Deploy')
+        Client.objects.filter(pk=self.client_obj.pk).update(notes='met at the planning offsite')
+        search.rebuild(users=[self.user])
+        self.project.description = 'Planning for the relaunch'
+        self.project.save()
+        found = self.found('plan')
+        self.assertEqual(set(found), {('time_entries', meeting.id), ('projects', self.project.id), ('clients', self.client_obj.id)})
+        # A title match outranks a body match
+        self.assertEqual(found[0], ('time_entries', meeting.id))
+        self.assertEqual(self.found('quart meet'), [('time_entries', meeting.id)])
+        self.assertEqual(self.found('plan', type='projects,clients')[0][0], 'projects')
+        [row] = self.search('quarterly')['results']
+        self.assertEqual(row['object']['description'], 'Quarterly planning meeting')
+
+    def test_index_follows_writes(self):
+        entry = self.entry(utc(2025, 3, 4, 9), description='Standup')
+        entry.description = 'Retro'
+        entry.save()
+        self.assertEqual(self.found('standup'), [])
+        self.assertEqual(self.found('retro'), [('time_entries', entry.id)])
+        payload = {'user': self.user.id, 'description': 'Imported retro', 'start_time': '2025-03-05T09:00:00Z',
+                   'end_time': '2025-03-05T10:00:00Z', 'duration': 3600}
+        ids = [row['id'] for row in self.api.post('/api/time-entries/bulk/', [payload] * 2, format='json').json()]
+        self.assertEqual(len(self.found('retro')), 3)
+        self.api.patch('/api/time-entries/bulk/', [{'id': ids[0], 'description': 'Review'}], format='json')
+        self.api.delete('/api/time-entries/bulk/', {'ids': ids[1:]}, format='json')
+        entry.delete()
+        self.assertEqual(self.found('retro'), [])
+        self.assertEqual(self.found('review'), [('time_entries', ids[0])])
+
+    def test_results_are_private_and_paged(self):
+        other = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        TimeEntry.objects.create(user=other, description='review', start_time=utc(2025, 3, 1, 9), duration=0, end_time=utc(2025, 3, 1, 9))
+        mine = {self.entry(utc(2025, 3, 1 + n, 9), description='review').id for n in range(5)}
+        first = self.search('review', page_size=2)
+        seen = [row['id'] for row in first['results']]
+        cursor = first['next_cursor']
+        while cursor:
+            page = self.search('review', page_size=2, cursor=cursor)
+            seen += [row['id'] for row in page['results']]
+            cursor = page['next_cursor']
+        self.assertEqual(sorted(seen), sorted(mine))
+        self.assertIn('cursor=', first['next'])
+        other.delete()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM api_search')
+            self.assertEqual(cursor.fetchone()[0], 5 + 3)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.api.get('/api/search/', {'q': '!!'}).status_code, 400)
+        self.assertEqual(self.api.get('/api/search/', {'q': 'x', 'type': 'tags'}).status_code, 400)
+        self.assertEqual(self.api.get('/api/search/', {'q': 'x', 'cursor': 'nope'}).status_code, 400)
+
+    def test_rebuild_command(self):
+        entry = self.entry(utc(2025, 3, 4, 9), description='Workshop')
+        search.remove([entry])
+        self.assertEqual(self.found('workshop'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 4 documents', out.getvalue())
+        self.assertEqual(self.found('workshop'), [('time_entries', entry.id)])
+
+
+class ProfileCacheTests(ApiTestCase):
+    def test_settings_exist_from_registration_and_reads_are_cached(self):
+        self.assertTrue(Settings.objects.filter(user=self.user).exists())
+        response = APIClient().post('/api/auth/register/', {'username': 'carol', 'email': 'c@example.com', 'password': 'pw'}, format='json')
+        self.assertTrue(Settings.objects.filter(user_id=response.json()['id']).exists())
+        self.assertEqual(self.api.get('/api/settings/').json()['timezone'], 'UTC')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get('/api/settings/').json()['theme'], 'system')
+            self.assertEqual(self.api.get('/api/user/').json()['username'], 'alice')
+            self.assertEqual(self.api.get('/api/user/').json()['username'], 'alice')
+            self.assertEqual(buckets.user_timezone(self.user.pk).key, 'UTC')
+
+    def test_saves_invalidate(self):
+        self.api.get('/api/settings/')
+        self.api.get('/api/user/')
+        self.assertEqual(self.api.put('/api/settings/', {'theme': 'dark'}, format='json').json()['theme'], 'dark')
+        self.assertEqual(self.api.get('/api/settings/').json()['theme'], 'dark')
+        self.user.email = 'new@example.com'
+        self.user.save()
+        self.assertEqual(self.api.get('/api/user/').json()['email'], 'new@example.com')
+        self.api.put('/api/settings/', {'default_project': self.project.id}, format='json')
+        self.api.delete('/api/projects/bulk/', {'ids': [self.project.id]}, format='json')
+        self.assertIsNone(self.api.get('/api/settings/').json()['default_project'])
+
+    def test_request_memo_and_missing_rows(self):
+        request = RequestFactory().get('/')
+        first = profile_cache.get_settings(self.user.pk, request)
+        report_cache.get_cache().clear()
+        with self.assertNumQueries(0):
+            self.assertIs(profile_cache.get_settings(self.user.pk, request), first)
+        Settings.objects.filter(user=self.user).delete()
+        self.assertEqual(profile_cache.create_missing_settings(), 1)
+        self.assertEqual(profile_cache.create_missing_settings(), 0)
+
+
+class ArchiveTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old = self.entry(utc(2023, 3, 1, 22), hours=4, description='Legacy migration')
+        self.old.tags.add(self.tag)
+        self.entry(utc(2023, 3, 2, 9), project=self.other_project).tags.add(self.tag, self.other_tag)
+        self.recent = self.entry(utc(2025, 3, 2, 9))
+        self.recent.tags.add(self.tag)
+        self.before = self.api.get('/api/reports/', {'breakdowns': 'tag'}).json()
+        out = StringIO()
+        call_command('archive_entries', '--before', '2024-01-01', stdout=out)
+        self.assertIn('Archived 2 entries', out.getvalue())
+
+    def test_old_entries_move_with_their_tags(self):
+        self.assertEqual(list(TimeEntry.objects.values_list('pk', flat=True)), [self.recent.pk])
+        archived = ArchivedTimeEntry.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.created_at, self.old.created_at)
+        self.assertEqual(list(archived.tags.values_list('name', flat=True)), ['billable'])
+        self.assertEqual(self.api.get('/api/settings/').json()['archived_before'], '2024-01-01T00:00:00Z')
+        self.assertEqual(tag_usage.reconcile(), 0)
+        self.assertEqual(Tag.objects.get(pk=self.tag.pk).usage_count, 3)
+        self.assertEqual(search.results(self.user, search.search(self.user, 'legacy')[0])[0]['id'], self.old.pk)
+        self.assertEqual(archive.archive(utc(2024, 1, 1)), 0)
+
+    def test_reports_read_the_archive_only_when_the_range_reaches_it(self):
+        report_cache.get_cache().clear()
+        self.assertEqual(self.api.get('/api/reports/', {'breakdowns': 'tag'}).json(), self.before)
+        rollups.rebuild()
+        report_cache.get_cache().clear()
+        self.assertEqual(self.api.get('/api/reports/', {'breakdowns': 'tag'}).json(), self.before)
+        # Not on local-midnight bounds: the raw engine reads both tables
+        partial = self.api.get('/api/reports/', {'start': '2023-03-01T12:00:00Z', 'breakdowns': 'tag'}).json()
+        self.assertEqual(partial['total_entries'], 3)
+        self.assertEqual({row['tag__name']: row['total'] for row in partial['tag_stats']}, {'billable': 6 * 3600, 'meeting': 3600})
+        with CaptureQueriesContext(connection) as queries:
+            self.api.get('/api/reports/', {'start': '2025-01-01T12:00:00Z'})
+        self.assertFalse(any('api_archivedtimeentry' in query['sql'] for query in queries.captured_queries))
+
+    def test_calendar_and_export_include_archived_entries(self):
+        month = self.api.get('/api/calendar/', {'month': '2023-03'}).json()
+        self.assertEqual([entry['id'] for entry in month['entries']], sorted(ArchivedTimeEntry.objects.values_list('pk', flat=True)))
+        days = self.api.get('/api/calendar/', {'month': '2023-03', 'compact': 1}).json()['days']
+        self.assertEqual([(day['date'], day['entries']) for day in days], [('2023-03-01', 1), ('2023-03-02', 1)])
+        response = self.api.get('/api/export/entries.jsonl')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['description'] for row in rows], ['Legacy migration', 'work', 'work'])
+
+    def test_entry_list_includes_archived_entries(self):
+        rows = self.api.get('/api/time-entries/', {'expand': 'tags'}).json()
+        self.assertEqual([row['description'] for row in rows], ['Legacy migration', 'work', 'work'])
+        self.assertEqual(rows[1]['project'], self.other_project.pk)
+        self.assertEqual(rows[0]['tags'], [self.tag.pk])
+        self.assertEqual(rows[0]['expanded']['tags'][0]['name'], 'billable')
+        first = self.api.get('/api/time-entries/', {'page_size': 2, 'ordering': '-start_time'}).json()
+        self.assertEqual([row['description'] for row in first['results']], ['work', 'work'])
+        rest = self.api.get('/api/time-entries/', {'cursor': first['next_cursor']}).json()
+        self.assertEqual([row['description'] for row in rest['results']], ['Legacy migration'])
+        self.assertIsNone(rest['next_cursor'])
+        stream = self.api.get('/api/time-entries/', {'stream': 1})
+        lines = b''.join(stream.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['description'] for line in lines], ['Legacy migration', 'work', 'work'])
+
+    def test_archived_entry_can_be_retrieved_changed_and_deleted(self):
+        path = f'/api/time-entries/{self.old.pk}/'
+        self.assertEqual(self.api.get(path).json()['description'], 'Legacy migration')
+        self.assertFalse(TimeEntry.objects.filter(pk=self.old.pk).exists())
+        response = self.api.patch(path, {'description': 'Legacy import'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        restored = TimeEntry.objects.get(pk=self.old.pk)
+        self.assertEqual((restored.description, restored.created_at), ('Legacy import', self.old.created_at))
+        self.assertEqual(list(restored.tags.values_list('pk', flat=True)), [self.tag.pk])
+        self.assertFalse(ArchivedTimeEntry.objects.filter(pk=self.old.pk).exists())
+        other = ArchivedTimeEntry.objects.get()
+        self.assertEqual(self.api.delete(f'/api/time-entries/{other.pk}/').status_code, 204)
+        self.assertFalse(TimeEntry.objects.filter(pk=other.pk).exists() or ArchivedTimeEntry.objects.exists())
+        self.assertEqual(tag_usage.reconcile(), 0)
+        self.assertEqual(Tag.objects.get(pk=self.other_tag.pk).usage_count, 0)
+        self.assertEqual(self.api.get('/api/reports/').json()['total_entries'], 2)
+        self.assertEqual(self.api.get('/api/time-entries/999999/').status_code, 404)
+
+
+class JobTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.entry(utc(2025, 3, 3, 9), hours=2).tags.add(self.tag)
+        self.entry(utc(2025, 3, 5, 13), project=self.other_project)
+
+    def test_async_report_runs_as_a_job(self):
+        params = {'start': '2025-03-03T08:00:00Z', 'breakdowns': 'tag,hour'}
+        expected = self.api.get('/api/reports/', params).json()
+        response = self.api.get('/api/reports/', {**params, 'async': 1})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'queued')
+        result_url = response['Location'] + 'result/'
+        self.assertEqual(self.api.get(result_url).status_code, 202)
+        self.assertEqual(self.api.get('/api/reports/', params, HTTP_PREFER='respond-async').status_code, 202)
+        self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual(self.api.get(result_url).json(), expected)
+        self.assertEqual([job['status'] for job in self.api.get('/api/jobs/').json()], ['done', 'done'])
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('bob', 'bob@example.com', 'pw'))
+        self.assertEqual(other.get(result_url).status_code, 404)
+
+    @override_settings(JOBS={'REPORT_INLINE_MAX_DAYS': 31})
+    def test_long_raw_reports_are_queued(self):
+        self.assertEqual(self.api.get('/api/reports/', {'start': '2025-03-03T08:00:00Z', 'end': '2025-03-10T08:00:00Z'}).status_code, 200)
+        self.assertEqual(self.api.get('/api/reports/', {'start': '2025-01-01'}).status_code, 200)
+        self.assertEqual(self.api.get('/api/reports/', {'start': '2024-03-03T08:00:00Z'}).status_code, 202)
+
+    @override_settings(JOBS={'MAX_ATTEMPTS': 2, 'RETRY_SECONDS': 0})
+    def test_failing_jobs_retry_then_fail(self):
+        job = jobs.enqueue('report', self.user, {})
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(self.api.get(f'/api/jobs/{job.pk}/result/').status_code, 500)
+        with self.assertRaises(jobs.UnknownJob):
+            jobs.enqueue('nope')
+        running = jobs.enqueue('report', self.user, {'params': {}})
+        Job.objects.filter(pk=running.pk).update(status='running', started_at=utc(2025, 1, 1), attempts=1)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim().pk, running.pk)
+
+    def test_weekly_reports_are_mailed_once(self):
+        Settings.objects.filter(user=self.user).update(timezone='Europe/Berlin')
+        carol = User.objects.create_user('carol', 'carol@example.com', 'pw')
+        Settings.objects.filter(user=carol).update(weekly_reports=False)
+        User.objects.create_user('dave', '', 'pw')
+        now = utc(2025, 3, 10, 12)
+        self.assertEqual(report_jobs.schedule_weekly_reports(now), 1)
+        self.assertEqual(report_jobs.schedule_weekly_reports(now), 0)
+        out = StringIO()
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            call_command('run_jobs', '--processes', '0', '--once', stdout=out)
+        self.assertIn('Ran 1 jobs', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['alice@example.com'])
+        self.assertEqual(message.subject, 'Weekly report: 3h 00m tracked')
+        self.assertIn('Your week of 03 March 2025', message.body)
+        self.assertIn('  Site: 2h 00m\n  App: 1h 00m\n', message.body)
+        self.assertIn('  Wed 05 Mar: 1h 00m\n', message.body)
+        job = Job.objects.get(kind='weekly_report')
+        self.assertEqual((job.key, job.result['week']), (f'weekly:{self.user.pk}:2025-03-03', '2025-03-03'))
+
+
+class RenderingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for day in range(1, 21):
+            self.entry(utc(2025, 3, day, 9), description=f'Entry number {day}').tags.add(self.tag)
+
+    def test_columnar_layout(self):
+        self.assertEqual(
+            columnar({'results': [{'id': 1, 'tags': [{'id': 5}]}, {'id': 2, 'tags': []}], 'mixed': [{'a': 1}, {'b': 2}]}),
+            {'results': {'columns': {'id': [1, 2], 'tags': [{'columns': {'id': [5]}}, []]}}, 'mixed': [{'a': 1}, {'b': 2}]},
+        )
+        expected = self.api.get('/api/calendar/', {'month': '2025-03'}).json()['entries']
+        response = self.api.get('/api/calendar/', {'month': '2025-03', 'format': 'columnar'})
+        self.assertEqual(response['Content-Type'], 'application/vnd.columnar+json')
+        columns = response.json()['entries']['columns']
+        self.assertEqual(columns['description'], [entry['description'] for entry in expected])
+        self.assertIn('Accept', response['Vary'])
+
+    @skipUnless(MessagePackRenderer.available, 'msgpack is not installed')
+    def test_messagepack(self):
+        import msgpack
+        expected = self.api.get('/api/reports/').json()
+        response = self.api.get('/api/reports/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+        self.assertNotEqual(response['ETag'], self.api.get('/api/reports/')['ETag'])
+        self.assertEqual(self.api.get('/api/reports/', HTTP_ACCEPT='application/msgpack', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_missing_optional_renderer_is_not_acceptable(self):
+        with mock.patch.object(MessagePackRenderer, 'available', False):
+            self.assertEqual(self.api.get('/api/tags/', HTTP_ACCEPT='application/msgpack').status_code, 406)
+            self.assertEqual(self.api.get('/api/tags/', HTTP_ACCEPT='application/msgpack, application/json;q=0.5').status_code, 200)
+
+    def test_compression_is_negotiated(self):
+        self.assertEqual(compression.parse_accept_encoding('gzip;q=0.5, br, *;q=0'), {'gzip': 0.5, 'br': 1.0, '*': 0.0})
+        self.assertEqual(compression.choose('gzip;q=0.5, identity')[0], 'gzip')
+        self.assertIsNone(compression.choose('br;q=0, gzip;q=0, deflate'))
+        plain = self.api.get('/api/calendar/', {'month': '2025-03'})
+        self.assertNotIn('Content-Encoding', plain)
+        response = self.api.get('/api/calendar/', {'month': '2025-03'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(self.api.get('/api/calendar/', {'month': '2025-03'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertNotIn('Content-Encoding', self.api.get('/api/settings/', HTTP_ACCEPT_ENCODING='gzip'))
+        export = self.api.get('/api/export/entries.csv', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(export['Content-Encoding'], 'gzip')
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(b''.join(export.streaming_content)).decode())))
+        self.assertEqual(len(rows), 20)
+
+    def test_payload_size_benchmark(self):
+        results = benchmarks.payload_sizes(self.user, repeat=1, only=['calendar.month'])
+        sizes = results['calendar.month']
+        self.assertLess(sizes['columnar']['bytes'], sizes['json']['bytes'])
+        self.assertLess(sizes['json']['gzip_bytes'], sizes['json']['bytes'])
+
+
+class FastSerializerTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.project.due_date = datetime(2025, 9, 30).date()
+        self.project.save()
+        self.entry(utc(2025, 3, 1, 9), client=self.client_obj).tags.add(self.other_tag, self.tag)
+        self.entry(utc(2025, 3, 2, 9), project=None, description='No project')
+        running = TimeEntry.objects.create(user=self.user, description='Running', start_time=utc(2025, 3, 3, 9))
+        running.tags.add(self.tag)
+
+    def assertSameOutput(self, values_class, queryset, context=None):
+        expected = values_class.serializer_class(list(queryset), many=True, context=context or {}).data
+        values_serializer = values_class(context)
+        actual = values_serializer.serialize(list(values_serializer.queryset(queryset)))
+        # Key order too: the JSON bodies must be byte for byte the same
+        self.assertEqual(json.dumps(actual, cls=JSONEncoder), json.dumps(expected, cls=JSONEncoder))
+
+    def test_output_matches_drf_serializers(self):
+        entries = TimeEntry.objects.filter(user=self.user).order_by('id')
+        for expand in ((), ('project',), ('project', 'client', 'tags')):
+            with self.subTest(expand=expand):
+                self.assertSameOutput(
+                    fast_serializers.TimeEntryValuesSerializer, optimize_entry_queryset(entries, expand), {'expand': expand},
+                )
+        for values_class in (
+            fast_serializers.ProjectValuesSerializer, fast_serializers.ClientValuesSerializer, fast_serializers.TagValuesSerializer,
+        ):
+            with self.subTest(values_class=values_class.__name__):
+                model = values_class.serializer_class.Meta.model
+                self.assertSameOutput(values_class, model.objects.filter(user=self.user).order_by('id'))
+
+    def test_list_endpoints(self):
+        self.assertEqual(
+            self.api.get('/api/projects/').json(),
+            json.loads(json.dumps(ProjectSerializer(Project.objects.filter(user=self.user), many=True).data, cls=JSONEncoder)),
+        )
+        first = self.api.get('/api/time-entries/', {'page_size': 2, 'expand': 'tags'}).json()
+        self.assertEqual([row['description'] for row in first['results']], ['work', 'No project'])
+        self.assertEqual(first['results'][0]['tags'], sorted([self.tag.id, self.other_tag.id]))
+        second = self.api.get('/api/time-entries/', {'cursor': first['next_cursor'], 'expand': 'tags'}).json()
+        self.assertEqual([row['expanded']['tags'] for row in second['results']], [[{'id': self.tag.id, 'name': 'billable', 'color': '#3b82f6'}]])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_serializer_benchmark(self):
+        results = benchmarks.serializer_throughput(self.user, repeat=1, only=['time_entries', 'tags'])
+        self.assertEqual(set(results), {'time_entries', 'time_entries.expand', 'tags'})
+        self.assertEqual(results['time_entries']['rows'], 3)
+        self.assertGreater(results['tags']['values'], 0)
+
+
+class LoadTests(TestCase):
+    def test_seed_load_bulk_creates_related_rows(self):
+        out = StringIO()
+        call_command('seed_load', '--users', '2', '--entries', '50', '--projects', '4', '--tags', '3', '--batch-size', '20', stdout=out)
+        users = User.objects.filter(username__startswith='load-')
+        self.assertEqual(users.count(), 2)
+        self.assertEqual(TimeEntry.objects.filter(user__in=users).count(), 100)
+        self.assertEqual(Project.objects.filter(user__in=users).count(), 8)
+        self.assertTrue(DailyRollup.objects.filter(user__in=users).exists())
+        for entry in TimeEntry.objects.filter(project__isnull=False)[:20]:
+            self.assertEqual(entry.client_id, entry.project.client_id)
+        with self.assertRaises(CommandError):
+            call_command('seed_load', stdout=out)
+
+    def test_benchmark_records_and_compares_baseline(self):
+        [user] = loadgen.seed(entries=30)
+        results = benchmarks.run(user, repeat=3, only=['reports', 'calendar.month'])
+        self.assertEqual(set(results), {'reports.all', 'reports.year', 'reports.breakdowns', 'reports.cached', 'calendar.month'})
+        self.assertEqual(results['reports.cached']['queries'], 0)
+        self.assertGreater(results['reports.all']['p95_ms'], 0)
+        self.assertEqual(benchmarks.compare(results, results), [])
+        slower = {**results, 'reports.all': {**results['reports.all'], 'queries': results['reports.all']['queries'] + 1}}
+        self.assertEqual(len(benchmarks.compare(results, slower)), 1)
+
+
+class PerformanceMetricsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.entry(utc(2025, 7, 1, 9)).tags.add(self.tag)
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('api.perf', 'INFO') as logs:
+            response = self.api.get('/api/time-entries/')
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, total;dur=[\d.]+$')
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'timeentry-list')
+        self.assertEqual(record['bytes'], len(response.content))
+        self.assertGreaterEqual(record['db_queries'], 2)
+
+    def test_streamed_responses_are_logged_when_the_body_ends(self):
+        with self.assertLogs('api.perf', 'INFO') as logs:
+            response = self.api.get('/api/time-entries/', {'stream': 1})
+            self.assertEqual(logs.output, [])
+            body = b''.join(response.streaming_content)
+        self.assertEqual(json.loads(logs.records[-1].getMessage())['bytes'], len(body))
+
+    def test_prometheus_endpoint_needs_the_token(self):
+        self.api.get('/api/reports/')
+        self.api.get('/api/reports/')
+        scraper = APIClient(HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(scraper.get('/api/metrics/').status_code, 404)
+        with self.settings(PERF_METRICS={'TOKEN': 's3cret'}):
+            text = scraper.get('/api/metrics/').content.decode()
+            self.assertEqual(APIClient(REMOTE_ADDR='127.0.0.1').get('/api/metrics/').status_code, 404)
+            self.assertEqual(APIClient(HTTP_AUTHORIZATION='Bearer wrong').get('/api/metrics/').status_code, 404)
+        self.assertIn('api_request_duration_seconds_count{view="reports",method="GET",status="2xx"} 2', text)
+        self.assertIn('api_request_duration_seconds_bucket{view="reports",method="GET",status="2xx",le="+Inf"} 2', text)
+        self.assertIn('api_request_db_queries_total{view="reports"', text)
+
+    def test_slow_query_log_samples_stacks(self):
+        config = {'SLOW_QUERY_MS': 0, 'SLOW_QUERY_STACK_SAMPLE_RATE': 1.0}
+        with self.settings(PERF_METRICS=config), self.assertLogs('api.perf.slow_query', 'WARNING') as logs:
+            self.api.get('/api/tags/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertIn('api_tag', record['sql'])
+        self.assertIn('stack', record)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+        self.rollbacks = 0
+
+    def cursor(self):
+        if not self.healthy:
+            raise OSError('server closed the connection')
+        return mock.Mock()
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+    def pool(self, **kwargs):
+        self.opened = []
+
+        def connect():
+            self.opened.append(FakeConnection())
+            return self.opened[-1]
+        return db_pool.ConnectionPool(connect, **kwargs)
+
+    def test_reuses_released_connections(self):
+        pool = self.pool(max_size=2)
+        first = pool.acquire()
+        second = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        pool.release(second, discard=True)
+        self.assertTrue(second.closed)
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_waits_then_times_out_when_full(self):
+        pool = self.pool(max_size=1, timeout=0.05)
+        held = pool.acquire()
+        with self.assertRaises(db_pool.PoolTimeout):
+            pool.acquire()
+        threading.Timer(0.01, pool.release, [held]).start()
+        pool.timeout = 5
+        self.assertIs(pool.acquire(), held)
+        stats = pool.stats()
+        self.assertEqual((stats['timeouts'], stats['waited']), (1, 2))
+
+    def test_health_checks_and_expiry(self):
+        pool = self.pool(check_after=0, max_idle=60)
+        broken = pool.acquire()
+        pool.release(broken)
+        broken.healthy = False
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+        pool.release(replacement)
+        pool.max_idle = 0
+        self.assertIsNot(pool.acquire(), replacement)
+        self.assertTrue(replacement.closed)
+
+    def test_pooled_engine_hands_connections_across_threads(self):
+        engine = 'api.db_backends.sqlite3'
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {**connection.settings_dict, 'ENGINE': engine, 'NAME': f'{directory}/pool.sqlite3'}
+            wrapper_class = load_backend(engine).DatabaseWrapper
+            raw = []
+
+            def request():
+                wrapper = wrapper_class(settings_dict, 'pool-test')
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                raw.append(wrapper.connection)
+                wrapper.close()
+            try:
+                for _ in range(2):
+                    thread = threading.Thread(target=request)
+                    thread.start()
+                    thread.join()
+                self.assertIs(raw[0], raw[1])
+                self.assertIn('api_db_pool_acquired_total{database="pool-test"} 2', db_pool.render())
+                self.assertIn('api_db_pool_created_total{database="pool-test"} 1', db_pool.render())
+            finally:
+                db_pool.close_pool('pool-test')
+            result = benchmarks.connection_latency(settings_dict, pooled=True, requests=20, concurrency=2)
+            self.assertGreater(result['per_second'], 0)
+        self.assertNotIn('pool-test', db_pool.stats())
+
+
+class TimerTests(ApiTestCase):
+    def start(self, **data):
+        return self.api.post('/api/time-entries/start/', {'description': 'timer', **data}, format='json')
+
+    def test_start_stop_computes_duration(self):
+        self.assertEqual(self.api.get('/api/time-entries/current/').status_code, 204)
+        started = self.start(project=self.project.id, start_time='2025-07-01T09:00:00Z', duration=999)
+        self.assertEqual(started.status_code, 201)
+        self.assertEqual((started.json()['end_time'], started.json()['duration']), (None, 0))
+        self.assertEqual(self.start().status_code, 409)
+        with self.assertNumQueries(1):
+            self.assertEqual(timers.current(self.user).id, started.json()['id'])
+        with mock.patch.object(timers.timezone, 'now', return_value=utc(2025, 7, 1, 10, 30)):
+            stopped = self.api.post('/api/time-entries/stop/').json()
+        self.assertEqual((stopped['end_time'], stopped['duration']), ('2025-07-01T10:30:00Z', 5400))
+        self.assertEqual(self.api.post('/api/time-entries/stop/').status_code, 409)
+
+    def test_switch_stops_and_starts_at_the_same_instant(self):
+        first = self.start().json()
+        switched = self.api.post('/api/time-entries/switch/', {'description': 'next'}, format='json').json()
+        self.assertEqual(switched['stopped']['id'], first['id'])
+        self.assertEqual(switched['stopped']['end_time'], switched['started']['start_time'])
+        self.assertEqual(TimeEntry.objects.filter(user=self.user, end_time__isnull=True).count(), 1)
+
+    def test_plain_create_of_second_running_entry_conflicts(self):
+        self.start()
+        response = self.api.post('/api/time-entries/', {
+            'user': self.user.id, 'description': 'open', 'start_time': '2025-07-01T09:00:00Z',
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_bulk_writes_keep_one_running_timer(self):
+        open_entry = {'user': self.user.id, 'description': 'open', 'start_time': '2025-07-01T09:00:00Z'}
+        response = self.api.post('/api/time-entries/bulk/', [open_entry, open_entry], format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(TimeEntry.objects.exists())
+        self.assertEqual(self.api.post('/api/time-entries/bulk/', [open_entry], format='json').status_code, 201)
+        self.assertEqual(self.api.post('/api/time-entries/bulk/', [open_entry], format='json').status_code, 409)
+        stopped = self.entry(utc(2025, 6, 1, 9))
+        response = self.api.patch('/api/time-entries/bulk/', [{'id': stopped.id, 'end_time': None}], format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(TimeEntry.objects.filter(end_time__isnull=True).count(), 1)
+
+    def test_constraint_error_is_a_conflict_without_a_running_timer(self):
+        with mock.patch.object(TimeEntryViewSet, 'bulk_check'):
+            response = self.api.post('/api/time-entries/bulk/', [
+                {'user': self.user.id, 'description': 'open', 'start_time': '2025-07-01T09:00:00Z'},
+            ] * 2, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNone(timers.current(self.user))
+
+    def test_reports_add_live_time_without_caching_it(self):
+        self.entry(utc(2025, 7, 1, 9)).tags.add(self.tag)
+        self.start(project=self.project.id, tags=[self.tag.id], start_time='2025-07-02T09:00:00Z')
+        with mock.patch.object(reports, 'timezone', mock.Mock(now=lambda: utc(2025, 7, 2, 9, 30))):
+            for params in ({'breakdowns': 'tag,week'}, {'start': '2025-07-01T00:00:01Z', 'breakdowns': 'tag,week,hour'}):
+                response = self.api.get('/api/reports/', params)
+                report = response.json()
+                self.assertNotIn('ETag', response)
+                self.assertEqual(report['total_duration'], 3600 + 1800)
+                self.assertEqual(report['total_entries'], 2)
+                self.assertEqual(report['running_since'], '2025-07-02T09:00:00Z')
+                self.assertEqual(report['project_stats'], [{'project__name': 'Site', 'total': 5400}])
+                self.assertEqual(report['daily_stats'][-1], {'date': '2025-07-02', 'total': 1800})
+                self.assertEqual(report['tag_stats'], [{'tag__name': 'billable', 'total': 5400}])
+            self.assertEqual(report['hourly_stats'][9]['total'], 5400)
+        with mock.patch.object(reports, 'timezone', mock.Mock(now=lambda: utc(2025, 7, 2, 10))):
+            self.assertEqual(self.api.get('/api/reports/').json()['total_duration'], 3600 * 2)
+
+
+class AsgiTests(ReportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    async def test_reports_and_calendar_match_wsgi(self):
+        for path, params in (('/api/reports/', {'breakdowns': 'tag,week'}),
+                             ('/api/reports/', {'start': '2025-07-01T08:00:00Z', 'breakdowns': 'tag,hour'}),
+                             ('/api/calendar/', {'month': '2025-07', 'expand': 'project'})):
+            response = await self.async_client.get(path, params, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+            report_cache.get_cache().clear()
+            wsgi = await sync_to_async(self.api.get)(path, params)
+            self.assertEqual(response.json(), wsgi.json())
+        response = await self.async_client.get('/api/reports/', headers={})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_list_endpoints_page_and_stream(self):
+        # The first two entries are read from the archive
+        self.assertEqual(await sync_to_async(archive.archive)(utc(2025, 7, 2)), 2)
+        response = await self.async_client.get('/api/time-entries/', {'page_size': 3}, headers=self.headers)
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertIsNotNone(response.json()['next_cursor'])
+        self.assertEqual(len((await self.async_client.get('/api/tags/', headers=self.headers)).json()), 2)
+        with mock.patch.object(TimeEntryViewSet, 'stream_chunk_size', 2):
+            response = await self.async_client.get('/api/time-entries/', {'stream': 1}, headers=self.headers)
+            body = b''.join([chunk async for chunk in response.streaming_content])
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([row['start_time'] for row in rows], sorted(row['start_time'] for row in rows))
+
+    async def test_writes_still_run_as_sync_views(self):
+        response = await self.async_client.post('/api/tags/', {'user': self.user.id, 'name': 'async'},
+                                                headers=self.headers, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await Tag.objects.filter(name='async').aexists())
+
+
+class LiveEventsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.broker = events.InProcessBroker(queue_size=2)
+        patcher = mock.patch.object(events, '_broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def parse(chunk):
+        lines = dict(line.split(': ', 1) for line in chunk.decode().strip().splitlines())
+        return lines.get('event'), json.loads(lines.get('data', 'null'))
+
+    async def test_stream_pushes_committed_changes(self):
+        response = await self.async_client.get('/api/events/', headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = aiter(response.streaming_content)
+        self.assertEqual(await anext(body), b'retry: 3000\n\n')
+        self.assertEqual(self.broker.connections(self.user.pk), 1)
+
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                tag = Tag.objects.create(user=self.user, name='live')
+            with self.captureOnCommitCallbacks(execute=True):
+                Tag.objects.filter(pk=tag.pk).first().delete()
+            return tag.pk
+        tag_id = await sync_to_async(write)()
+        kind, data = self.parse(await anext(body))
+        self.assertEqual((kind, data['resource'], data['op'], data['ids']), ('change', 'tags', 'upsert', [tag_id]))
+        self.assertIsInstance(sync.decode_token(data['token']), datetime)
+        kind, data = self.parse(await anext(body))
+        self.assertEqual((data['resource'], data['op']), ('tags', 'delete'))
+        await body.aclose()
+        # Like the ASGI handler, drop the response and let the loop finalize its body
+        del body, response
+        gc.collect()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        self.assertEqual(self.broker.connections(), 0)
+
+    async def test_event_source_connects_with_a_stream_token(self):
+        token = (await sync_to_async(self.api.post)('/api/events/token/')).json()['token']
+        response = await self.async_client.get('/api/events/', {'token': token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = aiter(response.streaming_content)
+        self.assertEqual(await anext(body), b'retry: 3000\n\n')
+        self.assertEqual(self.broker.connections(self.user.pk), 1)
+        await body.aclose()
+        del body, response
+        gc.collect()
+        # Only the stream takes these tokens, and only for a short while
+        self.assertEqual((await self.async_client.get('/api/reports/', {'token': token})).status_code, 401)
+        with override_settings(LIVE_EVENTS={'TOKEN_MAX_AGE_SECONDS': -1}):
+            self.assertEqual((await self.async_client.get('/api/events/', {'token': token})).status_code, 401)
+        self.assertEqual((await self.async_client.get('/api/events/', {'token': 'nope'})).status_code, 401)
+
+    async def test_overflow_sends_reset(self):
+        subscription = self.broker.subscribe(self.user.pk)
+        for n in range(4):
+            self.broker.publish(self.user.pk, {'resource': 'tags', 'op': 'upsert', 'ids': [n]})
+        await asyncio.sleep(0)
+        self.assertEqual(await subscription.get(1), {'reset': True})
+        self.assertIsNone(await subscription.get(0.01))
+        self.broker.publish(self.user.pk, {'resource': 'tags', 'op': 'upsert', 'ids': [9]})
+        self.assertEqual((await subscription.get(1))['ids'], [9])
+        self.broker.publish(self.user.pk + 1, {'resource': 'tags', 'op': 'upsert', 'ids': [10]})
+        self.assertIsNone(await subscription.get(0.01))
+
+    def test_bulk_and_related_writes_publish_after_commit(self):
+        with mock.patch.object(self.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.api.post('/api/tags/bulk/', [{'user': self.user.id, 'name': f't{n}'} for n in range(3)], format='json')
+                publish.assert_not_called()
+            self.assertEqual(publish.call_count, 1)
+            user_id, event = publish.call_args.args
+            self.assertEqual((user_id, event['resource'], event['ids']), (self.user.pk, 'tags', sorted(row['id'] for row in response.json())))
+            publish.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.api.put('/api/settings/', {'theme': 'dark'}, format='json')
+            self.assertIn('settings', [call.args[1]['resource'] for call in publish.call_args_list])
+
+    def test_needs_asgi(self):
+        response = self.client.get('/api/events/', headers=self.headers)
+        self.assertEqual(response.status_code, 501)
@@ -0,0 +1,82 @@
+"""Running timers.
+
+A running timer is a TimeEntry without ``end_time``. The partial unique
+index ``api_entry_one_running`` allows one per user, and also serves the
+"current timer" lookup. Stopping computes ``duration`` on the server;
+until then reports add the elapsed time live (see ``reports``).
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import TimeEntry
+
+
+class TimerError(Exception):
+    pass
+
+
+class TimerConflict(TimerError):
+    pass
+
+
+class NoRunningTimer(TimerError):
+    pass
+
+
+def running(user):
+    return TimeEntry.objects.filter(user=user, end_time__isnull=True)
+
+
+def current(user):
+    return running(user).first()
+
+
+def is_conflict(exc):
+    """Whether IntegrityError ``exc`` was raised by the one-running-timer constraint."""
+    # PostgreSQL names the constraint, SQLite the indexed column
+    message = str(exc)
+    return 'api_entry_one_running' in message or 'api_timeentry.user_id' in message
+
+
+def check(user, entries):
+    """Raise TimerConflict unless saving ``entries`` leaves ``user`` one running timer at most."""
+    started = [entry for entry in entries if entry.end_time is None]
+    if len(started) > 1:
+        raise TimerConflict('Only one entry can be running.')
+    if started and running(user).exclude(pk__in=[entry.pk for entry in entries if entry.pk]).exists():
+        raise TimerConflict('A timer is already running.')
+
+
+def start(serializer, user):
+    """Save a validated TimeEntrySerializer as ``user``'s running timer."""
+    try:
+        with transaction.atomic():
+            return serializer.save(user=user, end_time=None, duration=0)
+    except IntegrityError as exc:
+        if not is_conflict(exc):
+            raise
+        raise TimerConflict('A timer is already running.')
+
+
+def stop(user, at=None):
+    """Stop ``user``'s running timer at ``at`` (default now) and return it."""
+    with transaction.atomic():
+        entry = running(user).select_for_update().first()
+        if entry is None:
+            raise NoRunningTimer('No timer is running.')
+        entry.end_time = max(at or timezone.now(), entry.start_time)
+        entry.duration = int((entry.end_time - entry.start_time).total_seconds())
+        entry.save(update_fields=['end_time', 'duration', 'updated_at'])
+    return entry
+
+
+def switch(serializer, user, at):
+    """Stop the running timer, if any, and start ``serializer``'s entry at ``at``.
+
+    Returns ``(stopped entry or None, started entry)``.
+    """
+    with transaction.atomic():
+        try:
+            stopped = stop(user, at)
+        except NoRunningTimer:
+            stopped = None
+        return stopped, start(serializer, user)
@@ -1,9 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    ClientViewSet, ProjectViewSet, TagViewSet, TimeEntryViewSet,
+    ClientViewSet, JobViewSet, ProjectViewSet, TagViewSet, TimeEntryViewSet,
     RegisterView, SettingsView, ReportsView, CalendarView, FirebaseLoginView,
-    CurrentUserView, OpenApiRootView
+    CurrentUserView, OpenApiRootView, ExportView, SyncView, SearchView, EventsView, EventTokenView, MetricsView
 )
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -15,6 +15,7 @@ router.register(r'clients', ClientViewSet, basename='client')
 router.register(r'projects', ProjectViewSet, basename='project')
 router.register(r'tags', TagViewSet, basename='tag')
 router.register(r'time-entries', TimeEntryViewSet, basename='timeentry')
+router.register(r'jobs', JobViewSet, basename='job')
 
 urlpatterns = [
     path('', OpenApiRootView.as_view(), name='api-root'),
@@ -24,7 +25,13 @@ urlpatterns = [
     path('settings/', SettingsView.as_view(), name='settings'),
     path('reports/', ReportsView.as_view(), name='reports'),
     path('calendar/', CalendarView.as_view(), name='calendar'),
+    path('export/entries.<str:fmt>', ExportView.as_view(), name='export_entries'),
     path('auth/firebase-login/', FirebaseLoginView.as_view(), name='firebase_login'),
     path('user/', CurrentUserView.as_view(), name='current_user'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('events/', EventsView.as_view(), name='events'),
+    path('events/token/', EventTokenView.as_view(), name='events_token'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
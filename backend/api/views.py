@@ -1,68 +1,251 @@
+import asyncio
+import heapq
+import logging
 from rest_framework import viewsets, permissions, generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from .models import Client, Project, Tag, TimeEntry, Settings
+from .models import ArchivedTimeEntry, Client, Job, Project, Tag, TimeEntry
 from .serializers import (
-    ClientSerializer, ProjectSerializer, TagSerializer, TimeEntrySerializer,
-    UserSerializer, RegisterSerializer, SettingsSerializer
+    ClientSerializer, JobSerializer, ProjectSerializer, TagSerializer, TimeEntrySerializer,
+    RegisterSerializer, SettingsSerializer, optimize_entry_queryset, parse_expand
 )
 from django.contrib.auth.models import User
-from django.db.models import Sum, Count
-from datetime import datetime
+from datetime import datetime, timedelta
 from rest_framework_simplejwt.tokens import RefreshToken
 import firebase_admin
 from firebase_admin import auth as firebase_auth
-from django.db.models.functions import TruncDate
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
 from django.contrib.auth import get_user_model
 from rest_framework.reverse import reverse
 from . import authentication
+from . import firebase_tokens
+from . import archive, buckets, calendar, db_pool, events, export, jobs, metrics, profile_cache, report_cache, report_jobs, reports, rollups, search, sync, tag_usage, timers
+from .async_views import AsyncAPIView, AsyncListMixin, alist
+from .bulk import BulkModelMixin
+from .fast_serializers import (
+    ClientValuesSerializer, ProjectValuesSerializer, TagValuesSerializer, TimeEntryValuesSerializer
+)
+from .pagination import KeysetPagination
+
+logger = logging.getLogger(__name__)
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = RegisterSerializer
 
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(AsyncListMixin, viewsets.ModelViewSet):
     serializer_class = ClientSerializer
+    values_serializer_class = ClientValuesSerializer
     permission_classes = [IsAuthenticated]
     def get_queryset(self):
         return Client.objects.filter(user=self.request.user)
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(AsyncListMixin, BulkModelMixin, viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
+    values_serializer_class = ProjectValuesSerializer
     permission_classes = [IsAuthenticated]
     def get_queryset(self):
         return Project.objects.filter(user=self.request.user)
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(AsyncListMixin, BulkModelMixin, viewsets.ModelViewSet):
     serializer_class = TagSerializer
+    values_serializer_class = TagValuesSerializer
     permission_classes = [IsAuthenticated]
     def get_queryset(self):
-        return Tag.objects.filter(user=self.request.user)
+        tags = Tag.objects.filter(user=self.request.user)
+        # ?ordering=usage lists the most used tags first, from the api_tag_user_usage index
+        if self.request.query_params.get('ordering') == 'usage':
+            tags = tags.order_by('-usage_count', 'id')
+        return tags
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class TimeEntryViewSet(viewsets.ModelViewSet):
+class TimeEntryViewSet(AsyncListMixin, BulkModelMixin, viewsets.ModelViewSet):
     serializer_class = TimeEntrySerializer
+    values_serializer_class = TimeEntryValuesSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    stream_chunk_size = 500
     def get_queryset(self):
-        return TimeEntry.objects.filter(user=self.request.user)
+        queryset = TimeEntry.objects.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            queryset = optimize_entry_queryset(queryset, self.expand)
+        return queryset
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.expand
+        return context
+    @cached_property
+    def expand(self):
+        # ?expand=project,client,tags embeds compact related objects under "expanded"
+        return parse_expand(self.request.query_params.get('expand'))
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            serializer.save(user=self.request.user)
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+    def handle_exception(self, exc):
+        # A second entry without end_time trips the one-running-timer constraint
+        if isinstance(exc, IntegrityError) and timers.is_conflict(exc):
+            exc = timers.TimerConflict('A timer is already running.')
+        if isinstance(exc, timers.TimerError):
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return super().handle_exception(exc)
+    def timer_serializer(self, request, at):
+        data = request.data.copy()
+        data['user'] = request.user.pk
+        if at or not data.get('start_time'):
+            data['start_time'] = at or timezone.now()
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return serializer
+    @action(detail=False, methods=['get'])
+    def current(self, request):
+        # The running timer, or 204 when none is running
+        entry = timers.current(request.user)
+        if entry is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(self.get_serializer(entry).data)
+    @action(detail=False, methods=['post'])
+    def start(self, request):
+        # Same body as a create; start_time defaults to now, end_time and duration are ignored
+        entry = timers.start(self.timer_serializer(request, None), request.user)
+        return Response(self.get_serializer(entry).data, status=status.HTTP_201_CREATED)
+    @action(detail=False, methods=['post'])
+    def stop(self, request):
+        # duration is computed here, from start_time to now
+        return Response(self.get_serializer(timers.stop(request.user)).data)
+    @action(detail=False, methods=['post'])
+    def switch(self, request):
+        # Stops the running timer (if any) and starts this one at the same instant
+        at = timezone.now()
+        stopped, started = timers.switch(self.timer_serializer(request, at), request.user, at)
+        return Response({
+            'stopped': self.get_serializer(stopped).data if stopped else None,
+            'started': self.get_serializer(started).data,
+        }, status=status.HTTP_201_CREATED)
+    def get_object(self):
+        # An archived entry is read from the archive, and moved back to be changed
+        try:
+            return super().get_object()
+        except Http404:
+            pk = str(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+            if not pk.isdigit():
+                raise
+            entry = None
+            if self.action == 'retrieve':
+                archived = ArchivedTimeEntry.objects.filter(user=self.request.user, pk=pk)
+                entry = optimize_entry_queryset(archived, self.expand).first()
+            elif self.action in ('update', 'partial_update', 'destroy'):
+                entry = archive.restore(self.request.user, pk)
+            if entry is None:
+                raise
+            self.check_object_permissions(self.request, entry)
+            return entry
+    def entry_querysets(self, boundary):
+        # The list is unbounded, so it reaches the archive as soon as the user has one
+        querysets = [self.filter_queryset(self.get_queryset())]
+        if archive.reaches(boundary):
+            archived = ArchivedTimeEntry.objects.filter(user=self.request.user)
+            querysets.append(optimize_entry_queryset(archived, self.expand))
+        return querysets
+    async def alist(self, request, *args, **kwargs):
+        boundary = await archive.aarchived_before(request.user.pk, request)
+        # ?stream=1 streams newline-delimited JSON without building the list in memory
+        if request.query_params.get('stream') in ('1', 'true'):
+            # A WSGI server would buffer an async body, so it gets a sync one
+            is_asgi = isinstance(request._request, ASGIRequest)
+            content = self.astream_entries(boundary) if is_asgi else self.stream_entries(boundary)
+            response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+            response['Cache-Control'] = 'no-cache'
+            return response
+        if not archive.reaches(boundary):
+            return await super().alist(request, *args, **kwargs)
+        # Each table is read (and paged) on its own and the rows merged by (start_time, id)
+        querysets = self.entry_querysets(boundary)
+        context = self.get_serializer_context()
+        values_serializers = [self.values_serializer_class(context, queryset.model) for queryset in querysets]
+        sources = [values_serializer.queryset(queryset) for values_serializer, queryset in zip(values_serializers, querysets)]
+        paginator = self.paginator
+        pages = [paginator.page_queryset(source, request) for source in sources]
+        if pages[0] is None:
+            rows = [await alist(source.order_by('id')) for source in sources]
+            merged = list(heapq.merge(*rows, key=lambda row: row.id))
+        else:
+            rows = [await alist(page) for page in pages]
+            merged = paginator.page_rows(list(heapq.merge(
+                *rows, key=lambda row: (row.start_time, row.id), reverse=paginator.descending,
+            )))
+        ids = {row.id for row in merged}
+        data = {}
+        for values_serializer, source_rows in zip(values_serializers, rows):
+            for item in await values_serializer.aserialize([row for row in source_rows if row.id in ids]):
+                data[item['id']] = item
+        data = [data[row.id] for row in merged]
+        if pages[0] is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+    def stream_entries(self, boundary=None):
+        querysets = [queryset.order_by('start_time', 'id') for queryset in self.entry_querysets(boundary)]
+        entries = heapq.merge(
+            *(queryset.iterator(chunk_size=self.stream_chunk_size) for queryset in querysets),
+            key=lambda entry: (entry.start_time, entry.id),
+        )
+        encoder = JSONEncoder()
+        for entry in entries:
+            yield encoder.encode(self.get_serializer(entry).data) + '\n'
+    async def astream_entries(self, boundary=None):
+        # aiterator() can't prefetch tags, so walk (start_time, id) in keyset chunks of every table
+        querysets = [queryset.order_by('start_time', 'id') for queryset in self.entry_querysets(boundary)]
+        encoder = JSONEncoder()
+        last = None
+        while True:
+            chunk = []
+            for queryset in querysets:
+                if last is not None:
+                    queryset = queryset.filter(
+                        Q(start_time__gt=last.start_time) | Q(start_time=last.start_time, id__gt=last.id)
+                    )
+                chunk += await alist(queryset[:self.stream_chunk_size])
+            chunk = sorted(chunk, key=lambda entry: (entry.start_time, entry.id))[:self.stream_chunk_size]
+            for entry in chunk:
+                yield encoder.encode(self.get_serializer(entry).data) + '\n'
+            if len(chunk) < self.stream_chunk_size:
+                return
+            last = chunk[-1]
+    def bulk_check(self, request, instances):
+        # Checked up front so a batch with two running entries is a 409, not a constraint error
+        timers.check(request.user, instances)
+    def bulk_changed(self, request, before, after):
+        changes = [(entry, [tag.pk for tag in relations.get('tags', ())], -1) for entry, relations in before]
+        changes += [(entry, [tag.pk for tag in relations.get('tags', ())], 1) for entry, relations in after]
+        rollups.apply_entries(changes)
+        tag_usage.apply(tag_usage.relation_deltas(before, after))
+        entries = [entry for entry, relations in before + after]
+        report_cache.invalidate(request.user.pk, report_cache.entry_dependencies(*entries))
 
 class SettingsView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        settings, created = Settings.objects.get_or_create(user=request.user)
-        serializer = SettingsSerializer(settings)
-        return Response(serializer.data)
+        # Served from api.profile_cache; rows are created with the user
+        return Response(profile_cache.get_settings(request.user.pk, request))
     def put(self, request):
-        settings, created = Settings.objects.get_or_create(user=request.user)
+        settings = profile_cache.load_settings(request.user.pk)
         serializer = SettingsSerializer(settings, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -70,133 +253,199 @@ class SettingsView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     def post(self, request):
         # For compatibility, treat POST as update or create
-        settings, created = Settings.objects.get_or_create(user=request.user)
+        settings = profile_cache.load_settings(request.user.pk)
         serializer = SettingsSerializer(settings, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class ReportsView(APIView):
+class ReportsView(AsyncAPIView):
     permission_classes = [IsAuthenticated]
-    def get(self, request):
-        # Filters: date range, project, client, tag
-        entries = TimeEntry.objects.filter(user=request.user)
-        start = request.GET.get('start')
-        end = request.GET.get('end')
-        project = request.GET.get('project')
-        client = request.GET.get('client')
-        tag = request.GET.get('tag')
-        if start:
-            entries = entries.filter(start_time__gte=start)
-        if end:
-            entries = entries.filter(end_time__lte=end)
-        if project:
-            entries = entries.filter(project_id=project)
-        if client:
-            entries = entries.filter(client_id=client)
-        if tag:
-            entries = entries.filter(tags__id=tag)
-        total_duration = entries.aggregate(Sum('duration'))['duration__sum'] or 0
-        total_entries = entries.count()
-        project_stats = entries.values('project__name').annotate(total=Sum('duration'))
-        client_stats = entries.values('client__name').annotate(total=Sum('duration'))
-        daily_stats = entries.annotate(date=TruncDate('start_time')).values('date').annotate(total=Sum('duration')).order_by('date')
-        return Response({
-            'total_duration': total_duration,
-            'total_entries': total_entries,
-            'project_stats': list(project_stats),
-            'client_stats': list(client_stats),
-            'daily_stats': list(daily_stats),
-        })
-    def post(self, request):
+    filters = ('start', 'end', 'project', 'client', 'tag', 'breakdowns')
+    async def get(self, request):
+        # Filters: date range, project, client, tag; ?breakdowns=tag,week,month,hour adds extra stats
+        return await self.cached_report(request, request.GET)
+    async def post(self, request):
         # Allow POST for report queries (same as GET, but with body)
-        data = request.data
-        entries = TimeEntry.objects.filter(user=request.user)
-        start = data.get('start')
-        end = data.get('end')
-        project = data.get('project')
-        client = data.get('client')
-        tag = data.get('tag')
-        if start:
-            entries = entries.filter(start_time__gte=start)
-        if end:
-            entries = entries.filter(end_time__lte=end)
-        if project:
-            entries = entries.filter(project_id=project)
-        if client:
-            entries = entries.filter(client_id=client)
-        if tag:
-            entries = entries.filter(tags__id=tag)
-        total_duration = entries.aggregate(Sum('duration'))['duration__sum'] or 0
-        total_entries = entries.count()
-        project_stats = entries.values('project__name').annotate(total=Sum('duration'))
-        client_stats = entries.values('client__name').annotate(total=Sum('duration'))
-        daily_stats = entries.annotate(date=TruncDate('start_time')).values('date').annotate(total=Sum('duration')).order_by('date')
-        return Response({
-            'total_duration': total_duration,
-            'total_entries': total_entries,
-            'project_stats': list(project_stats),
-            'client_stats': list(client_stats),
-            'daily_stats': list(daily_stats),
-        })
+        return await self.cached_report(request, request.data)
+    async def cached_report(self, request, params):
+        # ?async=1 or Prefer: respond-async queues the report as a job; see api.report_jobs
+        respond_async = str(params.get('async', '')).lower() in ('1', 'true') or 'respond-async' in request.headers.get('Prefer', '')
+        params = report_cache.normalize_params(params, self.filters)
+        # Dates are local midnights and days are local days, in the user's timezone
+        tz = await buckets.auser_timezone(request.user.pk, request)
+        try:
+            start = buckets.parse_bound(params.get('start'), tz)
+            end = buckets.parse_bound(params.get('end'), tz)
+            buckets.check_range(start, end)
+        except buckets.InvalidBound as e:
+            return Response({'error': str(e)}, status=400)
+        rollups_ready = await rollups.aready(request.user.pk, request)
+        if respond_async or not report_jobs.runs_inline(params, start, end, tz, rollups_ready):
+            job = await jobs.aenqueue('report', request.user, {'params': params})
+            response = Response(JobSerializer(job).data, status=202)
+            response['Location'] = reverse('job-detail', args=[job.pk], request=request)
+            return response
+        params['timezone'] = tz.key
+        deps = report_cache.range_dependencies(start, end)
+        boundary = await archive.aarchived_before(request.user.pk, request)
+        # The cached payload leaves out a running timer's elapsed time; it is added per response
+        return await report_cache.acached_response(
+            request, 'reports', params, deps, lambda: report_jobs.abuild(request.user, params, start, end, tz, boundary, rollups_ready),
+            live=reports.with_live_time,
+        )
 
-class CalendarView(APIView):
+class CalendarView(AsyncAPIView):
     permission_classes = [IsAuthenticated]
-    def get(self, request):
-        # Expects ?month=YYYY-MM
-        month = request.GET.get('month')
-        if not month:
-            return Response({'error': 'month param required'}, status=400)
-        year, month_num = map(int, month.split('-'))
-        entries = TimeEntry.objects.filter(
-            user=request.user,
-            start_time__year=year,
-            start_time__month=month_num
-        )
-        projects = Project.objects.filter(
-            user=request.user,
-            due_date__year=year,
-            due_date__month=month_num
+    async def get(self, request):
+        # ?month=YYYY-MM or ?start=YYYY-MM-DD&end=YYYY-MM-DD, in the user's timezone; ?compact=1 for day buckets
+        return await self.cached_calendar(request, request.GET)
+    async def post(self, request):
+        # Allow POST for calendar queries (same as GET, but with body)
+        return await self.cached_calendar(request, request.data)
+    async def cached_calendar(self, request, params):
+        tz = await buckets.auser_timezone(request.user.pk, request)
+        try:
+            first, last = calendar.parse_range(params)
+            lower, upper = calendar.bounds(first, last, tz)
+        except calendar.CalendarError as e:
+            return Response({'error': str(e)}, status=400)
+        expand = parse_expand(params.get('expand'))
+        compact = str(params.get('compact', '')).lower() in ('1', 'true')
+        deps = report_cache.range_dependencies(lower, upper - timedelta(microseconds=1))
+        params = {
+            'start': first.isoformat(), 'end': last.isoformat(), 'timezone': tz.key,
+            'expand': ','.join(expand), 'compact': compact,
+        }
+        models = archive.entry_models(await archive.aarchived_before(request.user.pk, request), lower)
+        return await report_cache.acached_response(
+            request, 'calendar', params, deps,
+            lambda: self.build_calendar(request.user, first, last, tz, expand, compact, models)
         )
+    async def build_calendar(self, user, first, last, tz, expand=(), compact=False, models=(TimeEntry,)):
+        sources = [calendar.entries(user, first, last, tz, model) for model in models]
+        projects = alist(calendar.due_projects(user, first, last))
+        payload = {'start': first.isoformat(), 'end': last.isoformat(), 'timezone': tz.key}
+        if compact:
+            *rows, projects = await asyncio.gather(*(alist(calendar.day_rows(entries, tz)) for entries in sources), projects)
+            payload['days'] = calendar.buckets(row for part in rows for row in part)
+        else:
+            *found, projects = await asyncio.gather(*(alist(optimize_entry_queryset(entries, expand)) for entries in sources), projects)
+            entries = [entry for part in found for entry in part]
+            if len(found) > 1:
+                entries.sort(key=lambda entry: (entry.start_time, entry.id))
+            payload['entries'] = TimeEntrySerializer(entries, many=True, context={'expand': expand}).data
+        payload['projects'] = ProjectSerializer(projects, many=True).data
+        return payload
+
+class ExportView(APIView):
+    permission_classes = [IsAuthenticated]
+    def get(self, request, fmt):
+        # /export/entries.<csv|jsonl|parquet>?start=...&end=... filters on start_time
+        try:
+            boundary = archive.archived_before(request.user.pk, request)
+            entries = export.export_querysets(request.user, request.GET.get('start'), request.GET.get('end'), boundary)
+            content = export.stream(fmt, export.iter_rows(entries))
+        except export.ExportError as e:
+            return Response({'error': str(e)}, status=400)
+        response = StreamingHttpResponse(content, content_type=export.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="time-entries.{fmt}"'
+        return response
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user).order_by('-created_at', '-id')
+    @action(detail=True)
+    def result(self, request, pk=None):
+        # The job's result once done; 202 with its status while it is queued or running
+        job = self.get_object()
+        if job.status == jobs.DONE:
+            return Response(job.result)
+        if job.status == jobs.FAILED:
+            return Response({'error': job.error}, status=500)
+        response = Response(JobSerializer(job).data, status=202)
+        response['Retry-After'] = str(max(1, round(jobs.get_config()['POLL_SECONDS'])))
+        return response
+
+class SyncView(APIView):
+    permission_classes = [IsAuthenticated]
+    def get(self, request):
+        # ?since=<token from the previous response>; omit for a full snapshot
+        try:
+            return Response(sync.changes(request.user, request.GET.get('since')))
+        except sync.InvalidToken as e:
+            return Response({'error': str(e)}, status=400)
+
+class SearchView(APIView):
+    permission_classes = [IsAuthenticated]
+    def get(self, request):
+        # ?q=words (each matched as a prefix); ?type=time_entries,projects,clients; ?page_size=, ?cursor=
+        params = request.GET
+        try:
+            hits, next_cursor = search.search(
+                request.user, params.get('q'), params.get('type'), params.get('cursor'), params.get('page_size'),
+            )
+        except search.SearchUnavailable as e:
+            return Response({'error': str(e)}, status=501)
+        except search.SearchError as e:
+            return Response({'error': str(e)}, status=400)
+        next_link = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor) if next_cursor else None
         return Response({
-            'entries': TimeEntrySerializer(entries, many=True).data,
-            'projects': ProjectSerializer(projects, many=True).data,
+            'next': next_link,
+            'next_cursor': next_cursor,
+            'results': search.results(request.user, hits),
         })
+
+class EventTokenView(APIView):
+    permission_classes = [IsAuthenticated]
     def post(self, request):
-        # Allow POST for calendar queries (same as GET, but with body)
-        month = request.data.get('month')
-        if not month:
-            return Response({'error': 'month param required'}, status=400)
-        year, month_num = map(int, month.split('-'))
-        entries = TimeEntry.objects.filter(
-            user=request.user,
-            start_time__year=year,
-            start_time__month=month_num
-        )
-        projects = Project.objects.filter(
-            user=request.user,
-            due_date__year=year,
-            due_date__month=month_num
-        )
+        # A short-lived ?token= for /api/events/, as EventSource can't send an Authorization header
         return Response({
-            'entries': TimeEntrySerializer(entries, many=True).data,
-            'projects': ProjectSerializer(projects, many=True).data,
+            'token': events.make_token(request.user.pk),
+            'expires_in': events.get_config()['TOKEN_MAX_AGE_SECONDS'],
         })
 
+class EventsView(AsyncAPIView):
+    authentication_classes = [*APIView.authentication_classes, authentication.EventStreamTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    async def get(self, request):
+        # Server-sent change events (see api.events); a stream holds no thread, so only ASGI serves it
+        if not isinstance(request._request, ASGIRequest):
+            return Response({'error': 'Live updates are only served by the ASGI application.'}, status=501)
+        config = events.get_config()
+        limit = config['MAX_CONNECTIONS_PER_USER']
+        if limit and events.get_broker().connections(request.user.pk) >= limit:
+            return Response({'error': f'At most {limit} live connections per user.'}, status=429)
+        content = events.stream(request.user.pk, config['HEARTBEAT_SECONDS'], config['MAX_AGE_SECONDS'])
+        response = StreamingHttpResponse(content, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class MetricsView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    def get(self, request):
+        # Prometheus scrape target; only answers requests with PERF_METRICS['TOKEN']
+        if not metrics.scrape_allowed(request):
+            return Response({'detail': 'Not found.'}, status=404)
+        body = metrics.registry.render() + db_pool.render()
+        return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class FirebaseLoginView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
         id_token = request.data.get('id_token')
-        print("[FirebaseLoginView] Received id_token:", id_token)
         if not id_token:
-            print("[FirebaseLoginView] No ID token provided in request.data:", request.data)
-            return Response({'detail': 'No ID token provided.', 'debug': str(request.data)}, status=400)
+            logger.info("Firebase login without an ID token")
+            return Response({'detail': 'No ID token provided.'}, status=400)
         try:
-            from firebase_admin import auth as firebase_auth
-            decoded_token = firebase_auth.verify_id_token(id_token)
-            print("[FirebaseLoginView] Decoded token:", decoded_token)
+            decoded_token = firebase_tokens.verify_id_token(id_token)
             uid = decoded_token['uid']
             email = decoded_token.get('email', '')
             User = get_user_model()
@@ -205,7 +454,7 @@ class FirebaseLoginView(APIView):
                 user.email = email
                 user.save()
             refresh = RefreshToken.for_user(user)
-            print("[FirebaseLoginView] Login success for user:", user.username)
+            logger.info("Firebase login for user %s", user.username)
             return Response({
                 'token': str(refresh.access_token),
                 'refresh': str(refresh),
@@ -216,7 +465,7 @@ class FirebaseLoginView(APIView):
                 'created': created,
             })
         except Exception as e:
-            print("[FirebaseLoginView] Token verification failed:", str(e))
+            logger.warning("Firebase token verification failed: %s", e)
             return Response({'detail': f'Token verification failed: {str(e)}'}, status=400)
     def get(self, request):
         return Response({'detail': 'GET not supported for login.'}, status=405)
@@ -225,8 +474,7 @@ class CurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
-        return Response(serializer.data)
+        return Response(profile_cache.get_profile(request.user, request))
 
 class OpenApiRootView(APIView):
     permission_classes = [AllowAny]
@@ -241,4 +489,7 @@ class OpenApiRootView(APIView):
             'reports': reverse('reports', request=request, format=format),
             'calendar': reverse('calendar', request=request, format=format),
             'user': reverse('current_user', request=request, format=format),
+            'sync': reverse('sync', request=request, format=format),
+            'search': reverse('search', request=request, format=format),
+            'jobs': reverse('job-list', request=request, format=format),
         })
\ No newline at end of file
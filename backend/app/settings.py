@@ -57,6 +57,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.PerformanceMiddleware',
+    'api.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -94,9 +96,26 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # JSON by default; clients opt into the others per request, see api.renderers
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.renderers.ColumnarJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+    ),
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'api.renderers.ContentNegotiation',
+}
+
+# Response compression by Accept-Encoding (brotli if installed, gzip); see api.compression
+COMPRESSION = {
+    'ENABLED': os.getenv('COMPRESSION_ENABLED', 'True').lower() == 'true',
+    'MIN_SIZE': int(os.getenv('COMPRESSION_MIN_SIZE', '512')),
+    'GZIP_LEVEL': int(os.getenv('COMPRESSION_GZIP_LEVEL', '6')),
+    'BROTLI_QUALITY': int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5')),
 }
 
-WSGI_APPLICATION = 'backend.app.wsgi.application'
+WSGI_APPLICATION = 'app.wsgi.application'
+ASGI_APPLICATION = 'app.asgi.application'
 
 
 # Database
@@ -155,3 +174,91 @@ MEDIA_ROOT = os.path.join(BASE_DIR, os.getenv('MEDIA_ROOT', 'media'))
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Keyset pagination for /api/time-entries/ (opt-in with ?page_size= or ?cursor=)
+TIME_ENTRY_PAGE_SIZE = int(os.getenv('TIME_ENTRY_PAGE_SIZE', '100'))
+TIME_ENTRY_MAX_PAGE_SIZE = int(os.getenv('TIME_ENTRY_MAX_PAGE_SIZE', '1000'))
+
+# Firebase ID tokens are verified locally; defaults to the project_id in firebase-adminsdk.json
+FIREBASE_PROJECT_ID = os.getenv('FIREBASE_PROJECT_ID')
+
+# Report/calendar payload cache: 'locmem' (in-process LRU) or 'django' (uses CACHES[ALIAS]).
+# locmem is only correct with a single worker process; see api.report_cache.
+# Invalidation stamps have their own LRU (MAX_STAMPS) or cache (STAMP_ALIAS, default ALIAS)
+REPORT_CACHE = {
+    'BACKEND': os.getenv('REPORT_CACHE_BACKEND', 'locmem'),
+    'ALIAS': os.getenv('REPORT_CACHE_ALIAS', 'default'),
+    'STAMP_ALIAS': os.getenv('REPORT_CACHE_STAMP_ALIAS'),
+    'MAX_ENTRIES': int(os.getenv('REPORT_CACHE_MAX_ENTRIES', '2048')),
+    'MAX_STAMPS': int(os.getenv('REPORT_CACHE_MAX_STAMPS', '65536')),
+    'TIMEOUT': int(os.getenv('REPORT_CACHE_TIMEOUT', '300')),
+}
+
+# /api/sync/ tokens older than this get a full snapshot; see manage.py prune_tombstones
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv('SYNC_TOMBSTONE_RETENTION_DAYS', '30'))
+
+# Per-process connection pool used by the api.db_backends.* engines; see api.db_pool
+DATABASE_POOL = {
+    'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+    'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    'MAX_IDLE_SECONDS': float(os.getenv('DB_POOL_MAX_IDLE_SECONDS', '300')),
+    'MAX_LIFETIME_SECONDS': float(os.getenv('DB_POOL_MAX_LIFETIME_SECONDS', '3600')),
+    # Idle connections older than this are pinged before reuse
+    'CHECK_AFTER_IDLE_SECONDS': float(os.getenv('DB_POOL_CHECK_AFTER_IDLE_SECONDS', '30')),
+}
+
+# Finished entries older than the horizon move to a compact archive table; see api.archive
+# and manage.py archive_entries
+ARCHIVE = {
+    'HORIZON_DAYS': int(os.getenv('ARCHIVE_HORIZON_DAYS', '730')),
+    'BATCH_SIZE': int(os.getenv('ARCHIVE_BATCH_SIZE', '2000')),
+}
+
+# Full-text search at /api/search/; see api.search and manage.py rebuild_search_index
+SEARCH = {
+    'PAGE_SIZE': int(os.getenv('SEARCH_PAGE_SIZE', '20')),
+    'MAX_PAGE_SIZE': int(os.getenv('SEARCH_MAX_PAGE_SIZE', '100')),
+    # PostgreSQL text search configuration, e.g. 'english' for stemming
+    'LANGUAGE': os.getenv('SEARCH_LANGUAGE', 'simple'),
+}
+
+# Background jobs run by manage.py run_jobs; see api.jobs
+JOBS = {
+    'PROCESSES': int(os.getenv('JOBS_PROCESSES', '2')),
+    'POLL_SECONDS': float(os.getenv('JOBS_POLL_SECONDS', '1')),
+    'MAX_ATTEMPTS': int(os.getenv('JOBS_MAX_ATTEMPTS', '3')),
+    'KEEP_DAYS': int(os.getenv('JOBS_KEEP_DAYS', '7')),
+    # Reports the rollup can't answer and spanning more days than this are queued as jobs
+    'REPORT_INLINE_MAX_DAYS': int(os.environ['JOBS_REPORT_INLINE_MAX_DAYS']) if os.getenv('JOBS_REPORT_INLINE_MAX_DAYS') else None,
+}
+
+# Outgoing mail (weekly reports); the test runner swaps in Django's locmem backend
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False').lower() == 'true'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+
+# Live change events at /api/events/ (server-sent events, ASGI only); see api.events
+LIVE_EVENTS = {
+    # 'inprocess', or the dotted path of a shared broker class for multi-worker deployments
+    'BACKEND': os.getenv('LIVE_EVENTS_BACKEND', 'inprocess'),
+    'QUEUE_SIZE': int(os.getenv('LIVE_EVENTS_QUEUE_SIZE', '256')),
+    'HEARTBEAT_SECONDS': float(os.getenv('LIVE_EVENTS_HEARTBEAT_SECONDS', '15')),
+    'MAX_CONNECTIONS_PER_USER': int(os.getenv('LIVE_EVENTS_MAX_CONNECTIONS_PER_USER', '20')),
+    'MAX_AGE_SECONDS': float(os.getenv('LIVE_EVENTS_MAX_AGE_SECONDS', '300')),
+}
+
+# Per-request timing: Server-Timing headers, api.perf log lines and /api/metrics/ (Prometheus)
+PERF_METRICS = {
+    'ENABLED': os.getenv('PERF_METRICS_ENABLED', 'True').lower() == 'true',
+    'SERVER_TIMING': os.getenv('PERF_SERVER_TIMING', 'True').lower() == 'true',
+    'LOG_REQUESTS': os.getenv('PERF_LOG_REQUESTS', 'True').lower() == 'true',
+    # Queries slower than this are logged to api.perf.slow_query; unset disables the log
+    'SLOW_QUERY_MS': float(os.environ['PERF_SLOW_QUERY_MS']) if os.getenv('PERF_SLOW_QUERY_MS') else None,
+    'SLOW_QUERY_STACK_SAMPLE_RATE': float(os.getenv('PERF_SLOW_QUERY_STACK_SAMPLE_RATE', '0.1')),
+    # /api/metrics/ requires 'Authorization: Bearer <token>'; unset disables it
+    'TOKEN': os.getenv('PERF_METRICS_TOKEN') or None,
+}
@@ -33,17 +33,35 @@ STATICFILES_DIRS = [
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Database (use PostgreSQL in production)
+# DB_POOL=true hands connections back to a per-process pool after every
+# request (sized by DATABASE_POOL); use it for ASGI workers, whose requests
+# don't share threads. Otherwise each thread keeps its connection for
+# DB_CONN_MAX_AGE seconds, checked before reuse.
+DB_POOL = os.environ.get('DB_POOL', 'False').lower() == 'true'
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'api.db_backends.postgresql' if DB_POOL else 'django.db.backends.postgresql',
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# A cache shared by every worker. The report cache's invalidation stamps and
+# the cached Settings payloads are only correct when all workers see the same
+# ones, so the in-process default is not used here.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://localhost:6379/1'),
+    }
+}
+REPORT_CACHE = {**REPORT_CACHE, 'BACKEND': 'django', 'ALIAS': 'default'}
+
 # REST Framework settings for production
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -67,6 +85,11 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': os.path.join(BASE_DIR, 'logs', 'django.log'),
         },
+        'perf': {
+            'level': 'INFO',
+            'class': 'logging.FileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'perf.log'),
+        },
     },
     'loggers': {
         'django': {
@@ -74,5 +97,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        # One JSON line per request, plus api.perf.slow_query when enabled
+        'api.perf': {
+            'handlers': ['perf'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 } 
\ No newline at end of file
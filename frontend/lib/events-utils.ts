@@ -0,0 +1,57 @@
+import api from "./api"
+
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL || "http://localhost:8000/api";
+
+export interface ChangeEvent {
+  resource: "clients" | "projects" | "tags" | "time_entries" | "settings"
+  op: "upsert" | "delete"
+  ids: string[]
+  // A /sync/ token from before the change; syncChanges(token) returns the changed rows
+  token: string
+}
+
+export interface ChangeHandlers {
+  onChange: (event: ChangeEvent) => void
+  // Events may have been missed: resync from the last token
+  onReset: () => void
+}
+
+// EventSource can't send the Authorization header, so each connection uses a
+// short-lived token from /events/token/. When the server ends the stream the
+// token has expired, so reconnect with a new one rather than letting EventSource retry.
+export function subscribeToChanges(handlers: ChangeHandlers, retryMs = 3000): () => void {
+  let source: EventSource | null = null
+  let timer: ReturnType<typeof setTimeout> | null = null
+  let closed = false
+
+  const connect = async () => {
+    let token: string
+    try {
+      const res = await api.post(`/events/token/`)
+      token = res.data.token
+    } catch {
+      if (!closed) timer = setTimeout(connect, retryMs)
+      return
+    }
+    if (closed) return
+    const stream = new EventSource(`${API_BASE_URL}/events/?token=${encodeURIComponent(token)}`)
+    source = stream
+    stream.addEventListener("change", (e) => handlers.onChange(JSON.parse((e as MessageEvent).data)))
+    stream.addEventListener("reset", () => handlers.onReset())
+    stream.onerror = () => {
+      stream.close()
+      source = null
+      if (closed) return
+      // Changes made while disconnected only reach us through a resync
+      handlers.onReset()
+      timer = setTimeout(connect, retryMs)
+    }
+  }
+
+  connect()
+  return () => {
+    closed = true
+    if (timer) clearTimeout(timer)
+    source?.close()
+  }
+}
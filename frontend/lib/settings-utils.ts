@@ -16,6 +16,8 @@ export interface Settings {
   time_format: string
   date_format: string
   theme: string
+  // True while the server rebuilds report totals after a timezone change
+  rollups_pending?: boolean
 }
 
 export async function getSettings(): Promise<Settings> {
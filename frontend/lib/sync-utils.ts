@@ -0,0 +1,28 @@
+import api from "./api"
+import { Client } from "./client-utils"
+import { Project } from "./project-utils"
+import { Tag } from "./tag-utils"
+import { TimeEntry } from "./time-entry-utils"
+
+export interface SyncResponse {
+  token: string
+  // When true the lists are a full snapshot and local state should be replaced
+  reset: boolean
+  clients: Client[]
+  projects: Project[]
+  tags: Tag[]
+  time_entries: TimeEntry[]
+  settings: Record<string, unknown> | null
+  deleted: {
+    clients: string[]
+    projects: string[]
+    tags: string[]
+    time_entries: string[]
+  }
+}
+
+// Pass the token from the previous response to receive only what changed since then
+export async function syncChanges(since?: string | null): Promise<SyncResponse> {
+  const res = await api.get(`/sync/`, { params: since ? { since } : {} })
+  return res.data
+}
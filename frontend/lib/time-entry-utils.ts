@@ -12,6 +12,12 @@ export interface TimeEntry {
   end_time?: string | null
   duration: number
   created_at: string
+  // Present when requested with ?expand=project,client,tags
+  expanded?: {
+    project?: { id: string; name: string; color: string } | null
+    client?: { id: string; name: string } | null
+    tags?: { id: string; name: string; color: string }[]
+  }
 }
 
 export async function getTimeEntries(): Promise<TimeEntry[]> {
@@ -19,6 +25,22 @@ export async function getTimeEntries(): Promise<TimeEntry[]> {
   return res.data
 }
 
+export interface TimeEntryPage {
+  next: string | null
+  next_cursor: string | null
+  results: TimeEntry[]
+}
+
+export async function getTimeEntriesPage(
+  options: { cursor?: string | null; pageSize?: number; newestFirst?: boolean } = {}
+): Promise<TimeEntryPage> {
+  const params: Record<string, string | number> = { page_size: options.pageSize ?? 100 }
+  if (options.cursor) params.cursor = options.cursor
+  else if (options.newestFirst) params.ordering = "-start_time"
+  const res = await api.get(`/time-entries/`, { params })
+  return res.data
+}
+
 export async function getTimeEntryById(id: string): Promise<TimeEntry> {
   const res = await api.get(`/time-entries/${id}/`)
   return res.data